@@ -0,0 +1,248 @@
+# This code is part of the Master Thesis of Jean van der Meer presented to the Eindhoven University of Technology
+# Segmented point clouds read straight from zip and tar archives. The datasets come as a compressed Data.zip of about 700 MB (see
+# dataForTests/info.txt) that had to be unpacked to about 1.8 GB before the tool could read it. Here a path can go into an archive as if
+# the archive were a folder, e.g. Data.zip/haus30/walls/wall1.txt, and the folders and files given to batchUpdater.py (and the scan of
+# Room Mode, which can also be a glob of several members read as one scan) can be an archive, a folder inside it or a glob of its members:
+#
+#   python -m batchUpdater model.ifc --walls Data.zip/haus30/walls --columns "Data.zip/haus30/columns/*.txt" --scan Data.zip/haus30/room.xyz
+#
+# The members are streamed from the archive into the parsers, nothing is extracted to disk, and the segmented files are read in threads
+# next to each other (the decompression and the parser of pandas release the GIL). Zip archives are read member by member, every thread
+# with a handle of its own. A compressed tar archive can only be read from its start, so it is read in one pass and its members are
+# parsed in the threads as they come out of it.
+
+import fnmatch
+import glob
+import hashlib
+import io
+import os
+import tarfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+# the members a folder in an archive stands for, as for a folder on disk (see segmented_files in batchUpdater.py)
+SEGMENTED_EXTENSIONS = ('.txt', '.xyz', '.qpc')
+DEFAULT_READERS = min(8, os.cpu_count() or 1)
+
+
+def is_archive(path):
+    return path.lower().endswith(ARCHIVE_EXTENSIONS) and os.path.isfile(path)
+
+
+def split_archive_path(path):
+    # (archive, member) of a path into an archive, e.g. ('Data.zip', 'haus30/walls/wall1.txt'), with member '' for the archive itself.
+    # None for a path that does not go through an archive
+    if os.path.exists(path):
+        return (path, '') if is_archive(path) else None
+    head, member = path.rstrip('/\\'), []
+    while True:
+        head, tail = os.path.split(head)
+        if not tail:
+            return None
+        member.insert(0, tail)
+        if is_archive(head):
+            return head, '/'.join(member)
+
+
+def member_name(name):
+    # the name of a member without the ./ in front that tar gives the members of e.g. tar czf data.tgz ./haus30
+    while name.startswith('./'):
+        name = name[2:]
+    return name
+
+
+@lru_cache(maxsize=16)
+def _member_names(archive, mtime_ns):
+    if archive.lower().endswith('.zip'):
+        with zipfile.ZipFile(archive) as zip_file:
+            return tuple(info.filename for info in zip_file.infolist() if not info.is_dir())
+    return tuple(_tar_members(archive, mtime_ns))
+
+
+@lru_cache(maxsize=16)
+def _tar_members(archive, mtime_ns):
+    # {name without ./: (name in the archive, size)} of the files in a tar archive
+    with tarfile.open(archive) as tar:
+        return {member_name(member.name): (member.name, member.size) for member in tar.getmembers() if member.isfile()}
+
+
+def tar_members(archive):
+    # _tar_members of the archive, listing a compressed tar archive means reading all of it, so it is kept until the archive changes
+    return _tar_members(os.path.abspath(archive), os.stat(archive).st_mtime_ns)
+
+
+def tar_member(archive, name):
+    # the name in the tar archive of the member name (as member_names gives it), name itself when the archive has no such member
+    return tar_members(archive).get(name, (name, None))[0]
+
+
+def is_tar_member(split):
+    # whether split_archive_path gave a member of a tar archive
+    return split is not None and bool(split[1]) and not split[0].lower().endswith('.zip')
+
+
+def member_names(archive):
+    # names of the files in the archive, listing a compressed tar archive means reading all of it, so the list is kept until it changes
+    return _member_names(os.path.abspath(archive), os.stat(archive).st_mtime_ns)
+
+
+def archive_files(path):
+    # the segmented files a path into an archive stands for: the member itself, the members matching a glob (where * also matches the /
+    # between folders), or the .txt and .xyz files directly in a folder of the archive or at its root
+    archive, pattern = split_archive_path(path)
+    names = member_names(archive)
+    if any(character in pattern for character in '*?['):
+        matched = [name for name in names if fnmatch.fnmatchcase(name, pattern)]
+    elif pattern in names:
+        matched = [pattern]
+    else:
+        folder = pattern + '/' if pattern else ''
+        matched = [name for name in names if name.startswith(folder) and '/' not in name[len(folder):] and
+                   name.lower().endswith(SEGMENTED_EXTENSIONS)]
+    return [os.path.join(archive, *name.split('/')) for name in sorted(matched)]
+
+
+def scan_files(path):
+    # the point clouds the scan of Room Mode stands for: the file or member itself, or the members of an archive (or the files on disk)
+    # matching a glob, e.g. Data.zip/haus30/*.xyz, which are read as one scan
+    if not any(character in path for character in '*?['):
+        return [path]
+    files = archive_files(path) if split_archive_path(path) is not None else sorted(glob.glob(path))
+    if not files:
+        raise FileNotFoundError(f'No point clouds found at {path}')
+    return files
+
+
+@contextmanager
+def open_binary(path):
+    # a file on disk or a member of an archive opened for reading in binary mode, a member is decompressed while it is read
+    split = split_archive_path(path)
+    if split is None:
+        with open(path, 'rb') as f:
+            yield f
+        return
+    archive, member = split
+    if archive.lower().endswith('.zip'):
+        with zipfile.ZipFile(archive) as zip_file:
+            try:
+                f = zip_file.open(member)
+            except KeyError:
+                raise FileNotFoundError(f'No {member} in {archive}') from None
+            with f:
+                yield f
+        return
+    with tarfile.open(archive) as tar:
+        try:
+            f = tar.extractfile(tar_member(archive, member))
+        except KeyError:
+            f = None
+        if f is None:
+            raise FileNotFoundError(f'No {member} in {archive}')
+        with f:
+            yield f
+
+
+@contextmanager
+def open_text(path):
+    with open_binary(path) as f:
+        yield io.TextIOWrapper(f, encoding='utf-8', errors='replace')
+
+
+def source_stat(path):
+    # (size, modification time in ns) to tell whether a file changed, for a member the size of the member and the time of the archive
+    split = split_archive_path(path)
+    if split is None or not split[1]:
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+    archive, member = split
+    if archive.lower().endswith('.zip'):
+        with zipfile.ZipFile(archive) as zip_file:
+            size = zip_file.getinfo(member).file_size
+    else:
+        # from the listing of the archive, which is only made again when the archive changed
+        if member not in tar_members(archive):
+            raise FileNotFoundError(f'No {member} in {archive}')
+        size = tar_members(archive)[member][1]
+    return size, os.stat(archive).st_mtime_ns
+
+
+def stream_hash(f, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: f.read(chunk_size), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_hash(path):
+    # sha256 of the contents of a file or of a member of an archive, as file_hash in conversionCache.py
+    with open_binary(path) as f:
+        return stream_hash(f)
+
+
+def source_hashes(paths):
+    # {path: source_hash(path)} of files on disk and members of archives. Opening a member of a compressed tar archive means
+    # decompressing the archive up to it, so the members of a tar archive are hashed in one pass over it, as in read_segmented_tables
+    hashes = {}
+    tar_paths = {}
+    for path in paths:
+        split = split_archive_path(path)
+        if is_tar_member(split):
+            tar_paths.setdefault(split[0], {})[split[1]] = path
+        else:
+            hashes[path] = source_hash(path)
+    for archive, members in tar_paths.items():
+        with tarfile.open(archive, 'r|*') as tar:
+            for member in tar:
+                name = member_name(member.name)
+                if member.isfile() and name in members:
+                    hashes[members.pop(name)] = stream_hash(tar.extractfile(member))
+                    if not members:
+                        break
+        if members:
+            raise FileNotFoundError(f'No {sorted(members)[0]} in {archive}')
+    return hashes
+
+
+def read_table(source, name=''):
+    # a segmented point cloud, one point per line as x y z r g b, into a DataFrame with the columns X, Y and Z, the colours are not used
+    # and not kept, which halves the memory of the table. name is the name of the file, a .qpc file is read as a quantized point cloud
+    # (see quantizedCloud.py)
+    import pandas as pd
+    from quantizedCloud import QuantizedCloud, is_quantized
+    if is_quantized(name):
+        return QuantizedCloud(source).table()
+    return pd.read_csv(source, sep=' ', header=None, names=['X', 'Y', 'Z'], usecols=[0, 1, 2])
+
+
+def read_file_table(path):
+    from quantizedCloud import QuantizedCloud, is_quantized
+    if is_quantized(path):
+        return QuantizedCloud(path).table()
+    with open_binary(path) as f:
+        return read_table(f)
+
+
+def read_segmented_tables(files, workers=DEFAULT_READERS):
+    # {file: DataFrame of read_table} of files on disk and members of archives, read in up to workers threads, in the order of files
+    futures = {}
+    tar_members = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for file in files:
+            split = split_archive_path(file)
+            if is_tar_member(split):
+                tar_members.setdefault(split[0], {})[split[1]] = file
+            else:
+                futures[file] = executor.submit(read_file_table, file)
+        for archive, members in tar_members.items():
+            # one pass over the archive, every member that is asked for is parsed in a thread while the next one is decompressed
+            with tarfile.open(archive, 'r|*') as tar:
+                for member in tar:
+                    name = member_name(member.name)
+                    if name in members:
+                        futures[members.pop(name)] = executor.submit(read_table, io.BytesIO(tar.extractfile(member).read()), name)
+            if members:
+                raise FileNotFoundError(f'No {sorted(members)[0]} in {archive}')
+        return {file: futures[file].result() for file in files}
@@ -0,0 +1,133 @@
+# This code is part of the Master Thesis of Jean van der Meer presented to the Eindhoven University of Technology
+# Background jobs for the interface. Opening an IFC file, reading point clouds, matching walls and writing the updated model used to run
+# in the menu callbacks, on the same thread as the viewer, which froze the OpenCascade window for minutes on big buildings. Here a job
+# is a list of stages that run one after the other on a worker thread. Between stages the job reports its progress and checks whether it
+# was cancelled, and when the last stage finished the result is handed back to the thread of the interface through a Qt signal, so only
+# then the viewer is changed. Cancelling is cooperative: a stage that already started runs until its end, the stages after it are skipped.
+
+import threading
+import time
+import traceback
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class BackgroundJob:
+    # stages is a list of (description, function) tuples, every function receives the same state dictionary, where stages leave their
+    # results for the stages after them. The state is also the result of the job
+    def __init__(self, name, stages, state=None):
+        self.name = name
+        self.stages = list(stages)
+        self.state = state if state is not None else {}
+        self.cancel_event = threading.Event()
+        self.thread = None
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def run(self, on_progress=None):
+        total = len(self.stages)
+        for index, (description, stage) in enumerate(self.stages):
+            if self.cancelled:
+                raise JobCancelled(f'{self.name} was cancelled before: {description}')
+            if on_progress is not None:
+                on_progress(index, total, description)
+            start = time.perf_counter()
+            stage(self.state)
+            print(f'{self.name}: {description} took {time.perf_counter() - start:.2f} s')
+        if on_progress is not None:
+            on_progress(total, total, 'Done')
+        return self.state
+
+
+_bridge_class = None
+
+
+def qt_bridge():
+    # QObject whose signals carry the progress and the outcome of a job from the worker thread to the thread of the interface. The class
+    # is only made when it is first needed, so modules that run jobs without Qt (e.g. from the command line) do not import PyQt5
+    global _bridge_class
+    if _bridge_class is None:
+        from PyQt5.QtCore import QObject, pyqtSignal
+
+        class JobBridge(QObject):
+            progress = pyqtSignal(object, int, int, str)
+            finished = pyqtSignal(object, object)
+            failed = pyqtSignal(object, object, str)
+
+        _bridge_class = JobBridge
+    return _bridge_class()
+
+
+class JobRunner:
+    # Runs one job at a time on a worker thread. With use_qt the callbacks are called on the thread the runner was created on (the thread
+    # of the interface), otherwise they are called directly from the worker thread
+    def __init__(self, use_qt=True):
+        self.job = None
+        self.callbacks = {}
+        self.bridge = None
+        if use_qt:
+            self.bridge = qt_bridge()
+            self.bridge.progress.connect(self._on_progress)
+            self.bridge.finished.connect(self._on_finished)
+            self.bridge.failed.connect(self._on_failed)
+
+    def busy(self):
+        return self.job is not None and self.job.thread is not None and self.job.thread.is_alive()
+
+    def start(self, job, on_done=None, on_error=None, on_progress=None):
+        # returns False, without starting the job, if another job is still running
+        if self.busy():
+            return False
+        self.job = job
+        self.callbacks[id(job)] = (on_done, on_error, on_progress)
+        job.thread = threading.Thread(target=self._work, args=(job,), name=job.name, daemon=True)
+        job.thread.start()
+        return True
+
+    def wait(self, timeout=None):
+        if self.job is not None and self.job.thread is not None:
+            self.job.thread.join(timeout)
+
+    def _work(self, job):
+        def progress(index, total, description):
+            if self.bridge is not None:
+                self.bridge.progress.emit(job, index, total, description)
+            else:
+                self._on_progress(job, index, total, description)
+        try:
+            result = job.run(on_progress=progress)
+        except BaseException as e:
+            details = traceback.format_exc()
+            if self.bridge is not None:
+                self.bridge.failed.emit(job, e, details)
+            else:
+                self._on_failed(job, e, details)
+            return
+        if self.bridge is not None:
+            self.bridge.finished.emit(job, result)
+        else:
+            self._on_finished(job, result)
+
+    def _on_progress(self, job, index, total, description):
+        on_progress = self.callbacks.get(id(job), (None, None, None))[2]
+        if on_progress is not None:
+            on_progress(index, total, description)
+
+    def _on_finished(self, job, result):
+        on_done = self.callbacks.pop(id(job), (None, None, None))[0]
+        if on_done is not None:
+            on_done(result)
+
+    def _on_failed(self, job, error, details):
+        on_error = self.callbacks.pop(id(job), (None, None, None))[1]
+        if on_error is not None:
+            on_error(error, details)
+        else:
+            print(details)
@@ -0,0 +1,213 @@
+# This code is part of the Master Thesis of Jean van der Meer presented to the Eindhoven University of Technology
+# Nightly update of many buildings. batchUpdater.py updates one building per run, so a night of buildings was still started and watched
+# one by one. Here a manifest lists the jobs, one per building, and every job runs the same update as batchUpdater.py (run_update, which
+# calls the functions of the menus of the interface) in a worker process of its own, several at a time. A job that fails, or whose
+# worker dies, is tried again up to the given number of retries, and a job can be limited to an amount of memory, so one building that
+# does not fit stops with an error instead of pushing the other jobs out of memory (the limit is on the address space of the worker and
+# is only available on Linux and macOS). The output of every job goes to a folder of its own, with the console output of the worker in
+# log.txt, and the result of all jobs is written to batch_summary.json in the output folder.
+#
+#   python -m batchQueue nightly.json --workers 4 --memory-mb 16000
+#
+# with nightly.json for example
+#   {"output": "nightly_output",
+#    "defaults": {"report_formats": [".jsonl", ".csv"], "retries": 1},
+#    "jobs": [{"name": "haus30", "ifc": "haus30.ifc", "walls": "haus30/walls", "scan": "haus30/room.xyz", "columns": "haus30/columns"},
+#             {"name": "office", "ifc": "office.ifc", "ceilings": "office/ceilings", "types": ["ceilings"]}]}
+#
+# The keys of a job are those of updateDaemon.py, together with name, types (the element types to update, by default all those given),
+# retries and memory_mb. Paths in the manifest are relative to the manifest, changeset and incremental paths relative to the folder of
+# the job, so a job that runs every night with "incremental": "run_manifest.json" only redoes what changed since the night before.
+
+import argparse
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import sys
+import time
+import traceback
+from collections import deque
+
+DEFAULT_WORKERS = max(1, min(4, os.cpu_count() or 1))
+DEFAULT_RETRIES = 1
+
+DONE = 'done'
+FAILED = 'failed'
+
+# keys of a job used by the queue itself, the other keys are those of a job of updateDaemon.py
+QUEUE_KEYS = ('name', 'types', 'retries', 'memory_mb')
+ELEMENT_TYPES = ('walls', 'columns', 'ceilings')
+
+
+def load_manifest(manifest_path, output_dir=None):
+    # (output folder, jobs) of a manifest, with the defaults applied, the paths made absolute and a unique name for every job
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    output_dir = os.path.abspath(output_dir or os.path.join(base, manifest.get('output') or
+                                                            f'{os.path.splitext(os.path.basename(manifest_path))[0]}_output'))
+
+    def absolute(path):
+        return path if path is None else os.path.join(base, path)
+
+    jobs, names = [], set()
+    for number, job in enumerate(manifest.get('jobs', []), start=1):
+        job = {**manifest.get('defaults', {}), **job}
+        name = job.get('name') or os.path.splitext(os.path.basename(job.get('ifc') or f'job{number}'))[0]
+        if name in names:
+            name = f'{name}_{number}'
+        names.add(name)
+        job['name'] = name
+        job['ifc'] = absolute(job.get('ifc'))
+        job['scan'] = absolute(job.get('scan'))
+        for kind in ELEMENT_TYPES:
+            paths = job.get(kind)
+            job[kind] = [absolute(path) for path in ([paths] if isinstance(paths, str) else paths or [])]
+        jobs.append(job)
+    return output_dir, jobs
+
+
+def prepare_job(job, job_dir):
+    # the job of updateDaemon.py to run, checked before it is queued so a job that cannot run is not retried
+    from updateDaemon import parse_job
+    types = job.get('types') or ELEMENT_TYPES
+    unknown = set(types) - set(ELEMENT_TYPES)
+    if unknown:
+        raise ValueError(f'Unknown element types: {sorted(unknown)}')
+    update = {key: value for key, value in job.items() if key not in QUEUE_KEYS}
+    for kind in ELEMENT_TYPES:
+        update[kind] = update.get(kind) if kind in types else None
+    for key in ('changeset', 'incremental'):
+        if update.get(key):
+            update[key] = os.path.join(job_dir, update[key])
+    update['output'] = os.path.join(job_dir, update.get('output') or f"{os.path.splitext(os.path.basename(job['ifc'] or ''))[0]}_updated.ifc")
+    return parse_job(update)
+
+
+def limit_memory(memory_mb):
+    try:
+        import resource
+    except ImportError:
+        print('Memory limits are not available on this platform, the job runs without one.')
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = int(memory_mb * 1024 * 1024)
+    resource.setrlimit(resource.RLIMIT_AS, (limit if hard == resource.RLIM_INFINITY else min(limit, hard), hard))
+
+
+def run_attempt(job, log_path, memory_mb, connection):
+    # runs in the worker process, the result is sent back over the connection as a dictionary
+    with open(log_path, 'a', buffering=1) as log:
+        sys.stdout = sys.stderr = log
+        print(f"--- {job['ifc']} started {time.strftime('%Y-%m-%d %H:%M:%S')}")
+        try:
+            if memory_mb:
+                limit_memory(memory_mb)
+            from updateDaemon import run_parsed_job
+            result = {'status': DONE, **run_parsed_job(job)[1]}
+        except MemoryError:
+            traceback.print_exc()
+            result = {'status': FAILED, 'error': f'Out of memory (limit {memory_mb} MB)'}
+        except BaseException as e:
+            traceback.print_exc()
+            # the full error is in the log, the last line of it is enough for the summary
+            lines = str(e).strip().splitlines()
+            result = {'status': FAILED, 'error': f"{type(e).__name__}: {lines[-1] if lines else ''}"}
+        print(f"--- {result['status']} {time.strftime('%Y-%m-%d %H:%M:%S')}")
+        connection.send(result)
+        connection.close()
+
+
+class BatchQueue:
+    # Runs the jobs of a manifest (see load_manifest) in up to workers processes at a time. retries and memory_mb are the defaults of
+    # the jobs that do not set their own
+    def __init__(self, jobs, output_dir, workers=DEFAULT_WORKERS, retries=DEFAULT_RETRIES, memory_mb=None):
+        self.jobs = jobs
+        self.output_dir = output_dir
+        self.workers = max(1, workers)
+        self.retries = retries
+        self.memory_mb = memory_mb
+        self.results = {}
+
+    def run(self):
+        # runs every job and returns {name: result}, the results are also written to batch_summary.json
+        context = multiprocessing.get_context('spawn')
+        start = time.perf_counter()
+        pending = deque()
+        for job in self.jobs:
+            job_dir = os.path.join(self.output_dir, job['name'])
+            os.makedirs(job_dir, exist_ok=True)
+            try:
+                pending.append((job, prepare_job(job, job_dir), 1))
+            except (ValueError, OSError) as e:
+                self.finish(job, {'status': FAILED, 'error': str(e)}, 0, 0.0)
+        running = []
+        while pending or running:
+            while pending and len(running) < self.workers:
+                job, update, attempt = pending.popleft()
+                receiver, sender = context.Pipe(duplex=False)
+                memory_mb = job.get('memory_mb', self.memory_mb)
+                process = context.Process(target=run_attempt, name=f"batch-{job['name']}",
+                                          args=(update, os.path.join(self.output_dir, job['name'], 'log.txt'), memory_mb, sender))
+                process.start()
+                sender.close()
+                print(f"Started {job['name']} (attempt {attempt})")
+                running.append({'job': job, 'update': update, 'attempt': attempt, 'process': process, 'receiver': receiver,
+                                'result': None, 'start': time.perf_counter()})
+            multiprocessing.connection.wait([r['receiver'] for r in running if r['result'] is None] + [r['process'].sentinel for r in running])
+            for run in list(running):
+                if run['result'] is None and run['receiver'].poll():
+                    try:
+                        run['result'] = run['receiver'].recv()
+                    except EOFError:
+                        run['result'] = {}
+                if run['process'].is_alive():
+                    continue
+                run['process'].join()
+                running.remove(run)
+                result = run['result'] or {'status': FAILED, 'error': f"The worker stopped with exit code {run['process'].exitcode}"}
+                job, attempt = run['job'], run['attempt']
+                if result['status'] == FAILED and attempt <= job.get('retries', self.retries):
+                    print(f"{job['name']} failed ({result['error']}), trying again")
+                    pending.append((job, run['update'], attempt + 1))
+                else:
+                    self.finish(job, result, attempt, time.perf_counter() - run['start'])
+        self.write_summary(time.perf_counter() - start)
+        return self.results
+
+    def finish(self, job, result, attempts, seconds):
+        self.results[job['name']] = {**result, 'ifc': job['ifc'], 'attempts': attempts, 'seconds': round(seconds, 1),
+                                     'log': os.path.join(self.output_dir, job['name'], 'log.txt')}
+        print(f"{job['name']}: {result['status']}" + (f" ({result['error']})" if result['status'] == FAILED else ''))
+
+    def write_summary(self, seconds):
+        summary_path = os.path.join(self.output_dir, 'batch_summary.json')
+        done = sum(result['status'] == DONE for result in self.results.values())
+        with open(summary_path, 'w') as f:
+            json.dump({'jobs': len(self.results), 'done': done, 'failed': len(self.results) - done, 'seconds': round(seconds, 1),
+                       'results': self.results}, f, indent=2)
+        print(f"{done} of {len(self.results)} jobs done in {seconds:.0f} s, summary written: {summary_path}")
+        return summary_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='batchQueue', description='Run the update of many IFC files listed in a manifest.')
+    parser.add_argument('manifest', help='JSON manifest of the jobs')
+    parser.add_argument('-o', '--output', help='output folder (default: the output of the manifest, or <manifest>_output)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='jobs run at the same time (default: %(default)s)')
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES, help='times a failed job is tried again (default: %(default)s)')
+    parser.add_argument('--memory-mb', type=float, help='memory limit of every job in MB (default: no limit)')
+    args = parser.parse_args(argv)
+
+    try:
+        output_dir, jobs = load_manifest(args.manifest, args.output)
+    except (OSError, ValueError) as e:
+        print(f'batchQueue: {e}', file=sys.stderr)
+        return 1
+    results = BatchQueue(jobs, output_dir, args.workers, args.retries, args.memory_mb).run()
+    return 0 if all(result['status'] == DONE for result in results.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
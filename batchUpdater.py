@@ -0,0 +1,129 @@
+# This code is part of the Master Thesis of Jean van der Meer presented to the Eindhoven University of Technology
+# Command line version of the update of walls, columns and ceilings, without the OpenCascade viewer and without Qt. The interface builds its
+# display when it is imported and takes every input from file dialogs, so it cannot run unattended, e.g. on a server or for a batch of
+# buildings. Here the same functions the menus call run one after the other on one model: walls first (Room Mode when the point cloud of
+# the scanned area is given), then columns, which are checked against the updated walls, and then ceilings (see updatePipeline.py). The
+# updated IFC file is written once to the given path, together with the Excel report of the walls and the match report of every element
+# (see matchReport.py).
+#
+# Example:
+#   python -m batchUpdater model.ifc --walls scans/walls --columns scans/columns --ceilings scans/ceilings --scan scans/room.xyz -o updated.ifc
+#
+# The segmented elements can be given as folders (every .txt, .xyz and .qpc file in them, see quantizedCloud.py) or as files. Unlike the interface, the files are not
+# renamed to wall1, wall2, etc, the names of the files are used as the names of the point cloud elements in the reports. Folders, files
+# and the scan can also be in zip and tar archives, e.g. Data.zip/haus30/walls, which are read without unpacking them (see archiveReader.py).
+
+import argparse
+import glob
+import os
+import sys
+
+import ifcopenshell
+
+from updatePipeline import DEFAULT_ALPHA, DEFAULT_BUFFER_SIZE
+
+
+def segmented_files(paths):
+    # files of segmented elements from a list of folders and files, sorted so runs are repeatable. A path into an archive gives the
+    # members it stands for (see archive_files in archiveReader.py)
+    from archiveReader import archive_files, split_archive_path
+    files = []
+    for path in paths or []:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, '*.txt')) + glob.glob(os.path.join(path, '*.xyz')) + glob.glob(os.path.join(path, '*.qpc'))))
+        elif split_archive_path(path):
+            members = archive_files(path)
+            if not members:
+                raise FileNotFoundError(f'No segmented point clouds found at {path}')
+            files.extend(members)
+        elif os.path.isfile(path):
+            files.append(path)
+        else:
+            raise FileNotFoundError(f'No segmented point clouds found at {path}')
+    return files
+
+
+def report_paths(output_path, report_formats):
+    # match report files and Excel report of the walls written next to the updated IFC file
+    stem = os.path.splitext(output_path)[0]
+    return [f'{stem}_match_report{extension}' for extension in report_formats], f'{stem}_walls.xlsx'
+
+
+def run_update(ifc_file_path, output_path, wall_files=None, column_files=None, ceiling_files=None, scan_file=None, alpha=DEFAULT_ALPHA,
+               buffer_size=DEFAULT_BUFFER_SIZE, report_files=None, wall_report_files=None, checkpoint_dir=None,
+               compression=None, changeset_path=None, model=None, keep_changes=True, by_storey=False, workers=None,
+               tile_size=None, manifest_path=None):
+    # Update the model with the given segmented elements in memory (see updatePipeline.py) and write it once to output_path, if it is
+    # given, and the changes as a changeset to changeset_path, if it is given. Returns the state of the run, with the summary of the
+    # match report under 'summary'. model can be given when the IFC file was already opened (see updateDaemon.py), with keep_changes=False
+    # it is then rolled back to how it was after the files are written, and state['model'] is the model to use afterwards. With by_storey
+    # the walls and columns are matched storey by storey in up to workers processes (see storeyPartition.py), with tile_size the hull and
+    # the walls of Room Mode are made and matched in tiles of that size (see tiledRoomMode.py). With manifest_path only the files that
+    # changed since the last run with that manifest are read and matched again (see incrementalRun.py)
+    from matchReport import MatchReport
+    from updatePipeline import UpdatePipeline
+    model = model if model is not None else ifcopenshell.open(ifc_file_path)
+    with MatchReport(report_files) as report:
+        pipeline = UpdatePipeline(model, report=report, by_storey=by_storey, workers=workers, tile_size=tile_size,
+                                  manifest_path=manifest_path)
+        if wall_files:
+            pipeline.add_walls(wall_files, scan_file=scan_file, wall_report_files=wall_report_files, alpha=alpha, buffer_size=buffer_size)
+        if column_files:
+            pipeline.add_columns(column_files)
+        if ceiling_files:
+            pipeline.add_ceilings(ceiling_files)
+        state = pipeline.run(output_path, checkpoint_dir=checkpoint_dir, compression=compression, changeset_path=changeset_path,
+                             keep_changes=keep_changes)
+        state['summary'] = report.summary()
+    return state
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='batchUpdater', description='Update the walls, columns and ceilings of an IFC file with segmented point clouds.')
+    parser.add_argument('ifc', help='IFC file to update')
+    parser.add_argument('-o', '--output', help='path of the updated IFC file (default: <ifc>_updated.ifc)')
+    parser.add_argument('--walls', nargs='+', help='folders or files of segmented walls')
+    parser.add_argument('--columns', nargs='+', help='folders or files of segmented columns')
+    parser.add_argument('--ceilings', nargs='+', help='folders or files of segmented ceilings')
+    parser.add_argument('--scan', help='point cloud of the scanned area, walls are updated in Room Mode when given. A glob of files or archive members, e.g. "Data.zip/haus30/*.xyz", is read as one scan')
+    parser.add_argument('--alpha', type=float, default=DEFAULT_ALPHA, help='alpha of the concave hull of the scanned area (default: %(default)s)')
+    parser.add_argument('--buffer-size', type=float, default=DEFAULT_BUFFER_SIZE,
+                        help='buffer around the hull of the scanned area in model units (default: %(default)s)')
+    parser.add_argument('--by-storey', action='store_true', help='match the columns, and the walls outside Room Mode (--scan) and incremental runs (--incremental), of every '
+                        'storey on their own, in parallel')
+    parser.add_argument('--tile-size', type=float, help='make the hull and match the walls of Room Mode in tiles of this size, for large scans')
+    parser.add_argument('--workers', type=int, help='worker processes for --by-storey and --tile-size (default: one per CPU)')
+    parser.add_argument('--incremental', metavar='MANIFEST',
+                        help='only read and match again what changed since the last run with this manifest, which is created when missing')
+    parser.add_argument('--report-formats', nargs='+', default=['.jsonl'],
+                        help='extensions of the match report: .jsonl, .csv, .xlsx or .parquet (default: %(default)s)')
+    parser.add_argument('--checkpoints', metavar='FOLDER', help='also write the model to this folder after each element type')
+    parser.add_argument('--compress', choices=['gzip', 'zip'], help='write the IFC files as .ifc.gz or .ifczip')
+    parser.add_argument('--changeset', metavar='PATH', help='also write the changes as a changeset (.json or .json.gz, see ifcChangeset.py)')
+    parser.add_argument('--changeset-only', action='store_true', help='only write the changeset, not the updated IFC file')
+    args = parser.parse_args(argv)
+
+    if not (args.walls or args.columns or args.ceilings):
+        parser.error('give at least one of --walls, --columns or --ceilings')
+    if args.changeset_only and not args.changeset:
+        parser.error('--changeset-only needs --changeset')
+    output_path = args.output or f'{os.path.splitext(args.ifc)[0]}_updated.ifc'
+    report_files, wall_report_file = report_paths(output_path, args.report_formats)
+    try:
+        state = run_update(args.ifc, None if args.changeset_only else output_path, wall_files=segmented_files(args.walls),
+                           column_files=segmented_files(args.columns), ceiling_files=segmented_files(args.ceilings), scan_file=args.scan, alpha=args.alpha, buffer_size=args.buffer_size,
+                           report_files=report_files, wall_report_files=wall_report_file, checkpoint_dir=args.checkpoints, compression=args.compress,
+                           changeset_path=args.changeset, by_storey=args.by_storey, workers=args.workers,
+                           tile_size=args.tile_size, manifest_path=args.incremental)
+    except (FileNotFoundError, OSError) as e:
+        print(f'batchUpdater: {e}', file=sys.stderr)
+        return 1
+    if not args.changeset_only:
+        print(f'Updated IFC file: {state["written"][-1].file_path}')
+    for kind, actions in state['summary'].items():
+        print(f"  {kind}: " + ', '.join(f'{count} {action}' for action, count in sorted(actions.items())))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,18 +2,18 @@
 
 
 import numpy as np
-import pandas as pd
 import os
 import ifcopenshell
+from matchReport import CEILING, UPDATED
 
 # Function to process segmented ceilings from point cloud data and extract the necessary geometry data
 def process_seg_ceilings(files2):
     # the input of the function are the several point cloud files, each one with one segmented ceiling
-    data_dict = {}
+    # the files can also be members of zip and tar archives (see archiveReader.py)
+    from archiveReader import read_segmented_tables
     ceiling_dict = {}
 
-    for file in files2:
-        data_dict[file] = pd.read_csv(file, sep=' ', header=None, names=['X', 'Y', 'Z', 'R', 'G', 'B'])
+    data_dict = read_segmented_tables(files2)
     
     for file, data in data_dict.items():
         # each line is divided into x, y and z values, so each one is stored in this initial data_dict for each ceiling
@@ -55,7 +55,8 @@ def process_seg_ceilings(files2):
     return ceiling_dict
 
 # Function to check and update ceilings in the IFC model
-def check_and_update_ceilings(model, pc_ceilings):
+def check_and_update_ceilings(model, pc_ceilings, report=None, write_file=True):
+    # report is an optional MatchReport (see matchReport.py) where every ceiling that got its elevation updated is recorded
     for pc_name, pc_data in pc_ceilings.items():
         z_avg = pc_data['z_avg']
         nine_points = pc_data['nine_points']
@@ -106,6 +107,8 @@ def check_and_update_ceilings(model, pc_ceilings):
                     ceiling.Representation.Representations[0].Items[0].Position.Location.Coordinates = (float(ceiling.Representation.Representations[0].Items[0].Position.Location.Coordinates[0]), float(ceiling.Representation.Representations[0].Items[0].Position.Location.Coordinates[1]), float(new_ceiling_z))
                     # ceiling.Representation.Representations[0].Items[0].Position.Location.Coordinates[2] = new_ceiling_z' -> this does not work, an entire tuple of coordinates needs to be assigned
                     print('rectangular celiling updated')
+                    if report is not None:
+                        report.add(CEILING, ceiling.GlobalId, pc_name, UPDATED, deltas=(0.0, 0.0, new_ceiling_z - ceiling_z), detail='IfcRectangleProfileDef')
 
 
             # now is the script for when a ceiling is defined by a polyline
@@ -145,12 +148,18 @@ def check_and_update_ceilings(model, pc_ceilings):
                     ceiling.Representation.Representations[0].Items[0].Position.Location.Coordinates = (float(ceiling.Representation.Representations[0].Items[0].Position.Location.Coordinates[0]), float(ceiling.Representation.Representations[0].Items[0].Position.Location.Coordinates[1]), float(new_ceiling_z))
                     
                     print('polygonal ceiling updated')
-    # Save the modified IFC file with the date and time of the changes
+                    if report is not None:
+                        report.add(CEILING, ceiling.GlobalId, pc_name, UPDATED, deltas=(0.0, 0.0, new_ceiling_z - ceiling_z), detail='IfcArbitraryClosedProfileDef')
+    # Save the modified IFC file with the date and time of the changes, unless the model is written later together with other updates
+    if not write_file:
+        return None
     from datetime import datetime
 
     current_datetime = datetime.now()
     formatted_datetime = current_datetime.strftime("%d%m%y_%H%M")
     new_filename = f"modified_ifc_file_{formatted_datetime}.ifc"
-    model.write(new_filename)
+    # written in the background, new_filename is the handle of the pending file (see ifcWriter.py)
+    from ifcWriter import write_in_background
+    new_filename = write_in_background(model, new_filename)
 
     return new_filename
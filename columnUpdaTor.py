@@ -1,16 +1,16 @@
 # This code is part of the Master Thesis of Jean van der Meer presented to the Eindhoven University of Technology
 import ifcopenshell
 import numpy as np
-import pandas as pd
 import os
+from matchReport import COLUMN, MATCHED, UPDATED, CREATED, DELETED, NOT_CHECKED
 
 def process_seg_columns(files2):
+    from archiveReader import read_segmented_tables
     # the segmented point clouds of columns are loaded and geometric information is extracted from them, assuming a manhattan world scenario with orthogonal planes
     column_dict = {}
 
-    for file in files2:
-        # Load the point cloud data
-        data = pd.read_csv(file, sep=' ', header=None, names=['X', 'Y', 'Z', 'R', 'G', 'B'])
+    # Load the point cloud data, from files or from members of zip and tar archives
+    for file, data in read_segmented_tables(files2).items():
 
         # Extract X, Y, Z coordinates
         x = data['X'].values
@@ -101,196 +101,297 @@ def extrPoints(wall):
     
     return None
 
-def check_and_update_columns(model, pc_columns):
-    import ifcopenshell.api
+# The columns are first read from the model into plain records (column_records and wall_records), then plan_columns decides what happens
+# to every column without touching the model, and apply_column_plan makes those changes. The plan only works on tuples and dictionaries,
+# so it can also run for every storey in a worker process of its own (see storeyPartition.py), and the changes are then made to the
+# model on the main thread.
+
+# distance from the walls and difference in height at which a column counts as embedded in a wall
+EMBEDDED_XY_TOLERANCE = 0.35
+EMBEDDED_Z_TOLERANCE = 0.25
+# thresholds for matching IFC columns embedded in walls, and not embedded in walls, to point cloud columns
+EMBEDDED_MATCH_DISTANCE = 1.1
+FREE_MATCH_DISTANCE = 1.2
+# difference between the elevation of a floor and the base of a point cloud column for a column of that floor to be copied
+NEW_COLUMN_ELEVATION_TOLERANCE = 0.4
+
+
+def column_position(column):
+    # Some columns depending on how they are modeled have their location at column.Representation.Representations[0].Items[0].MappingSource.MappedRepresentation.Items[0].Position.Location.Coordinates
+    # instead of at column.ObjectPlacement.RelativePlacement.Location.Coordinates, where it usually is, so we need to check for both cases
+    # When the column's location is at column.ObjectPlacement.RelativePlacement.Location.Coordinates, the other location, column.Representation.Representations[0].Items[0].MappingSource.MappedRepresentation.Items[0].Position.Location.Coordinates
+    # is always set as (0.0, 0.0, 0.0), so we can use that as a test to know where the location is stored. The other scenario, where the location is stored at
+    # the mapping source usually happens when every column in the file, or many of them, have their own column type and all geometric infornmation is then
+    # stored at the column type instead of the column instance, even when many columns have the same profile. This can happen depending on how columns are
+    # modeled in a BIM authoring tool
+    # Returns the (x, y, z) of the column and whether it is stored at the mapping source
+    mapped_location = column.Representation.Representations[0].Items[0].MappingSource.MappedRepresentation.Items[0].Position.Location
+    if mapped_location.Coordinates == (0.0, 0.0, 0.0):
+        return tuple(column.ObjectPlacement.RelativePlacement.Location.Coordinates), False
+    return tuple(mapped_location.Coordinates), True
+
+
+def set_column_position(column, coordinates, mapped):
+    # the new location goes to the place where the column keeps its location, as other data of its geometrical representation are also
+    # in that "location" (either the ObjectPlacement or the MappingSource via a column type)
+    if mapped:
+        column.Representation.Representations[0].Items[0].MappingSource.MappedRepresentation.Items[0].Position.Location.Coordinates = coordinates
+    else:
+        column.ObjectPlacement.RelativePlacement.Location.Coordinates = coordinates
+
+
+def column_records(columns):
+    # plain records of IFC columns, with the elevation of the floor they are on
+    records = []
+    for column in columns:
+        position, mapped = column_position(column)
+        records.append({'guid': column.GlobalId, 'position': position, 'mapped': mapped,
+                        'elevation': column.ContainedInStructure[0].RelatingStructure.Elevation})
+    return records
+
+
+def wall_records(walls):
+    # (start point, end point) of the IFC walls
+    records = []
+    for wall in walls:
+        points = extrPoints(wall)
+        if points and points[0] and points[1]:
+            records.append(points)
+    return records
+
+
+def embedded_columns(positions, walls):
+    # for every column position, whether the column is within the range of a wall, horizontal or vertical. Some thresholds are used for
+    # the x and y values that the center of a column can be from the wall to be considered embedded in that wall, and some tolerance is
+    # also given for the z value of the base of the wall and column. The footprints of the walls, grown by those thresholds, are put in an
+    # STRtree once, so every column is only compared with the walls whose footprint it is in
+    import shapely
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+    embedded = np.zeros(len(positions), dtype=bool)
+    if not len(positions) or not walls:
+        return embedded
+    ends = np.array([(start_point[0], start_point[1], end_point[0], end_point[1], start_point[2]) for start_point, end_point in walls],
+                    dtype=np.float64)
+    low = np.minimum(ends[:, 0:2], ends[:, 2:4]) - EMBEDDED_XY_TOLERANCE
+    high = np.maximum(ends[:, 0:2], ends[:, 2:4]) + EMBEDDED_XY_TOLERANCE
+    tree = shapely.STRtree(shapely.box(low[:, 0], low[:, 1], high[:, 0], high[:, 1]))
+    # intersects includes the border of a footprint, as the <= of the thresholds
+    column_index, wall_index = tree.query(shapely.points(positions[:, :2]), predicate='intersects')
+    close = np.abs(positions[column_index, 2] - ends[wall_index, 4]) <= EMBEDDED_Z_TOLERANCE
+    embedded[column_index[close]] = True
+    return embedded
+
+
+def column_distance(position, cg, elevation):
+    # distance between an IFC column and a point cloud column, the elevation of the floor an IFC column is in is reduced from the
+    # elevation of the point cloud column it is being compared to, to see if their position is comparable
+    column_x, column_y, column_z = position
+    cg_x, cg_y, cg_z = cg
+    cg_z_transformed = cg_z - elevation
+    return np.sqrt((column_x - cg_x)**2 + (column_y - cg_y)**2 + (column_z - cg_z_transformed)**2)
+
+
+class ColumnGrid:
+    # IFC columns in cubes of cell_size by their global position (the elevation of their floor added to their z), to find the columns
+    # that can be within cell_size of a point without comparing it with every column. Columns can be moved, as they are when they are
+    # updated to the position of a point cloud column
+    def __init__(self, cell_size):
+        # a little larger, so rounding in the global position never puts a column within the distance outside the cubes around a point
+        self.cell_size = cell_size * (1 + 1e-9)
+        self.cells = {}
+        self.cell_of = {}
+
+    def cell(self, point):
+        return tuple(int(np.floor(value / self.cell_size)) for value in point)
+
+    def add(self, index, point):
+        self.cell_of[index] = self.cell(point)
+        self.cells.setdefault(self.cell_of[index], set()).add(index)
+
+    def move(self, index, point):
+        self.cells[self.cell_of.pop(index)].discard(index)
+        self.add(index, point)
+
+    def near(self, point):
+        # indices of the columns in the 27 cubes around the point, in the order they were added
+        x, y, z = self.cell(point)
+        return sorted(index for i in (x - 1, x, x + 1) for j in (y - 1, y, y + 1) for k in (z - 1, z, z + 1)
+                      for index in self.cells.get((i, j, k), ()))
+
+
+def plan_columns(columns, walls, pc_columns, global_z=False):
+    # What happens to every column, from the records of column_records and wall_records and the point cloud columns of process_seg_columns.
+    # The walls are compared with the local z of the columns, as the model of the thesis has its columns at the elevation of their floor;
+    # with global_z the elevation of the floor is added first, for when only the walls of the same floor are given
+    # Returns a dictionary with the list of actions, in the order they are made, as (action, IFC GlobalId, point cloud column, data) tuples
+    # The columns are still matched one after the other, in the same order and with the same distances as when every column was compared
+    # with every point cloud column, but only the columns a spatial index gives as candidates are compared
+    from scipy.spatial import cKDTree
+    columns = [dict(column) for column in columns]
+    actions = []
     ifc_columns_close_to_walls = []
     ifc_columns_not_close_to_walls = []
     # here "emb" means embedded, do columns that are found inside a wall in the ifc model or in the point cloud data, whose detection might be hindered
     ifc_emb_columns_no_match = []
-    matched_emb_pc_columns = []
-    
-    walls = model.by_type('IfcWallStandardCase')
-    columns = model.by_type('IfcColumn')
-    
-    for column in columns: 
-        # Some columns depending on how they are modeled have their location at column.Representation.Representations[0].Items[0].MappingSource.MappedRepresentation.Items[0].Position.Location.Coordinates
-        # instead of at column.ObjectPlacement.RelativePlacement.Location.Coordinates, where it usually is, so we need to check for both cases
-        # When the column's location is at column.ObjectPlacement.RelativePlacement.Location.Coordinates, the other location, column.Representation.Representations[0].Items[0].MappingSource.MappedRepresentation.Items[0].Position.Location.Coordinates
-        # is always set as (0.0, 0.0, 0.0), so we can use that as a test to know where the location is stored. The other scenario, where the location is stored at
-        # the mapping source usually happens when every column in the file, or many of them, have their own column type and all geometric infornmation is then
-        # stored at the column type instead of the column instance, even when many columns have the same profile. This can happen depending on how columns are 
-        # modeled in a BIM authoring tool
-        if column.Representation.Representations[0].Items[0].MappingSource.MappedRepresentation.Items[0].Position.Location.Coordinates == (0.0, 0.0, 0.0):
-            column_position = column.ObjectPlacement.RelativePlacement.Location.Coordinates
-            column_x, column_y, column_z = column_position
-        else:
-            column_position = column.Representation.Representations[0].Items[0].MappingSource.MappedRepresentation.Items[0].Position.Location.Coordinates
-            column_x, column_y, column_z = column_position
-
-        column_is_close_to_any_wall = False  # Flag to track if the column is close to any wall, all ifc columns are checked for all point cloud columns, and if they are once close to a wall they are labeled as so, to make sure there are no duplicates
 
-        for wall in walls:
-            start_point, end_point = extrPoints(wall)
-            if not start_point or not end_point:
-                continue
-            
-            # Determine if the wall is horizontal or vertical
-            local_placement = wall.ObjectPlacement
-            if local_placement.RelativePlacement.RefDirection is None or (local_placement.RelativePlacement.Axis.DirectionRatios == (0, 0, 1) and local_placement.RelativePlacement.RefDirection.DirectionRatios == (-1, 0, 0)):
-                is_horizontal = True
-            elif (local_placement.RelativePlacement.Axis.DirectionRatios == (0, 0, 1) and local_placement.RelativePlacement.RefDirection.DirectionRatios in [(0, 1, 0), (0, -1, 0)]):
-                is_vertical = True
-            else:
-                is_horizontal = False
-                is_vertical = False
-
-            if is_horizontal:
-                # Check if the column is within the range of a horizontal wall
-                y_min, y_max = sorted([start_point[1], end_point[1]])  # y min and y max are the same y coordinate in a horizontal wall
-                x_min, x_max = sorted([start_point[0], end_point[0]])
-                
-                # some thresholds are used for the y value (that remains the same in vertical walls) and the x values that the center of a column can be to be considered embedded in that wall
-                # some tolerance is also given for the z value of the based of the wall and column
-                if y_min - 0.35 <= column_y <= y_max + 0.35 and x_min - 0.35 <= column_x <= x_max + 0.35 and abs(column_z - start_point[2]) <= 0.25:
-                    column_is_close_to_any_wall = True
-                    break  # No need to check further walls if a match is found
-
-            elif is_vertical:
-                # Check if the column is within the range of a vertical wall
-                x_min, x_max = sorted([start_point[0], end_point[0]]) # x min and x max are the same y coordinate in a horizontal wall
-                y_min, y_max = sorted([start_point[1], end_point[1]])
-
-                # some thresholds are used for the x value (that remains the same in horizontal walls) and the y values that the center of a column can be to be considered embedded in that wall
-                # some tolerance is also given for the z value of the based of the wall and column                
-                if x_min - 0.35 <= column_x <= x_max + 0.35 and y_min - 0.35 <= column_y <= y_max + 0.35 and abs(column_z - start_point[2]) <= 0.25:
-                    column_is_close_to_any_wall = True
-                    break  # No need to check further walls if a match is found
-
-        if column_is_close_to_any_wall:
+    # all ifc columns are checked against all walls, and if they are once close to a wall they are labeled as so, to make sure there are no duplicates
+    positions = [(x, y, z + column['elevation']) if global_z else (x, y, z) for column in columns for x, y, z in [column['position']]]
+    for column, embedded in zip(columns, embedded_columns(positions, walls)):
+        if embedded:
             ifc_columns_close_to_walls.append(column)
         else:
             ifc_columns_not_close_to_walls.append(column)
-    
+
     # Matching (or try to) IFC columns close to walls with point cloud columns
     # create a copy of point cloud columns to then remove all columns that are close to a wall and matched to an embedded IFC column, to know how many point cloud columns are left
-    remaining_pc_columns = pc_columns.copy()
-    
-    for ifc_column in ifc_columns_close_to_walls:
-        if ifc_column.Representation.Representations[0].Items[0].MappingSource.MappedRepresentation.Items[0].Position.Location.Coordinates == (0.0, 0.0, 0.0):
-            column_position = ifc_column.ObjectPlacement.RelativePlacement.Location.Coordinates
-            column_x, column_y, column_z = column_position
-        else:
-            column_position = ifc_column.Representation.Representations[0].Items[0].MappingSource.MappedRepresentation.Items[0].Position.Location.Coordinates
-            column_x, column_y, column_z = column_position
-        # find the elevation of the floor an IFC column is located, to help comparing the local z value of the IFC column to the global z value of the point cloud column
-        elevation = ifc_column.ContainedInStructure[0].RelatingStructure.Elevation
+    remaining_pc_columns = dict(pc_columns)
+    pc_names = list(pc_columns)
+    # the point cloud columns within the threshold of an IFC column come from a KD-tree of their centers, a hair wider than the threshold,
+    # and are then checked with the same distance as before, the first one that is still left in the order of pc_columns is taken
+    pc_tree = cKDTree(np.array([pc_columns[name]['cg'] for name in pc_names], dtype=np.float64)) if pc_names else None
 
+    for ifc_column in ifc_columns_close_to_walls:
+        column_x, column_y, column_z = ifc_column['position']
         matched = False
-        for pc_column_name, pc_column_data in list(remaining_pc_columns.items()):
-            cg_x, cg_y, cg_z = pc_column_data['cg']
-            # the elevation of the floor an IFC column is in is reduced from the elevation of the point cloud column it is being compared to, to see if their position is comparable
-            cg_z_transformed = cg_z - elevation
-            
-            distance = np.sqrt((column_x - cg_x)**2 + (column_y - cg_y)**2 + (column_z - cg_z_transformed)**2)
+        candidates = [] if pc_tree is None else pc_tree.query_ball_point((column_x, column_y, column_z + ifc_column['elevation']),
+                                                                         EMBEDDED_MATCH_DISTANCE + 1e-9)
+        for pc_column_name in (pc_names[index] for index in sorted(candidates)):
+            if pc_column_name not in remaining_pc_columns:
+                continue
             # Threshold for embedded ifc-pcd column matching
-            if distance <= 1.1:
-                matched_emb_pc_columns.append(pc_column_name)
+            if column_distance(ifc_column['position'], remaining_pc_columns[pc_column_name]['cg'], ifc_column['elevation']) <= EMBEDDED_MATCH_DISTANCE:
                 remaining_pc_columns.pop(pc_column_name)
                 matched = True
-                print(f'Column {pc_column_name} got matched to an IFC column embedded in a wall!')
+                actions.append((MATCHED, ifc_column['guid'], pc_column_name, None))
                 break
-        
         if not matched:
-            ifc_emb_columns_no_match.append(ifc_column.GlobalId)
-    
-    num_ifc_emb_columns_no_match = len(ifc_emb_columns_no_match)
-    if num_ifc_emb_columns_no_match > 0:
-        print(f'There are {num_ifc_emb_columns_no_match} IFC columns embedded in walls that could not be checked against point cloud data.')
-    
-    num_pc_columns_remaining = len(remaining_pc_columns) # point cloud columns that are not close to a wall, or at least not matched to ifc columns embedded in walls
-    num_ifc_columns_not_close = len(ifc_columns_not_close_to_walls)
-    message2 = ''
-    if num_pc_columns_remaining < num_ifc_columns_not_close:
-        print(f'There were {num_pc_columns_remaining} columns found in the point cloud data away from walls, while the IFC as-designed file had more columns ({num_ifc_columns_not_close} IFC columns not embedded in walls).')
-        message2 = f'There were {num_pc_columns_remaining} columns found in the point cloud data away from walls, while the IFC as-designed file had more columns ({num_ifc_columns_not_close} IFC columns not embedded in walls). This means the designed project had more columns not embedded in walls, so you are advised to check the point cloud and see if the threshold should be adapted or a manual intervention is needed'
-         
+            ifc_emb_columns_no_match.append(ifc_column['guid'])
+            actions.append((NOT_CHECKED, ifc_column['guid'], None, None))
 
+    # point cloud columns that are not close to a wall, or at least not matched to ifc columns embedded in walls
+    num_pc_columns_remaining = len(remaining_pc_columns)
+    num_ifc_columns_not_close = len(ifc_columns_not_close_to_walls)
 
-
-    # Last step: Match remaining point cloud columns with IFC columns not close to walls
-    matched_ifc_columns = []
-    unmatched_ifc_columns = ifc_columns_not_close_to_walls.copy()
-
+    # Last step: Match remaining point cloud columns with IFC columns not close to walls. The IFC columns are kept in a grid, as an
+    # updated column moves to the position of its point cloud column and can then still be matched by the next point cloud columns
+    grid = ColumnGrid(FREE_MATCH_DISTANCE)
+    for index, ifc_column in enumerate(ifc_columns_not_close_to_walls):
+        column_x, column_y, column_z = ifc_column['position']
+        grid.add(index, (column_x, column_y, column_z + ifc_column['elevation']))
+    # the first column of every floor elevation, the new columns are copied from the first column of a floor close to their base
+    first_of_elevation = {}
+    for index, ifc_column in enumerate(ifc_columns_not_close_to_walls):
+        first_of_elevation.setdefault(ifc_column['elevation'], index)
+    matched_ifc_columns = set()
     for pc_column_name, pc_column_data in list(remaining_pc_columns.items()):
         cg_x, cg_y, cg_z = pc_column_data['cg']
         matched = False
-        
-        for ifc_column in ifc_columns_not_close_to_walls:
-            # here again, both positions where the location of a column might be, depending on whether it is defined by the column type/mappingSource or 
-            # column instance, have to be handled accordingly
-            if ifc_column.Representation.Representations[0].Items[0].MappingSource.MappedRepresentation.Items[0].Position.Location.Coordinates == (0.0, 0.0, 0.0):
-                column_position = ifc_column.ObjectPlacement.RelativePlacement.Location.Coordinates
-                column_x, column_y, column_z = column_position
-            else:
-                column_position = ifc_column.Representation.Representations[0].Items[0].MappingSource.MappedRepresentation.Items[0].Position.Location.Coordinates
-                column_x, column_y, column_z = column_position
-            elevation = ifc_column.ContainedInStructure[0].RelatingStructure.Elevation
-            
-            cg_z_transformed = cg_z - elevation
-            
-            distance = np.sqrt((column_x - cg_x)**2 + (column_y - cg_y)**2 + (column_z - cg_z_transformed)**2)
-            
+        for index in grid.near((cg_x, cg_y, cg_z)):
+            ifc_column = ifc_columns_not_close_to_walls[index]
+            column_x, column_y, column_z = ifc_column['position']
+
             ############################
             ######## THRESHOLD: ########
             ############################
-            if distance <= 1.2:
+            if column_distance(ifc_column['position'], pc_column_data['cg'], ifc_column['elevation']) <= FREE_MATCH_DISTANCE:
                 # Update matched IFC column position with point cloud data
-                # Here again, depending on where that column was keeping its location we need to add the new location to that place too, as other data pertaining
-                # the geometrical representation of the column are also in that "location" (either the ObjectPlacement or the MappingSource via a column type).
-                # Furthermore, because new columns that need to be created are copied based on existing column types at the model and have their new location
-                # assigned afterwards, the assignment of that location also needs to respect how their reference column structured its geometry
-                if ifc_column.Representation.Representations[0].Items[0].MappingSource.MappedRepresentation.Items[0].Position.Location.Coordinates != (0.0, 0.0, 0.0):
-                    ifc_column.Representation.Representations[0].Items[0].MappingSource.MappedRepresentation.Items[0].Position.Location.Coordinates = (float(cg_x), float(cg_y), float(column_z))
-                else:
-                    ifc_column.ObjectPlacement.RelativePlacement.Location.Coordinates = (float(cg_x), float(cg_y), float(column_z))
-                matched_ifc_columns.append(ifc_column)
-                unmatched_ifc_columns.remove(ifc_column)
+                coordinates = (float(cg_x), float(cg_y), float(column_z))
+                actions.append((UPDATED, ifc_column['guid'], pc_column_name,
+                                {'coordinates': coordinates, 'mapped': ifc_column['mapped'], 'deltas': (cg_x - column_x, cg_y - column_y, 0.0)}))
+                ifc_column['position'] = coordinates
+                grid.move(index, (coordinates[0], coordinates[1], coordinates[2] + ifc_column['elevation']))
+                matched_ifc_columns.add(index)
                 remaining_pc_columns.pop(pc_column_name)
                 matched = True
-                print(f'Column {pc_column_name} got matched to an IFC column not embedded in a wall!')
                 break
 
         if not matched:
-            # If no match, create a new column in IFC, as mentioned above, the new column will receive its locating point following the schema of the model column it copies semantics from,
-            # i.e., either ObjectPlacement or MappingSource of the representation. The elevation of the floor is reduced from the global z value of the point cloud, to give the new column a 
-            # proper local position relative to the floor it is in
-            possible_columns = [col for col in ifc_columns_not_close_to_walls if abs(col.ContainedInStructure[0].RelatingStructure.Elevation - cg_z) <= 0.4]
+            # If no match, create a new column in IFC. The new column is copied from a column of the floor, based on existing column types at
+            # the model, and will receive its locating point following the schema of the model column it copies semantics from, i.e., either
+            # ObjectPlacement or MappingSource of the representation. The elevation of the floor is reduced from the global z value of the point
+            # cloud, to give the new column a proper local position relative to the floor it is in
+            possible_columns = [index for elevation, index in first_of_elevation.items() if abs(elevation - cg_z) <= NEW_COLUMN_ELEVATION_TOLERANCE]
             if possible_columns:
-                existing_column = possible_columns[0]
-                new_column = ifcopenshell.util.element.copy_deep(model, existing_column, exclude=None)
-                if new_column.Representation.Representations[0].Items[0].MappingSource.MappedRepresentation.Items[0].Position.Location.Coordinates != (0.0, 0.0, 0.0):
-                    new_column.Representation.Representations[0].Items[0].MappingSource.MappedRepresentation.Items[0].Position.Location.Coordinates = (float(cg_x), float(cg_y), float(cg_z - existing_column.ContainedInStructure[0].RelatingStructure.Elevation))
-                else:
-                    new_column.ObjectPlacement.RelativePlacement.Location.Coordinates = (float(cg_x), float(cg_y), float(cg_z - existing_column.ContainedInStructure[0].RelatingStructure.Elevation))
-                print(f'New IFC column created for unmatched point cloud column {pc_column_name}.')
-    num_unmatched_free_columns = len(unmatched_ifc_columns)
+                existing_column = ifc_columns_not_close_to_walls[min(possible_columns)]
+                actions.append((CREATED, existing_column['guid'], pc_column_name,
+                                {'coordinates': (float(cg_x), float(cg_y), float(cg_z - existing_column['elevation']))}))
+
     # Remove unmatched IFC columns
+    unmatched_ifc_columns = [ifc_column for index, ifc_column in enumerate(ifc_columns_not_close_to_walls) if index not in matched_ifc_columns]
     for column_not_matched in unmatched_ifc_columns:
-        colGuid = column_not_matched.GlobalId
-        ifcopenshell.api.run("root.remove_product", model, product=column_not_matched)
-        print(f'IFC column {colGuid} removed as it was not matched to any point cloud column.')
+        actions.append((DELETED, column_not_matched['guid'], None, None))
 
-    # Save the modified IFC file
-    current_datetime = datetime.now()
-    formatted_datetime = current_datetime.strftime("%d%m%y_%H%M")
-    new_filename = f"modified_ifc_file_{formatted_datetime}.ifc"
-    model.write(new_filename)
+    return {'actions': actions, 'ifc_emb_columns_no_match': ifc_emb_columns_no_match, 'num_pc_columns_remaining': num_pc_columns_remaining,
+            'num_ifc_columns_not_close': num_ifc_columns_not_close, 'num_unmatched_free_ifc_columns': len(unmatched_ifc_columns)}
 
+
+def apply_column_plan(model, actions, report=None):
+    # make the changes of plan_columns to the model, report is an optional MatchReport (see matchReport.py)
+    import ifcopenshell.api
+    import ifcopenshell.util.element
+    for action, guid, pc_column_name, data in actions:
+        if action == MATCHED:
+            print(f'Column {pc_column_name} got matched to an IFC column embedded in a wall!')
+            if report is not None:
+                report.add(COLUMN, guid, pc_column_name, MATCHED, detail='embedded in a wall, as-designed position kept')
+        elif action == NOT_CHECKED:
+            if report is not None:
+                report.add(COLUMN, guid, None, NOT_CHECKED, detail='embedded in a wall, not found in the point cloud data')
+        elif action == UPDATED:
+            set_column_position(model.by_guid(guid), data['coordinates'], data['mapped'])
+            if report is not None:
+                report.add(COLUMN, guid, pc_column_name, UPDATED, deltas=data['deltas'])
+            print(f'Column {pc_column_name} got matched to an IFC column not embedded in a wall!')
+        elif action == CREATED:
+            # new columns are copied based on existing column types at the model and have their new location assigned afterwards, the
+            # assignment of that location also needs to respect how their reference column structured its geometry
+            new_column = ifcopenshell.util.element.copy_deep(model, model.by_guid(guid), exclude=None)
+            set_column_position(new_column, data['coordinates'], column_position(new_column)[1])
+            print(f'New IFC column created for unmatched point cloud column {pc_column_name}.')
+            if report is not None:
+                report.add(COLUMN, new_column.GlobalId, pc_column_name, CREATED)
+        elif action == DELETED:
+            ifcopenshell.api.run("root.remove_product", model, product=model.by_guid(guid))
+            print(f'IFC column {guid} removed as it was not matched to any point cloud column.')
+            if report is not None:
+                report.add(COLUMN, guid, None, DELETED)
+
+
+def column_results(plans):
+    # the dictionary returned by check_and_update_columns, from the plans of one or more parts of the model
+    ifc_emb_columns_no_match = [guid for plan in plans for guid in plan['ifc_emb_columns_no_match']]
+    num_ifc_emb_columns_no_match = len(ifc_emb_columns_no_match)
+    if num_ifc_emb_columns_no_match > 0:
+        print(f'There are {num_ifc_emb_columns_no_match} IFC columns embedded in walls that could not be checked against point cloud data.')
+    num_pc_columns_remaining = sum(plan['num_pc_columns_remaining'] for plan in plans)
+    num_ifc_columns_not_close = sum(plan['num_ifc_columns_not_close'] for plan in plans)
+    message2 = ''
+    if num_pc_columns_remaining < num_ifc_columns_not_close:
+        print(f'There were {num_pc_columns_remaining} columns found in the point cloud data away from walls, while the IFC as-designed file had more columns ({num_ifc_columns_not_close} IFC columns not embedded in walls).')
+        message2 = f'There were {num_pc_columns_remaining} columns found in the point cloud data away from walls, while the IFC as-designed file had more columns ({num_ifc_columns_not_close} IFC columns not embedded in walls). This means the designed project had more columns not embedded in walls, so you are advised to check the point cloud and see if the threshold should be adapted or a manual intervention is needed'
     return {
-        'new_filename': new_filename,
+        'new_filename': None,
         'ifc_emb_columns_no_match': ifc_emb_columns_no_match,
         'num_ifc_emb_columns_no_match': num_ifc_emb_columns_no_match,
-        'message' : message2,
-        'num_unmatched_free_ifc_columns': num_unmatched_free_columns
+        'message': message2,
+        'num_unmatched_free_ifc_columns': sum(plan['num_unmatched_free_ifc_columns'] for plan in plans)
     }
 
+
+def check_and_update_columns(model, pc_columns, report=None, write_file=True):
+    # report is an optional MatchReport (see matchReport.py) where the outcome for every column is recorded, next to the dictionary
+    # of results and warnings returned at the end. All columns are compared with all walls and point cloud columns, see storeyPartition.py
+    # for the same update done floor by floor
+    plan = plan_columns(column_records(model.by_type('IfcColumn')), wall_records(model.by_type('IfcWallStandardCase')), pc_columns)
+    apply_column_plan(model, plan['actions'], report=report)
+    results = column_results([plan])
+
+    # Save the modified IFC file, unless the model is written later together with other updates (new_filename is then None)
+    if write_file:
+        current_datetime = datetime.now()
+        formatted_datetime = current_datetime.strftime("%d%m%y_%H%M")
+        # written in the background, new_filename is the handle of the pending file (see ifcWriter.py)
+        from ifcWriter import write_in_background
+        results['new_filename'] = write_in_background(model, f"modified_ifc_file_{formatted_datetime}.ifc")
+
+    return results
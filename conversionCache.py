@@ -0,0 +1,103 @@
+# This code is part of the Master Thesis of Jean van der Meer presented to the Eindhoven University of Technology
+# Content-addressed cache of converted IFC files, kept across sessions. Opening an IFC file used to tessellate (or convert to STEP with
+# IfcConvert) the whole building every time, even when the file did not change since the last time it was opened. Here the output of a
+# conversion is stored under a key made of the hash of the contents of the IFC file and the settings of the converter, so the same file
+# opened again with the same settings is served from the cache, no matter its name or folder. The cache has a disk budget, and when it is
+# exceeded the entries that were used the longest time ago are removed first.
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'history-of-the-walls')
+DEFAULT_BUDGET_BYTES = 5 * 1024 ** 3  # 5 GB
+
+
+def file_hash(file_path, chunk_size=1024 * 1024):
+    # sha256 of the contents of the file, read in chunks so models of hundreds of MB are not loaded in memory at once
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(file_path, settings):
+    # settings is a dictionary describing the converter (name, version, options), any change of them gives a new key
+    digest = hashlib.sha256()
+    digest.update(file_hash(file_path).encode('ascii'))
+    digest.update(json.dumps(settings, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ConversionCache:
+    # An entry is a group of files named <key><extension> in the cache folder, e.g. the .brep and .json of a tessellated model, or the .stp
+    # made by IfcConvert. The modification time of the files is used as the time of last use
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, budget_bytes=DEFAULT_BUDGET_BYTES):
+        self.cache_dir = cache_dir
+        self.budget_bytes = budget_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, key, extension):
+        return os.path.join(self.cache_dir, key + extension)
+
+    def get(self, key, extensions):
+        # paths of the cached files of the entry, or None if any of them is missing
+        paths = [self.path(key, extension) for extension in extensions]
+        if not all(os.path.exists(path) for path in paths):
+            return None
+        now = time.time()
+        for path in paths:
+            os.utime(path, (now, now))
+        return paths
+
+    def temporary_path(self, extension):
+        # a file in the cache folder to write a conversion into, so put() can move it in place without copying between disks
+        handle, path = tempfile.mkstemp(suffix=extension, prefix='.tmp_', dir=self.cache_dir)
+        os.close(handle)
+        return path
+
+    def put(self, key, files):
+        # files is {extension: path of the converted file}. Each file is moved into the cache with os.replace, so readers never see
+        # a half written entry, then the cache is trimmed to its budget
+        paths = []
+        for extension, source_path in files.items():
+            path = self.path(key, extension)
+            os.replace(source_path, path)
+            paths.append(path)
+        self.evict(keep=key)
+        return paths
+
+    def entries(self):
+        # {key: [total size in bytes, time of last use]}, temporary files of conversions that are still running are left out
+        entries = {}
+        for name in os.listdir(self.cache_dir):
+            if name.startswith('.tmp_'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            if not os.path.isfile(path):
+                continue
+            key = name.split('.', 1)[0]
+            stat = os.stat(path)
+            entry = entries.setdefault(key, [0, 0.0])
+            entry[0] += stat.st_size
+            entry[1] = max(entry[1], stat.st_mtime)
+        return entries
+
+    def evict(self, keep=None):
+        # remove the least recently used entries until the cache fits in its budget, the entry just added (keep) is never removed
+        entries = self.entries()
+        total = sum(size for size, _ in entries.values())
+        for key, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+            if total <= self.budget_bytes:
+                break
+            if key == keep:
+                continue
+            for name in os.listdir(self.cache_dir):
+                if name.split('.', 1)[0] == key:
+                    os.remove(os.path.join(self.cache_dir, name))
+            total -= size
+            print(f'Conversion cache: removed {key[:12]} ({size / 1e6:.1f} MB)')
+        return total
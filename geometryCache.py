@@ -0,0 +1,147 @@
+# This code is part of the Master Thesis of Jean van der Meer presented to the Eindhoven University of Technology
+# Tessellation cache per building element. An update of walls, columns or ceilings only changes a handful of IfcWallStandardCase,
+# IfcColumn or IfcCovering entities, but the whole building used to be converted again after every update. Here every product is
+# stored under its GlobalId together with a signature, a hash of the entities of its placement and representation (and of the openings
+# cut into it). When the cache is refreshed after an updater ran, only the products whose signature changed, or that are new, are
+# tessellated again, and products that were removed from the model are dropped. The interface then swaps only those shapes in the viewer.
+
+import hashlib
+import json
+
+# the same products the geometry iterator skips by default, openings are taken into account through the element they are cut from
+SKIPPED_TYPES = ('IfcOpeningElement', 'IfcSpace')
+
+
+def element_signature(model, product):
+    # Hash of every entity reachable from the placement and the representation of the product. Columns that keep their position in the
+    # MappingSource of their type, ceilings that keep their elevation in the Position of the swept solid, and walls whose length is in
+    # the profile are all covered, as traverse follows the references all the way down. The placement of the storey is part of the chain
+    # of PlacementRelTo, so moving a storey marks all of its elements as changed
+    digest = hashlib.blake2b(digest_size=16)
+    roots = [product.ObjectPlacement, product.Representation]
+    # openings change the geometry of the wall they are cut from (e.g. doors removed together with a wall)
+    for rel in getattr(product, 'HasOpenings', None) or ():
+        roots.append(rel.RelatedOpeningElement.ObjectPlacement)
+        roots.append(rel.RelatedOpeningElement.Representation)
+    for root in roots:
+        if root is None:
+            digest.update(b'None;')
+            continue
+        for entity in model.traverse(root):
+            digest.update(str(entity).encode('utf-8'))
+            digest.update(b';')
+    return digest.hexdigest()
+
+
+def cacheable_products(model):
+    return [product for product in model.by_type('IfcProduct')
+            if product.Representation is not None and not any(product.is_a(t) for t in SKIPPED_TYPES)]
+
+
+class GeometryCache:
+    # entries holds {GlobalId: [signature, OCC shape or None, (r, g, b)]}. A product that has a representation but no body geometry
+    # is kept with shape None, so it is not sent to the tessellator again at every refresh
+    def __init__(self, model=None):
+        self.model = model
+        self.entries = {}
+
+    def refresh(self, model, num_threads=None):
+        # Bring the cache up to date with the model and return the GlobalIds that were (added, changed, removed), so the caller can swap
+        # only those shapes. A different model object (a new IFC file opened) empties the cache first
+        from ifcTessellator import iterate_shapes
+        if model is not self.model:
+            self.model = model
+            self.entries = {}
+
+        signatures = {}
+        dirty = []
+        for product in cacheable_products(model):
+            signature = element_signature(model, product)
+            signatures[product.GlobalId] = signature
+            entry = self.entries.get(product.GlobalId)
+            if entry is None or entry[0] != signature:
+                dirty.append(product)
+
+        removed = [guid for guid in self.entries if guid not in signatures]
+        for guid in removed:
+            del self.entries[guid]
+
+        added = []
+        changed = []
+        for product in dirty:
+            (changed if product.GlobalId in self.entries else added).append(product.GlobalId)
+            self.entries[product.GlobalId] = [signatures[product.GlobalId], None, None]
+        # only the dirty products go through the tessellator
+        for product, occ_shape, color in iterate_shapes(model, products=dirty, num_threads=num_threads):
+            self.entries[product.GlobalId][1:] = [occ_shape, color]
+        return added, changed, removed
+
+    def shape(self, guid):
+        entry = self.entries.get(guid)
+        return (entry[1], entry[2]) if entry is not None and entry[1] is not None else (None, None)
+
+    def shapes_labels_colors(self):
+        # same layout as read_step_file_with_names_colors and ifcTessellator.tessellate_model
+        from OCC.Core.Quantity import Quantity_Color, Quantity_TOC_RGB
+        shapes_labels_colors = {}
+        for guid, (_, occ_shape, color) in self.entries.items():
+            if occ_shape is not None:
+                product = self.model.by_guid(guid)
+                shapes_labels_colors[occ_shape] = [f'{product.is_a()}:{guid}', Quantity_Color(*color, Quantity_TOC_RGB)]
+        return shapes_labels_colors
+
+    def save(self, brep_path, json_path):
+        # All cached shapes as one BREP compound, and the GlobalId, signature and colour of each of them in the same order in a JSON file.
+        # This is what the conversion cache stores for a model (see conversionCache.py)
+        from OCC.Core.BRep import BRep_Builder
+        from OCC.Core.TopoDS import TopoDS_Compound
+        builder = BRep_Builder()
+        compound = TopoDS_Compound()
+        builder.MakeCompound(compound)
+        index = []
+        for guid, (signature, occ_shape, color) in self.entries.items():
+            if occ_shape is not None:
+                builder.Add(compound, occ_shape)
+            index.append([guid, signature, list(color) if occ_shape is not None else None])
+        write_brep(compound, brep_path)
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+
+    def load(self, model, brep_path, json_path):
+        # Fill the cache from files written by save() for the same model, the signatures stored there are still valid because the cache
+        # key includes the hash of the IFC file
+        from OCC.Core.TopoDS import TopoDS_Iterator
+        with open(json_path, encoding='utf-8') as f:
+            index = json.load(f)
+        iterator = TopoDS_Iterator(read_brep(brep_path))
+        self.model = model
+        self.entries = {}
+        for guid, signature, color in index:
+            occ_shape = None
+            if color is not None:
+                occ_shape = iterator.Value()
+                iterator.Next()
+            self.entries[guid] = [signature, occ_shape, tuple(color) if color is not None else None]
+
+
+def write_brep(shape, file_path):
+    # the BRepTools functions moved into a class in newer versions of pythonOCC
+    try:
+        from OCC.Core.BRepTools import breptools
+        breptools.Write(shape, file_path)
+    except ImportError:
+        from OCC.Core.BRepTools import breptools_Write
+        breptools_Write(shape, file_path)
+
+
+def read_brep(file_path):
+    from OCC.Core.BRep import BRep_Builder
+    from OCC.Core.TopoDS import TopoDS_Shape
+    shape = TopoDS_Shape()
+    try:
+        from OCC.Core.BRepTools import breptools
+        breptools.Read(shape, file_path, BRep_Builder())
+    except ImportError:
+        from OCC.Core.BRepTools import breptools_Read
+        breptools_Read(shape, file_path, BRep_Builder())
+    return shape
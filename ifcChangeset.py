@@ -0,0 +1,172 @@
+# This code is part of the Master Thesis of Jean van der Meer presented to the Eindhoven University of Technology
+# Changesets of an update instead of a whole new IFC file. An update of ten walls in Room Mode still wrote the complete building again,
+# which is a lot to store and to send when the as-designed IFC file is kept under version control. Here the entities of the model are
+# recorded before the updaters run, and compared with the model after the update: the entities that were created, modified and removed
+# are kept by their entity id (#123), together with the GlobalId and class of the IFC products among them. The changeset is saved as a
+# small JSON patch (gzip compressed when the name ends with .gz) holding only the changed lines of the IFC file, and can be applied again
+# to the original file to get the updated model. The comparison is made on the text IfcOpenShell writes for every entity, one line per
+# entity, so the patch is applied on the original file as written by IfcOpenShell, whose entity ids are kept from the original file.
+#
+#   python -m ifcChangeset diff original.ifc updated.ifc -o update.patch.json
+#   python -m ifcChangeset apply original.ifc update.patch.json -o updated.ifc
+
+import argparse
+import gzip
+import hashlib
+import json
+import re
+import sys
+
+PATCH_FORMAT = 'ifc-changeset'
+PATCH_VERSION = 1
+
+_ENTITY_LINE = re.compile(r'#(\d+)=')
+
+
+def split_ifc_text(text):
+    # (header, {entity id: line}, footer) of the text of an IFC file written by IfcOpenShell, the header ends with 'DATA;' and the footer
+    # starts with 'ENDSEC;' of the data section
+    data_start = text.index('DATA;') + len('DATA;')
+    data_end = text.index('ENDSEC;', data_start)
+    lines = {}
+    for line in text[data_start:data_end].splitlines():
+        line = line.strip()
+        match = _ENTITY_LINE.match(line)
+        if match:
+            lines[int(match.group(1))] = line
+    return text[:data_start], lines, text[data_end:]
+
+
+def line_digest(line):
+    return hashlib.blake2b(line.encode('utf-8'), digest_size=16).digest()
+
+
+def data_hash(lines):
+    # hash of the data section only, the header holds e.g. the time the file was written
+    digest = hashlib.sha256()
+    for entity_id in sorted(lines):
+        digest.update(lines[entity_id].encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+def rooted_entities(model):
+    # {entity id: (IFC class, GlobalId)} of every IfcRoot entity, to report the changes by GlobalId
+    return {entity.id(): (entity.is_a(), entity.GlobalId) for entity in model.by_type('IfcRoot')}
+
+
+class Changeset:
+    # created and modified are {entity id: line}, removed is a list of entity ids. products lists the IFC entities with a GlobalId among
+    # them, as {'created': [...], 'modified': [...], 'removed': [...]} of {'id', 'type', 'guid'} dictionaries. base_hash is the hash of
+    # the data section of the original model as written by IfcOpenShell, to check a patch is applied to the model it was made from
+    def __init__(self, schema, base_hash, created, modified, removed, products):
+        self.schema = schema
+        self.base_hash = base_hash
+        self.created = created
+        self.modified = modified
+        self.removed = removed
+        self.products = products
+
+    def __len__(self):
+        return len(self.created) + len(self.modified) + len(self.removed)
+
+    def summary(self):
+        return {'created': len(self.created), 'modified': len(self.modified), 'removed': len(self.removed),
+                'products': {action: len(products) for action, products in self.products.items()}}
+
+    def to_dict(self):
+        return {'format': PATCH_FORMAT, 'version': PATCH_VERSION, 'schema': self.schema, 'base_hash': self.base_hash,
+                'products': self.products, 'removed': self.removed,
+                'modified': {str(entity_id): line for entity_id, line in self.modified.items()},
+                'created': {str(entity_id): line for entity_id, line in self.created.items()}}
+
+    def save(self, file_path):
+        data = json.dumps(self.to_dict(), indent=1).encode('utf-8')
+        with (gzip.open(file_path, 'wb') if file_path.endswith('.gz') else open(file_path, 'wb')) as f:
+            f.write(data)
+        return len(data)
+
+    @classmethod
+    def load(cls, file_path):
+        with (gzip.open(file_path, 'rb') if file_path.endswith('.gz') else open(file_path, 'rb')) as f:
+            patch = json.loads(f.read().decode('utf-8'))
+        if patch.get('format') != PATCH_FORMAT or patch.get('version') != PATCH_VERSION:
+            raise ValueError(f'{file_path} is not a version {PATCH_VERSION} IFC changeset')
+        return cls(patch['schema'], patch['base_hash'], {int(k): v for k, v in patch['created'].items()},
+                   {int(k): v for k, v in patch['modified'].items()}, [int(k) for k in patch['removed']], patch['products'])
+
+
+class ChangeRecorder:
+    # Records the entities of the model when it is made, changeset() then compares the model with that record. Only a digest of every
+    # entity is kept, not a copy of the model
+    def __init__(self, model):
+        lines = split_ifc_text(model.to_string())[1]
+        self.schema = model.schema
+        self.base_hash = data_hash(lines)
+        self.digests = {entity_id: line_digest(line) for entity_id, line in lines.items()}
+        self.rooted = rooted_entities(model)
+
+    def changeset(self, model):
+        _, lines, _ = split_ifc_text(model.to_string())
+        created = {entity_id: line for entity_id, line in lines.items() if entity_id not in self.digests}
+        modified = {entity_id: line for entity_id, line in lines.items()
+                    if entity_id in self.digests and self.digests[entity_id] != line_digest(line)}
+        removed = sorted(entity_id for entity_id in self.digests if entity_id not in lines)
+        rooted = rooted_entities(model)
+
+        def products(entity_ids, entities):
+            return [{'id': entity_id, 'type': entities[entity_id][0], 'guid': entities[entity_id][1]}
+                    for entity_id in sorted(entity_ids) if entity_id in entities]
+
+        return Changeset(self.schema, self.base_hash, created, modified, removed,
+                         {'created': products(created, rooted), 'modified': products(modified, rooted),
+                          'removed': products(removed, self.rooted)})
+
+
+def apply_changeset(model, changeset, check_base=True):
+    # New model made of the original model with the changeset applied, the original model is not changed
+    import ifcopenshell
+    header, lines, footer = split_ifc_text(model.to_string())
+    if check_base and data_hash(lines) != changeset.base_hash:
+        raise ValueError('The changeset was not made from this IFC model')
+    for entity_id in changeset.removed:
+        lines.pop(entity_id, None)
+    lines.update(changeset.modified)
+    lines.update(changeset.created)
+    data = '\n'.join(lines[entity_id] for entity_id in sorted(lines))
+    return ifcopenshell.file.from_string(f'{header}\n{data}\n{footer}')
+
+
+def main(argv=None):
+    import ifcopenshell
+    parser = argparse.ArgumentParser(prog='ifcChangeset', description='Make and apply changesets of IFC models.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    diff = commands.add_parser('diff', help='changeset from an original IFC file to an updated one')
+    diff.add_argument('original')
+    diff.add_argument('updated')
+    diff.add_argument('-o', '--output', required=True, help='changeset file (.json or .json.gz)')
+    apply = commands.add_parser('apply', help='apply a changeset to the original IFC file')
+    apply.add_argument('original')
+    apply.add_argument('changeset')
+    apply.add_argument('-o', '--output', required=True, help='updated IFC file')
+    apply.add_argument('--force', action='store_true', help='apply even if the original file is not the one the changeset was made from')
+    args = parser.parse_args(argv)
+
+    if args.command == 'diff':
+        changeset = ChangeRecorder(ifcopenshell.open(args.original)).changeset(ifcopenshell.open(args.updated))
+        size = changeset.save(args.output)
+        print(f"Changeset written: {args.output} ({size / 1e3:.1f} kB) {changeset.summary()}")
+    else:
+        changeset = Changeset.load(args.changeset)
+        try:
+            updated = apply_changeset(ifcopenshell.open(args.original), changeset, check_base=not args.force)
+        except ValueError as e:
+            print(f'ifcChangeset: {e}', file=sys.stderr)
+            return 1
+        updated.write(args.output)
+        print(f"Changeset applied: {args.output} {changeset.summary()}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+# This code is part of the Master Thesis of Jean van der Meer presented to the Eindhoven University of Technology
+# Direct tessellation of the IFC model into OpenCascade shapes for the viewer. Before, every update wrote the model to an IFC file, ran
+# IfcConvert to make a STEP file out of it and read the STEP file back with read_step_file_with_names_colors, which was the largest
+# computational bottleneck of the tool. Here the geometry iterator of IfcOpenShell tessellates the model that is already in memory, using
+# several threads, and hands over the OCC shapes directly, without the STEP file and the extra round trip over the disk.
+# The result has the same layout as read_step_file_with_names_colors, a dictionary of {shape: [label, color]}, so the display code in the
+# interface does not need to know where the shapes came from. Unlike the STEP file, the shapes are in the units of the IFC model (metres),
+# so point clouds overlap with them without being scaled up.
+
+import multiprocessing
+
+import ifcopenshell
+import ifcopenshell.geom
+
+# colour for products that have no surface style in the IFC file
+DEFAULT_COLOR = (0.7, 0.7, 0.7)
+
+
+def geometry_settings():
+    # world coordinates, so every shape is already at its place in the building, and OCC shapes instead of triangle buffers
+    settings = ifcopenshell.geom.settings()
+    if hasattr(settings, 'USE_PYTHON_OPENCASCADE'):
+        # IfcOpenShell 0.7
+        settings.set(settings.USE_PYTHON_OPENCASCADE, True)
+        settings.set(settings.USE_WORLD_COORDS, True)
+    else:
+        settings.set('use-python-opencascade', True)
+        settings.set('use-world-coords', True)
+    return settings
+
+
+def settings_key():
+    # description of the tessellation settings, used as part of the key of the conversion cache (see conversionCache.py)
+    return {'converter': 'ifcopenshell.geom', 'version': getattr(ifcopenshell, 'version', ''),
+            'use-python-opencascade': True, 'use-world-coords': True}
+
+
+def shape_color(shape):
+    # the first surface style of the product is used as its colour, like the STEP viewer did. Styles without a colour come as negative values
+    styles = getattr(shape, 'styles', None) or ()
+    for style in styles:
+        if len(style) >= 3 and min(style[:3]) >= 0.0:
+            return tuple(float(c) for c in style[:3])
+    return DEFAULT_COLOR
+
+
+def iterate_shapes(model, products=None, num_threads=None, settings=None):
+    # Generator of (product, OCC shape, rgb colour) for every product with a body representation. products can be a list of IFC
+    # entities to restrict the tessellation to, e.g. only the elements changed by an update; by default the whole model is used.
+    # The iterator spreads the tessellation of the products over num_threads threads (all cores by default)
+    if products is not None and len(products) == 0:
+        return
+    settings = settings or geometry_settings()
+    num_threads = num_threads or multiprocessing.cpu_count()
+    if products is None:
+        iterator = ifcopenshell.geom.iterator(settings, model, num_threads)
+    else:
+        iterator = ifcopenshell.geom.iterator(settings, model, num_threads, include=list(products))
+    if not iterator.initialize():
+        return
+    while True:
+        shape = iterator.get()
+        product = model.by_id(shape.id)
+        yield product, shape.geometry, shape_color(shape)
+        if not iterator.next():
+            break
+
+
+def tessellate_model(model, products=None, num_threads=None):
+    # {shape: [label, color]}, same as read_step_file_with_names_colors. The label holds the GlobalId of the product so shapes can be
+    # traced back to the IFC entity they came from
+    from OCC.Core.Quantity import Quantity_Color, Quantity_TOC_RGB
+    shapes_labels_colors = {}
+    for product, occ_shape, (r, g, b) in iterate_shapes(model, products=products, num_threads=num_threads):
+        label = f'{product.is_a()}:{product.GlobalId}'
+        shapes_labels_colors[occ_shape] = [label, Quantity_Color(r, g, b, Quantity_TOC_RGB)]
+    return shapes_labels_colors
+
+
+def label_guid(label):
+    # GlobalId back from a label made by tessellate_model
+    return label.split(':', 1)[1] if ':' in label else label
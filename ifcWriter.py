@@ -0,0 +1,143 @@
+# This code is part of the Master Thesis of Jean van der Meer presented to the Eindhoven University of Technology
+# Writing IFC files in the background, optionally compressed. model.write blocked the updater until the whole building was written as
+# plain STEP text, hundreds of MB for a full building. Here the model is turned into text on the calling thread, which is a consistent
+# copy even if the model is changed right afterwards, and the encoding, the compression and the writing to disk happen on a writer thread,
+# so the updater returns with a handle to the file that is still being written. Turning the model into text is the larger part of the
+# time of model.write, so the updater does not return immediately, it saves the encoding, the compression and the disk.
+# ifcopenshell has no cheaper consistent copy of a model than its text. Files can be written as plain .ifc, as .ifc.gz (gzip)
+# or as .ifczip (a zip archive holding the .ifc file, which most IFC software opens directly). A file is first written under a temporary
+# name in the same folder and then renamed, so an interrupted write never leaves a half written IFC file behind, and it gets the
+# permissions of a file made with open() (the temporary file is only readable by its owner). The size of every file written and the time
+# it took are printed and returned. The error of a write that failed is raised by PendingWrite.wait().
+
+import gzip
+import os
+import tempfile
+import time
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# extension of the files for each compression
+COMPRESSIONS = {None: '.ifc', 'gzip': '.ifc.gz', 'zip': '.ifczip'}
+# compression used by the updaters for the files they write, None writes plain .ifc files that IfcConvert can read
+DEFAULT_COMPRESSION = None
+
+WriteResult = namedtuple('WriteResult', ['file_path', 'bytes', 'seconds'])
+
+
+def current_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# read once, os.umask can only be read by setting it, which is not safe while other threads make files
+UMASK = current_umask()
+
+
+def replace_file(temporary_path, file_path):
+    # move a file made with tempfile.mkstemp into place, with the permissions open() would have given it
+    os.chmod(temporary_path, 0o666 & ~UMASK)
+    os.replace(temporary_path, file_path)
+
+
+def compressed_path(file_path, compression):
+    # the file path with the extension of the compression, e.g. modified.ifc with gzip gives modified.ifc.gz
+    if compression not in COMPRESSIONS:
+        raise ValueError(f'Unknown IFC compression {compression!r}, use one of {list(COMPRESSIONS)}')
+    for extension in sorted(COMPRESSIONS.values(), key=len, reverse=True):
+        if file_path.lower().endswith(extension):
+            file_path = file_path[:-len(extension)]
+            break
+    return file_path + COMPRESSIONS[compression]
+
+
+def write_ifc(model, file_path, compression=None):
+    # Write the model (or the text of a model from model.to_string()) to file_path atomically and return a WriteResult
+    start = time.perf_counter()
+    text = model if isinstance(model, str) else model.to_string()
+    data = text.encode('utf-8')
+    del text
+    directory = os.path.dirname(os.path.abspath(file_path))
+    handle, temporary_path = tempfile.mkstemp(prefix='.tmp_', suffix=COMPRESSIONS[compression], dir=directory)
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            if compression == 'gzip':
+                with gzip.GzipFile(fileobj=f, mode='wb', compresslevel=6, mtime=0) as gzip_file:
+                    gzip_file.write(data)
+            elif compression == 'zip':
+                # the archive holds one .ifc file with the same name as the archive
+                inner_name = os.path.basename(compressed_path(file_path, None))
+                with zipfile.ZipFile(f, 'w', compression=zipfile.ZIP_DEFLATED) as zip_file:
+                    zip_file.writestr(inner_name, data)
+            else:
+                f.write(data)
+        replace_file(temporary_path, file_path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+    result = WriteResult(file_path, os.path.getsize(file_path), time.perf_counter() - start)
+    print(f"IFC file written: {file_path} ({result.bytes / 1e6:.1f} MB in {result.seconds:.2f} s)")
+    return result
+
+
+class PendingWrite(os.PathLike):
+    # Handle of a file that is being written in the background. It can be used as the path of the file (str() and os.fspath() give the
+    # path), wait() blocks until the file is written and returns its WriteResult, or raises the error of the write
+    def __init__(self, file_path, future):
+        self.file_path = file_path
+        self.future = future
+
+    def __fspath__(self):
+        return self.file_path
+
+    def __str__(self):
+        return self.file_path
+
+    def __repr__(self):
+        return f"PendingWrite({self.file_path!r}, done={self.done()})"
+
+    def done(self):
+        return self.future.done()
+
+    def wait(self, timeout=None):
+        return self.future.result(timeout)
+
+
+class BackgroundWriter:
+    # One writer thread, so the files are written in the order they were submitted. The thread is not a daemon, Python waits for the
+    # pending files before it exits
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ifc-writer')
+        self.pending = []
+
+    def submit(self, model, file_path, compression=None):
+        file_path = compressed_path(file_path, compression)
+        # the text is made here, so changes made to the model after submit() do not end up in the file
+        future = self.executor.submit(write_ifc, model.to_string(), file_path, compression)
+        pending_write = PendingWrite(file_path, future)
+        self.pending = [p for p in self.pending if not p.done()] + [pending_write]
+        return pending_write
+
+    def wait_all(self):
+        return [pending_write.wait() for pending_write in self.pending]
+
+
+_writer = None
+
+
+def write_in_background(model, file_path, compression='default'):
+    # Write the model with the shared background writer and return its PendingWrite. By default the compression is DEFAULT_COMPRESSION
+    global _writer
+    if _writer is None:
+        _writer = BackgroundWriter()
+    return _writer.submit(model, file_path, DEFAULT_COMPRESSION if compression == 'default' else compression)
+
+
+def wait_for_file(file_path):
+    # the path of a file that is ready to be read, waiting first if it is still being written in the background
+    if isinstance(file_path, PendingWrite):
+        file_path.wait()
+    return os.fspath(file_path)
@@ -0,0 +1,205 @@
+# This code is part of the Master Thesis of Jean van der Meer presented to the Eindhoven University of Technology
+# Runs that only redo what changed. When one wall is segmented again on site, the next run read every segmented point cloud again,
+# matched every wall again and, in Room Mode, made the alpha hull of the whole scan again, although almost nothing changed. Here a
+# manifest of the run is kept, a JSON file with the hash of the contents of every input file and the record derived from it (the entry
+# of wall_dict, column_dict or ceiling_dict the file gave), the matches of every point cloud wall, and the alpha hull of the scan next to
+# it as <manifest>.hull.wkb, after the key of the scan and parameters it was made of. The next run with the same manifest:
+#
+# - reads only the files that are new or whose contents changed, files with the same size and modification time are not even hashed
+# - matches again only the point cloud walls whose record changed or is new, and their neighbours, the walls with an end point within
+#   NEIGHBOUR_DISTANCE of an end point of a wall that changed or was removed. The matches of the other walls are carried over
+# - matches every wall again when the IFC walls taken into account, their end points or the parameters of the matching changed
+# - makes the alpha hull again only when the contents of the scan or the parameters of the hull changed
+#
+# The printed lines and the reports are the same as for a full run. Columns and ceilings only reuse the records of their files, their
+# matching takes the point cloud columns one after the other and each match depends on the ones before it, so they are matched again
+# every run.
+
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+MANIFEST_VERSION = 1
+# length of the sha256 key in front of the hull in <manifest>.hull.wkb
+HULL_KEY_SIZE = 64
+# point cloud walls with an end point this close to an end point of a changed wall are matched again too
+NEIGHBOUR_DISTANCE = 2.0
+
+
+def plain(value):
+    # the value with tuples and numpy numbers turned into what JSON can hold
+    if isinstance(value, dict):
+        return {key: plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [plain(item) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def restore(value):
+    # the inverse of plain: lists of numbers, the points, become tuples again
+    if isinstance(value, dict):
+        return {key: restore(item) for key, item in value.items()}
+    if isinstance(value, list):
+        if all(isinstance(item, (int, float)) for item in value):
+            return tuple(value)
+        return [restore(item) for item in value]
+    return value
+
+
+def context_key(*parts):
+    # hash of everything a match depends on besides the point cloud walls
+    return hashlib.sha256(json.dumps(plain(parts), sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def end_points(record):
+    return [point[:2] for point in (record.get('base point'), record.get('end point')) if point]
+
+
+class RunManifest:
+    def __init__(self, manifest_path):
+        self.manifest_path = manifest_path
+        self.data = {'version': MANIFEST_VERSION, 'files': {}, 'matches': {}, 'scan': None}
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                data = json.load(f)
+            if data.get('version') == MANIFEST_VERSION:
+                self.data = data
+            else:
+                print(f"{manifest_path} is from another version, everything is done again")
+        # names of the elements whose record changed, is new or was removed in this run, and the records they had before, by kind
+        self.changed = {}
+        self.previous = {}
+
+    def records(self, kind, file_paths, process):
+        # {element name: record} as process(file_paths) gives it, e.g. process_seg_walls, only the files that changed are given to process
+        from archiveReader import source_hashes, source_stat
+        entries = self.data['files'].setdefault(kind, {})
+        changed = self.changed.setdefault(kind, set())
+        previous = self.previous.setdefault(kind, {})
+        paths = [os.path.abspath(file_path) for file_path in file_paths]
+        for path in set(entries) - set(paths):
+            # files that are not part of the run anymore
+            removed = entries.pop(path)
+            changed.add(removed['name'])
+            previous[removed['name']] = restore(removed['record'])
+
+        # files can be members of archives (see archiveReader.py), their size and time are those of the member and the archive. The files
+        # whose size or time changed are hashed together, the members of a tar archive in one pass over it
+        stats = {path: source_stat(path) for path in paths}
+        to_hash = [path for path in paths if entries.get(path) is None or (entries[path]['size'], entries[path]['mtime_ns']) != stats[path]]
+        digests = source_hashes(to_hash)
+        to_read = []
+        for path in to_hash:
+            size, mtime_ns = stats[path]
+            entry = entries.get(path)
+            digest = digests[path]
+            if entry is not None and entry['hash'] == digest:
+                entry['mtime_ns'] = mtime_ns
+                continue
+            if entry is not None:
+                previous[entry['name']] = restore(entry['record'])
+            entries[path] = {'hash': digest, 'size': size, 'mtime_ns': mtime_ns, 'name': None, 'record': None}
+            to_read.append(path)
+
+        fresh = process(to_read) if to_read else {}
+        for path in to_read:
+            name = os.path.splitext(os.path.basename(path))[0]
+            entries[path].update(name=name, record=plain(fresh[name]))
+            changed.add(name)
+        print(f"{kind}: {len(to_read)} of {len(paths)} files read, the records of the others were kept")
+        return {entries[path]['name']: fresh[entries[path]['name']] if path in to_read else restore(entries[path]['record'])
+                for path in paths}
+
+    def matches(self, kind, wall_dict, key, match):
+        # the (point cloud wall, GlobalId) matches of all walls of wall_dict, with match(walls) called only for the walls that changed and
+        # their neighbours. key is the context_key of the IFC walls and parameters, when it changed every wall is matched again
+        stored = self.data['matches'].get(kind)
+        if stored is None or stored['key'] != key:
+            to_match = list(wall_dict)
+        else:
+            changed = self.changed.get(kind, set())
+            moved = [point for name in changed for record in (wall_dict.get(name), self.previous.get(kind, {}).get(name)) if record
+                     for point in end_points(record)]
+            to_match = [name for name in wall_dict if name in changed or name not in stored['walls'] or
+                        self.is_neighbour(wall_dict[name], moved)]
+        new_matches = match({name: wall_dict[name] for name in to_match}) if to_match else []
+
+        matched_again = set(to_match)
+        matches_of_wall = {name: [] for name in wall_dict}
+        for name, guids in (stored or {}).get('walls', {}).items():
+            if name in matches_of_wall and name not in matched_again:
+                matches_of_wall[name] = guids
+        for name, guid in new_matches:
+            matches_of_wall[name].append(guid)
+        self.data['matches'][kind] = {'key': key, 'walls': matches_of_wall}
+        print(f"{kind}: {len(to_match)} of {len(wall_dict)} walls matched again, the matches of the others were kept")
+        return [(name, guid) for name, guids in matches_of_wall.items() for guid in guids]
+
+    @staticmethod
+    def is_neighbour(record, points):
+        if not points:
+            return False
+        own = end_points(record)
+        if not own:
+            return False
+        distances = np.linalg.norm(np.asarray(own, dtype=float)[:, None, :] - np.asarray(points, dtype=float)[None, :, :], axis=2)
+        return bool((distances <= NEIGHBOUR_DISTANCE).any())
+
+    def hull(self, scan_file, parameters, compute):
+        # the alpha hull of the scan, compute() is only called when the scan or the parameters changed since the hull was kept
+        from shapely import wkb
+        from archiveReader import scan_files, source_hashes, source_stat
+        hull_path = self.manifest_path + '.hull.wkb'
+        # a scan can be several GB, it is only hashed again when its size or modification time changed. It can be a glob of several files
+        # (see scan_files in archiveReader.py), which are kept together
+        files = scan_files(scan_file)
+        scan = [[os.path.abspath(file), *source_stat(file)] for file in files]
+        kept = self.data.get('scan')
+        if not isinstance(kept, dict) or kept['files'] != scan:
+            hashes = source_hashes(files)
+            self.data['scan'] = {'files': scan, 'hash': context_key([hashes[file] for file in files])}
+        key = context_key(self.data['scan']['hash'], parameters)
+        # the key is kept in the file in front of the hull, and not only in the manifest, which is saved at the end of a run that went
+        # well: a run that failed after its hull was written must not leave a hull that is taken for the one of the kept key
+        if os.path.exists(hull_path):
+            with open(hull_path, 'rb') as f:
+                kept_key, hull_wkb = f.read(HULL_KEY_SIZE), f.read()
+            if kept_key == key.encode('ascii'):
+                print("The alpha hull of the scan did not change, it was kept")
+                return wkb.loads(hull_wkb)
+        hull = compute()
+        with open(hull_path + '.tmp', 'wb') as f:
+            f.write(key.encode('ascii'))
+            f.write(wkb.dumps(hull))
+        os.replace(hull_path + '.tmp', hull_path)
+        return hull
+
+    def save(self):
+        # written under a temporary name first, so an interrupted save leaves the previous manifest
+        from ifcWriter import replace_file
+        directory = os.path.dirname(os.path.abspath(self.manifest_path))
+        handle, temporary_path = tempfile.mkstemp(prefix='.tmp_', suffix='.json', dir=directory)
+        with os.fdopen(handle, 'w') as f:
+            json.dump(self.data, f)
+        replace_file(temporary_path, self.manifest_path)
+
+
+def incremental_wallMatcher(model, wall_dict, manifest, report=None):
+    # the same result as wallMatcher (see wallChecker.py), matching again only the walls that changed since the manifest was saved
+    from wallChecker import extrPoints, match_walls, record_wall_matches
+    ifc_walls = [(ifc_wall.GlobalId, extrPoints(ifc_wall)) for ifc_wall in model.by_type("IfcWallStandardCase")]
+    matches = manifest.matches('walls', wall_dict, context_key(ifc_walls), lambda walls: match_walls(walls, ifc_walls))
+    return record_wall_matches(wall_dict, [guid for guid, _ in ifc_walls], matches, report=report)
+
+
+def incremental_wallMatcherRM(model, wall_dict, alpha_hull, manifest, buffer_size=0.55, report=None):
+    # the same result as wallMatcherRM (see wallCheckerRM.py), matching again only the walls that changed since the manifest was saved
+    from wallCheckerRM import match_walls_rm, record_wall_matches_rm, scanned_ifc_walls
+    in_scope, matchable = scanned_ifc_walls(model, alpha_hull, buffer_size)
+    matches = manifest.matches('walls_rm', wall_dict, context_key(in_scope, matchable), lambda walls: match_walls_rm(walls, matchable))
+    return record_wall_matches_rm(wall_dict, in_scope, matches, report=report)
@@ -0,0 +1,89 @@
+# This code is part of the Master Thesis of Jean van der Meer presented to the Eindhoven University of Technology
+# Point clouds kept in memory as float32. A scan read into a float64 array takes 24 bytes per point, twice what a millimetre accurate
+# scan needs, but float32 alone is not enough for georeferenced scans: at coordinates of e.g. 155000 m its step is about 1.5 cm. Here
+# the points are kept as float32 offsets from a float64 origin near the middle of the scan, which keeps them accurate to a small fraction
+# of a millimetre for scans of a few kilometres, in half the memory. LocalPoints gives world coordinates (float64) at its edges: its
+# min and max, points[indices] and points[:, axis], and world() for all points, so the functions that take a point cloud, e.g.
+# voxel_grid_downsample and hull_z_range in wallCheckerRM.py, work on it as on an array. The viewer does not need world coordinates at
+# all, the origin is set as the translation of the point cloud (see make_point_cloud in pointCloudDisplay.py), which also keeps
+# georeferenced scans from shaking in the float32 buffers of the graphics card.
+
+import numpy as np
+
+# points converted to float64 at a time, e.g. for the voxels of voxel_grid_downsample
+BLOCK_POINTS = 1 << 20
+
+
+def local_origin(points):
+    # the whole numbers nearest to the middle of the bounding box of (a first part of) the points
+    return np.round((points.min(axis=0) + points.max(axis=0)) / 2.0) if len(points) else np.zeros(3)
+
+
+class LocalPoints:
+    def __init__(self, local, origin):
+        self.local = np.ascontiguousarray(local, dtype=np.float32).reshape(-1, 3)
+        self.origin = np.asarray(origin, dtype=np.float64)
+
+    @classmethod
+    def from_world(cls, points, origin=None):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        origin = local_origin(points) if origin is None else np.asarray(origin, dtype=np.float64)
+        return cls(points - origin, origin)
+
+    @classmethod
+    def from_blocks(cls, blocks):
+        # LocalPoints of world coordinates given in blocks (float64 arrays), with the origin taken from the first block, so the float64
+        # coordinates of the whole cloud are never in memory at once
+        origin, local = None, []
+        for block in blocks:
+            block = np.asarray(block, dtype=np.float64).reshape(-1, 3)
+            if origin is None:
+                origin = local_origin(block)
+            local.append((block - origin).astype(np.float32))
+        return cls(np.concatenate(local) if local else np.empty((0, 3), dtype=np.float32), origin if origin is not None else np.zeros(3))
+
+    def __len__(self):
+        return len(self.local)
+
+    @property
+    def shape(self):
+        return self.local.shape
+
+    @property
+    def nbytes(self):
+        return self.local.nbytes + self.origin.nbytes
+
+    def __getitem__(self, key):
+        # world coordinates of a selection, e.g. points[indices] or points[:, 2]
+        rows, columns = key if isinstance(key, tuple) else (key, slice(None))
+        return self.local[rows, columns] + self.origin[columns]
+
+    def min(self, axis=None, out=None):
+        return self.reduce(np.min, axis)
+
+    def max(self, axis=None, out=None):
+        return self.reduce(np.max, axis)
+
+    def reduce(self, function, axis):
+        if axis == 0:
+            return function(self.local, axis=0) + self.origin
+        return function(self.world(), axis=axis)
+
+    def world(self):
+        # all points as an (n, 3) float64 array
+        return self.local + self.origin
+
+    def blocks(self, size=BLOCK_POINTS):
+        # the world coordinates in float64 blocks of size points
+        for start in range(0, len(self.local), size):
+            yield self.local[start:start + size] + self.origin
+
+
+def world_blocks(points, size=BLOCK_POINTS):
+    # float64 blocks of the world coordinates of an array or of LocalPoints
+    if isinstance(points, LocalPoints):
+        yield from points.blocks(size)
+        return
+    points = np.asarray(points)
+    for start in range(0, len(points), size):
+        yield points[start:start + size]
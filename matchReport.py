@@ -0,0 +1,80 @@
+# This code is part of the Master Thesis of Jean van der Meer presented to the Eindhoven University of Technology
+# One report for every element type. Walls used to write their own Excel file, columns returned a dictionary that was shown in a pop-up
+# and ceilings only printed to the console, so collecting the results of a whole building meant scraping the console output. Here every
+# updater appends a MatchRecord (element kind, IFC GlobalId, matched point cloud element, deltas and the action taken) to the same
+# MatchReport, and each record is written to disk as soon as it is added, so a crash in the middle of a run still leaves the results
+# of everything that was processed until then. Adding a record is just a dictionary and a line written to an open file, which is cheap
+# enough to leave the report on for every run. The updaters accept report=None, in which case nothing is recorded.
+
+from collections import Counter, namedtuple
+from datetime import datetime
+
+# element kinds
+WALL = 'wall'
+COLUMN = 'column'
+CEILING = 'ceiling'
+
+# actions taken on an element
+MATCHED = 'matched'  # IFC element confirmed by point cloud data, kept as it is
+UPDATED = 'updated'  # IFC element matched and its position or elevation changed to the point cloud data
+CREATED = 'created'  # new IFC element created from a point cloud element without a match
+DELETED = 'deleted'  # IFC element without a match in the scanned area, removed from the model
+TO_CREATE = 'to create'  # point cloud element without a match, reported by a check that does not change the model
+TO_DELETE = 'to delete'  # IFC element without a match, reported by a check that does not change the model
+NOT_CHECKED = 'not checked'  # IFC element that cannot be compared to the point cloud data, e.g. columns embedded in walls
+
+MATCH_REPORT_FIELDS = ['kind', 'ifc_guid', 'cloud_element', 'action', 'dx', 'dy', 'dz', 'detail', 'time']
+
+MatchRecord = namedtuple('MatchRecord', MATCH_REPORT_FIELDS)
+
+
+class MatchReport:
+    # report_files is one file name or a list of them, the format is chosen by the extension (see reportWriter.py). The line based
+    # formats (.jsonl and .csv) are flushed after every record, the Excel and Parquet formats are only written when the report is closed,
+    # so they are not crash safe. With report_files=None the records are only kept in memory
+    def __init__(self, report_files=None, keep_records=False):
+        self.report_files = report_files
+        self.sink = None
+        if report_files:
+            from reportWriter import open_report_sinks
+            self.sink = open_report_sinks(report_files, column_widths={'A': 10, 'B': 26, 'C': 20, 'D': 14, 'H': 60, 'I': 20})
+            self.sink.write_header(MATCH_REPORT_FIELDS)
+        # keeping every record in memory is optional, the counts are always kept
+        self.records = [] if keep_records or not report_files else None
+        self.counts = Counter()
+
+    def add(self, kind, ifc_guid, cloud_element, action, deltas=None, detail=''):
+        # deltas is an optional (dx, dy, dz) tuple with the change applied to the element, in the units of the model
+        dx, dy, dz = (None, None, None) if deltas is None else (float(deltas[0]), float(deltas[1]), float(deltas[2]))
+        record = MatchRecord(kind, ifc_guid, cloud_element, action, dx, dy, dz, detail, datetime.now().isoformat(timespec='seconds'))
+        if self.sink is not None:
+            self.sink.write_row(list(record))
+        if self.records is not None:
+            self.records.append(record)
+        self.counts[(kind, action)] += 1
+        return record
+
+    def summary(self):
+        # e.g. {'wall': {'matched': 12, 'created': 2}, 'column': {'updated': 3}}
+        summary = {}
+        for (kind, action), count in self.counts.items():
+            summary.setdefault(kind, {})[action] = count
+        return summary
+
+    def close(self):
+        if self.sink is not None:
+            self.sink.close()
+            self.sink = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def new_match_report(prefix='match_report', extensions=('.jsonl',)):
+    # report named with the date and time, like the modified IFC files
+    formatted_datetime = datetime.now().strftime("%d%m%y_%H%M")
+    return MatchReport([f'{prefix}_{formatted_datetime}{extension}' for extension in extensions])
@@ -0,0 +1,150 @@
+# This code is part of the Master Thesis of Jean van der Meer presented to the Eindhoven University of Technology
+# Export of the model as a binary glTF (.glb) triangle mesh. STEP files made with IfcConvert are heavy, and as mentioned in the README of
+# the data, even the EMC model had to be simplified because viewers struggled to load it. A .glb is a compact binary mesh that loads much
+# faster, also in web viewers. Every IFC product becomes a node named by its GlobalId (with its IFC class and name in the extras of the
+# node), with one primitive per IFC material of the element. The triangles come straight from the geometry iterator of IfcOpenShell, so
+# an updated model can be exported from memory without being written to IFC and converted first.
+
+import json
+import struct
+
+import numpy as np
+
+import ifcopenshell
+import ifcopenshell.geom
+
+# colour for surfaces that have no style in the IFC file
+DEFAULT_RGBA = (0.7, 0.7, 0.7, 1.0)
+
+# glTF constants
+FLOAT = 5126
+UNSIGNED_INT = 5125
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+# IFC models are Z-up and glTF is Y-up, the root node rotates the building -90 degrees around the X axis
+Z_UP_TO_Y_UP = [-0.7071068, 0.0, 0.0, 0.7071068]
+
+
+def mesh_settings():
+    # triangles in world coordinates, not OCC shapes like in ifcTessellator.geometry_settings()
+    settings = ifcopenshell.geom.settings()
+    if hasattr(settings, 'USE_WORLD_COORDS'):
+        settings.set(settings.USE_WORLD_COORDS, True)
+    else:
+        settings.set('use-world-coords', True)
+    return settings
+
+
+def material_rgba(material):
+    # the diffuse colour is a tuple in IfcOpenShell 0.7 and an object with r(), g() and b() in 0.8
+    diffuse = getattr(material, 'diffuse', None)
+    if diffuse is None:
+        return DEFAULT_RGBA
+    rgb = (diffuse.r(), diffuse.g(), diffuse.b()) if hasattr(diffuse, 'r') else tuple(diffuse)[:3]
+    transparency = getattr(material, 'transparency', 0.0) or 0.0
+    if transparency != transparency:  # NaN when the style has no transparency
+        transparency = 0.0
+    return (float(rgb[0]), float(rgb[1]), float(rgb[2]), 1.0 - float(transparency))
+
+
+class GlbBuilder:
+    # collects the binary buffer and the JSON of the glTF file while the products are added
+    def __init__(self):
+        self.binary = bytearray()
+        self.gltf = {'asset': {'version': '2.0', 'generator': 'Python Scan to Ifc Updater'},
+                     'scene': 0, 'scenes': [{'nodes': [0]}],
+                     'nodes': [{'name': 'IfcProject', 'rotation': Z_UP_TO_Y_UP, 'children': []}],
+                     'meshes': [], 'materials': [], 'accessors': [], 'bufferViews': []}
+        self.material_indices = {}
+
+    def add_view(self, array, target):
+        # bufferViews have to start at a multiple of 4 bytes
+        self.binary.extend(b'\x00' * (-len(self.binary) % 4))
+        data = array.tobytes()
+        self.gltf['bufferViews'].append({'buffer': 0, 'byteOffset': len(self.binary), 'byteLength': len(data), 'target': target})
+        self.binary.extend(data)
+        return len(self.gltf['bufferViews']) - 1
+
+    def add_accessor(self, array, component_type, accessor_type, target, with_bounds=False):
+        accessor = {'bufferView': self.add_view(array, target), 'componentType': component_type,
+                    'count': int(array.shape[0]), 'type': accessor_type}
+        if with_bounds:
+            # POSITION accessors need their bounds
+            accessor['min'] = array.min(axis=0).tolist()
+            accessor['max'] = array.max(axis=0).tolist()
+        self.gltf['accessors'].append(accessor)
+        return len(self.gltf['accessors']) - 1
+
+    def material(self, rgba):
+        rgba = tuple(round(c, 4) for c in rgba)
+        if rgba not in self.material_indices:
+            material = {'pbrMetallicRoughness': {'baseColorFactor': list(rgba), 'metallicFactor': 0.0, 'roughnessFactor': 1.0},
+                        'doubleSided': True}
+            if rgba[3] < 1.0:
+                material['alphaMode'] = 'BLEND'
+            self.gltf['materials'].append(material)
+            self.material_indices[rgba] = len(self.gltf['materials']) - 1
+        return self.material_indices[rgba]
+
+    def add_product(self, product, geometry):
+        verts = np.asarray(geometry.verts, dtype=np.float32).reshape(-1, 3)
+        faces = np.asarray(geometry.faces, dtype=np.uint32).reshape(-1, 3)
+        if len(verts) == 0 or len(faces) == 0:
+            return False
+        materials = getattr(geometry, 'materials', None)
+        materials = list(materials) if materials is not None else []
+        material_ids = getattr(geometry, 'material_ids', None)
+        material_ids = np.asarray(material_ids if material_ids is not None else [], dtype=np.int64)
+        if len(material_ids) != len(faces):
+            material_ids = np.full(len(faces), -1, dtype=np.int64)
+        # the vertices are shared by all primitives of the element, the triangles are split by material
+        position = self.add_accessor(verts, FLOAT, 'VEC3', ARRAY_BUFFER, with_bounds=True)
+        primitives = []
+        for material_id in np.unique(material_ids):
+            indices = np.ascontiguousarray(faces[material_ids == material_id].reshape(-1))
+            rgba = material_rgba(materials[material_id]) if 0 <= material_id < len(materials) else DEFAULT_RGBA
+            primitives.append({'attributes': {'POSITION': position},
+                               'indices': self.add_accessor(indices, UNSIGNED_INT, 'SCALAR', ELEMENT_ARRAY_BUFFER),
+                               'material': self.material(rgba)})
+        self.gltf['meshes'].append({'name': product.GlobalId, 'primitives': primitives})
+        self.gltf['nodes'].append({'name': product.GlobalId, 'mesh': len(self.gltf['meshes']) - 1,
+                                   'extras': {'ifc_type': product.is_a(), 'name': product.Name or ''}})
+        self.gltf['nodes'][0]['children'].append(len(self.gltf['nodes']) - 1)
+        return True
+
+    def write(self, file_path):
+        # GLB container: 12 byte header, JSON chunk padded with spaces, BIN chunk padded with zeros. glTF does not allow empty arrays, so
+        # the arrays nothing was added to are left out, and the buffer and the BIN chunk when there is no binary data
+        self.binary.extend(b'\x00' * (-len(self.binary) % 4))
+        gltf = {key: value for key, value in self.gltf.items() if value != []}
+        if self.binary:
+            gltf['buffers'] = [{'byteLength': len(self.binary)}]
+        if not gltf['nodes'][0]['children']:
+            gltf['nodes'] = [{key: value for key, value in gltf['nodes'][0].items() if key != 'children'}] + gltf['nodes'][1:]
+        json_chunk = json.dumps(gltf, separators=(',', ':')).encode('utf-8')
+        json_chunk += b' ' * (-len(json_chunk) % 4)
+        total_length = 12 + 8 + len(json_chunk) + (8 + len(self.binary) if self.binary else 0)
+        with open(file_path, 'wb') as f:
+            f.write(struct.pack('<4sII', b'glTF', 2, total_length))
+            f.write(struct.pack('<I4s', len(json_chunk), b'JSON'))
+            f.write(json_chunk)
+            if self.binary:
+                f.write(struct.pack('<I4s', len(self.binary), b'BIN\x00'))
+                f.write(self.binary)
+        return total_length
+
+
+def export_glb(model, file_path, products=None, num_threads=None):
+    # Write the model (or only the given products) as a .glb file and return the number of elements written. A model without any
+    # tessellated product is not exported, a ValueError is raised instead of writing an empty file
+    from ifcTessellator import iterate_shapes
+    builder = GlbBuilder()
+    count = 0
+    for product, geometry, _ in iterate_shapes(model, products=products, num_threads=num_threads, settings=mesh_settings()):
+        if builder.add_product(product, geometry):
+            count += 1
+    if not count:
+        raise ValueError(f'Nothing to export to {file_path}, the model has no products with geometry')
+    size = builder.write(file_path)
+    print(f'{count} elements exported to {file_path} ({size / 1e6:.1f} MB)')
+    return count
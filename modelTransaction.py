@@ -0,0 +1,68 @@
+# This code is part of the Master Thesis of Jean van der Meer presented to the Eindhoven University of Technology
+# Transactions around the updaters. The updaters change the model in place, so trying another threshold or another selection of point
+# clouds meant opening the IFC file again, which parses and converts the whole building. Here the changes of an update are recorded by
+# the transactions of IfcOpenShell (begin_transaction, end_transaction, discard_transaction and undo), which keep the inverse of every
+# entity created, removed or edited, so rolling an update back only undoes those changes instead of reading the file again. Versions of
+# IfcOpenShell without transactions get a snapshot of the model as text instead, and rolling back then parses that snapshot, which gives
+# a new model object, so rollback() and undo() always return the model to use afterwards.
+
+
+class ModelTransaction:
+    def __init__(self, model):
+        self.model = model
+        self.uses_history = hasattr(model, 'begin_transaction') and hasattr(model, 'discard_transaction')
+        self.snapshot = None
+        self.active = False
+        self.committed = False
+
+    def begin(self):
+        if self.uses_history:
+            self.model.begin_transaction()
+        else:
+            self.snapshot = self.model.to_string()
+        self.active = True
+        return self
+
+    def commit(self):
+        # keep the changes, they can still be undone with undo() as long as no later transaction of the model was committed after it
+        if self.uses_history:
+            self.model.end_transaction()
+        self.active = False
+        self.committed = True
+        return self.model
+
+    def rollback(self):
+        # undo the changes made since begin() and return the model as it was
+        self.active = False
+        if self.uses_history:
+            self.model.discard_transaction()
+            return self.model
+        return self._restore_snapshot()
+
+    def undo(self):
+        # undo the changes of a committed transaction, it has to be the last one committed for the model
+        if not self.committed:
+            raise ValueError('Only committed transactions can be undone, use rollback() for an active one')
+        self.committed = False
+        if self.uses_history:
+            self.model.undo()
+            return self.model
+        return self._restore_snapshot()
+
+    def _restore_snapshot(self):
+        import ifcopenshell
+        self.model = ifcopenshell.file.from_string(self.snapshot)
+        self.snapshot = None
+        return self.model
+
+    def __enter__(self):
+        return self.begin()
+
+    def __exit__(self, exc_type, exc, tb):
+        # committed when the block ends normally, rolled back when it raises
+        if self.active:
+            if exc_type is None:
+                self.commit()
+            else:
+                self.rollback()
+        return False
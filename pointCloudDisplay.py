@@ -0,0 +1,95 @@
+# This code is part of the Master Thesis of Jean van der Meer presented to the Eindhoven University of Technology
+# Reading and showing point clouds in the OpenCascade viewer. The points used to be read line by line in Python, scaled one coordinate at a
+# time, and added to the Graphic3d_ArrayOfPoints with a Python loop over tuples, which made a scan of 10 million points take far longer to
+# show than necessary. Here the file is parsed in bulk into a NumPy array, the scale needed to overlap with STEP geometry is applied as a
+# transformation of the displayed object instead of being multiplied into every coordinate, and the array is handed to OpenCascade in one
+# pass over plain Python floats. When the file has R, G, B columns the points are shown with their own colours.
+# The time spent on each step is printed, to keep track of where the time goes for large scans.
+
+import time
+
+import numpy as np
+
+# standard colour of point clouds without colours, blue
+DEFAULT_COLOR = (0.0, 0.0, 1.0)
+
+
+def read_point_cloud_array(file_path):
+    # Returns (xyz, rgb): an (n, 3) float64 array of coordinates and an (n, 3) float32 array of colours between 0 and 1, or None when the
+    # file only has coordinates. As the line by line reader did, every line with at least 3 values is a point and the others are skipped:
+    # the columns are fixed to x y z r g b, so shorter lines are filled with NaN instead of deciding the number of columns from the first
+    # line. Points of a coloured cloud whose line has no colour get DEFAULT_COLOR. A .qpc file is read as a quantized point cloud (see
+    # quantizedCloud.py)
+    import pandas as pd
+    from quantizedCloud import QuantizedCloud, is_quantized
+    start = time.perf_counter()
+    if is_quantized(file_path):
+        xyz, colors = QuantizedCloud(file_path).read(colors=True)
+        print(f"Point cloud read: {len(xyz)} points in {time.perf_counter() - start:.2f} s")
+        return xyz, None if colors is None else colors.astype(np.float32) / 255.0
+    names = ['X', 'Y', 'Z', 'R', 'G', 'B']
+    try:
+        data = pd.read_csv(file_path, sep=r'\s+', header=None, names=names, usecols=range(6), engine='c')
+    except ValueError:
+        # no line has 6 values, so the file has no colours
+        try:
+            data = pd.read_csv(file_path, sep=r'\s+', header=None, names=names[:3], usecols=range(3), engine='c')
+        except ValueError:
+            return np.empty((0, 3)), None
+    values = data.reindex(columns=names).to_numpy(dtype=np.float64, na_value=np.nan)
+    values = values[~np.isnan(values[:, :3]).any(axis=1)]
+    xyz = np.ascontiguousarray(values[:, :3])
+    rgb = None
+    colored = ~np.isnan(values[:, 3:6]).any(axis=1)
+    if colored.any():
+        rgb = values[:, 3:6].astype(np.float32)
+        # colours are usually stored from 0 to 255, OpenCascade expects them from 0 to 1
+        if rgb[colored].max() > 1.0:
+            rgb /= 255.0
+        rgb[~colored] = DEFAULT_COLOR
+    print(f"Point cloud read: {len(xyz)} points in {time.perf_counter() - start:.2f} s")
+    return xyz, rgb
+
+
+def make_point_cloud(points, colors=None, scale=1.0, point_size=5.0, log=True):
+    # AIS_PointCloud of an (n, 3) array (or a list of (x, y, z) tuples), with optional per point colours (n, 3) between 0 and 1. A scale
+    # different from 1 is set as the local transformation of the object, so the coordinates themselves are not changed. points can also
+    # be LocalPoints (see localPoints.py), which are uploaded around their origin, and the origin is set as the translation of the object
+    from OCC.Core.Graphic3d import Graphic3d_ArrayOfPoints
+    from OCC.Core.AIS import AIS_PointCloud
+    from OCC.Core.Quantity import Quantity_Color, Quantity_TOC_RGB
+    from OCC.Core.gp import gp_Trsf, gp_Vec
+    from localPoints import LocalPoints
+
+    start = time.perf_counter()
+    origin = None
+    if isinstance(points, LocalPoints):
+        points, origin = points.local, points.origin
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    has_colors = colors is not None and len(colors) == len(points)
+    points_3d = Graphic3d_ArrayOfPoints(len(points), has_colors)
+    # tolist() converts the whole array to Python floats in C, and the bound methods avoid an attribute lookup per point
+    add_vertex = points_3d.AddVertex
+    if has_colors:
+        set_vertex_color = points_3d.SetVertexColor
+        for index, ((x, y, z), (r, g, b)) in enumerate(zip(points.tolist(), np.asarray(colors, dtype=np.float64).tolist()), start=1):
+            add_vertex(x, y, z)
+            set_vertex_color(index, r, g, b)
+    else:
+        for x, y, z in points.tolist():
+            add_vertex(x, y, z)
+
+    point_cloud = AIS_PointCloud()
+    point_cloud.SetPoints(points_3d)
+    if not has_colors:
+        point_cloud.SetColor(Quantity_Color(*DEFAULT_COLOR, Quantity_TOC_RGB))
+    point_cloud.SetWidth(point_size)
+    if scale != 1.0 or origin is not None:
+        transformation = gp_Trsf()
+        transformation.SetScaleFactor(scale)
+        if origin is not None:
+            transformation.SetTranslationPart(gp_Vec(*(origin * scale).tolist()))
+        point_cloud.SetLocalTransformation(transformation)
+    if log:
+        print(f"Point cloud uploaded: {len(points)} points in {time.perf_counter() - start:.2f} s")
+    return point_cloud
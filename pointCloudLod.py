@@ -0,0 +1,269 @@
+# This code is part of the Master Thesis of Jean van der Meer presented to the Eindhoven University of Technology
+# Level of detail for point clouds in the viewer. A full scan of a few hundred MB used to go into one AIS_PointCloud, so every point was
+# uploaded and drawn at every frame, and the memory grew with each cloud opened in the 'Point Cloud' menu. Here every cloud is stored in
+# an octree whose nodes each keep a uniform sample of the points inside them (the points of a node are not repeated in its children), so
+# the root alone is a coarse version of the whole scan and every level down adds detail. The octree is built once per file and kept in
+# the conversion cache (see conversionCache.py), where the points are stored as .npy files that are opened memory mapped, so only the
+# nodes that are shown are read from disk. The viewer shows the nodes that look biggest on screen first, within a budget of points for
+# all clouds together, and when the camera moves or zooms in, nodes that came into view or became big enough are added and the others
+# are removed. The points are kept as float32 around an origin of the cloud (see localPoints.py), which halves the memory and the disk
+# space of the octree, and the origin is set as the translation of every node shown.
+
+import heapq
+import math
+import time
+
+import numpy as np
+
+# points kept in every node before its remaining points are passed on to its children
+NODE_CAPACITY = 20000
+MAX_DEPTH = 12
+# points shown at the same time for all clouds together
+DEFAULT_POINT_BUDGET = 2000000
+# nodes smaller than this fraction of the height of the view are not worth refining into
+MIN_SCREEN_SIZE = 0.05
+# bump when the layout of the stored octree changes, so old cache entries are not used
+OCTREE_VERSION = 2
+
+
+class PointCloudOctree:
+    # points (n, 3) and colors (n, 3) or None are ordered by node, the points of node i are points[starts[i]:starts[i] + counts[i]].
+    # points are float32 relative to origin, centers (in world coordinates) and half_sizes describe the cube of each node, children[i]
+    # holds the index of its 8 children or -1
+    def __init__(self, points, colors, starts, counts, centers, half_sizes, children, origin=None):
+        self.points = points
+        self.origin = np.zeros(3) if origin is None else np.asarray(origin, dtype=np.float64)
+        self.colors = colors
+        self.starts = starts
+        self.counts = counts
+        self.centers = centers
+        self.half_sizes = half_sizes
+        self.children = children
+
+    def __len__(self):
+        return len(self.starts)
+
+    def node_points(self, node):
+        # (LocalPoints, colors) of a node, see localPoints.py
+        from localPoints import LocalPoints
+        start, end = int(self.starts[node]), int(self.starts[node] + self.counts[node])
+        colors = self.colors[start:end] if self.colors is not None else None
+        return LocalPoints(self.points[start:end], self.origin), (np.asarray(colors) if colors is not None else None)
+
+    def save(self, nodes_path, points_path, colors_path):
+        with open(nodes_path, 'wb') as f:
+            np.savez(f, starts=self.starts, counts=self.counts, centers=self.centers, half_sizes=self.half_sizes, children=self.children,
+                     origin=self.origin)
+        with open(points_path, 'wb') as f:
+            np.save(f, self.points)
+        with open(colors_path, 'wb') as f:
+            # a cloud without colours is stored with an empty array, so every entry has the same files
+            np.save(f, self.colors if self.colors is not None else np.empty((0, 3), dtype=np.float32))
+
+    @classmethod
+    def load(cls, nodes_path, points_path, colors_path):
+        with np.load(nodes_path) as nodes:
+            tables = [nodes[name] for name in ('starts', 'counts', 'centers', 'half_sizes', 'children', 'origin')]
+        points = np.load(points_path, mmap_mode='r')
+        colors = np.load(colors_path, mmap_mode='r')
+        return cls(points, colors if len(colors) else None, *tables)
+
+
+def build_octree(points, colors=None, node_capacity=NODE_CAPACITY, max_depth=MAX_DEPTH, seed=0):
+    # The points are shuffled once, so the first node_capacity points of any node are a uniform sample of it. The nodes are made level
+    # by level, which keeps the coarse levels together at the start of the arrays. points can be an array or LocalPoints, the octree is
+    # built on the float32 coordinates relative to their origin
+    from localPoints import LocalPoints
+    start_time = time.perf_counter()
+    if not isinstance(points, LocalPoints):
+        points = LocalPoints.from_world(points)
+    origin, points = points.origin, points.local
+    if len(points) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return PointCloudOctree(points, None, empty, empty, np.empty((0, 3)), np.empty(0), np.empty((0, 8), dtype=np.int32), origin)
+    low, high = points.min(axis=0).astype(np.float64), points.max(axis=0).astype(np.float64)
+    half_size = max(float((high - low).max()) / 2.0, 1e-9)
+    center = (low + high) / 2.0
+
+    starts, counts, centers, half_sizes, children = [], [], [], [], []
+    kept = []
+    offset = 0
+    queue = [(np.random.default_rng(seed).permutation(len(points)), center, half_size, 0, -1, -1)]
+    position = 0
+    while position < len(queue):
+        indices, center, half_size, depth, parent, octant = queue[position]
+        position += 1
+        node = len(starts)
+        if parent >= 0:
+            children[parent][octant] = node
+        keep = indices if len(indices) <= node_capacity or depth >= max_depth else indices[:node_capacity]
+        starts.append(offset)
+        counts.append(len(keep))
+        centers.append(center)
+        half_sizes.append(half_size)
+        children.append([-1] * 8)
+        kept.append(keep)
+        offset += len(keep)
+        rest = indices[len(keep):]
+        if len(rest) == 0:
+            continue
+        # octant of every remaining point as a 3 bit code, a stable sort keeps them shuffled within each octant
+        codes = ((points[rest] >= center) * np.array([1, 2, 4])).sum(axis=1)
+        order = np.argsort(codes, kind='stable')
+        rest, codes = rest[order], codes[order]
+        bounds = np.searchsorted(codes, np.arange(9))
+        for child_octant in range(8):
+            if bounds[child_octant] == bounds[child_octant + 1]:
+                continue
+            signs = np.array([1 if child_octant & bit else -1 for bit in (1, 2, 4)])
+            queue.append((rest[bounds[child_octant]:bounds[child_octant + 1]], center + signs * half_size / 2.0, half_size / 2.0,
+                          depth + 1, node, child_octant))
+
+    order = np.concatenate(kept)
+    octree = PointCloudOctree(points[order], np.asarray(colors)[order] if colors is not None else None,
+                              np.array(starts, dtype=np.int64), np.array(counts, dtype=np.int64), np.array(centers) + origin,
+                              np.array(half_sizes), np.array(children, dtype=np.int32), origin)
+    print(f"Octree built: {len(points)} points in {len(octree)} nodes in {time.perf_counter() - start_time:.2f} s")
+    return octree
+
+
+def load_octree(file_path, cache=None, node_capacity=NODE_CAPACITY, max_depth=MAX_DEPTH):
+    # Octree of a point cloud file, from the conversion cache when the same file was opened before with the same settings
+    from conversionCache import ConversionCache, cache_key
+    from pointCloudDisplay import read_point_cloud_array
+    cache = cache if cache is not None else ConversionCache()
+    extensions = ['.octree.npz', '.points.npy', '.colors.npy']
+    key = cache_key(file_path, {'converter': 'point cloud octree', 'version': OCTREE_VERSION,
+                                'node_capacity': node_capacity, 'max_depth': max_depth})
+    cached_paths = cache.get(key, extensions)
+    if cached_paths:
+        print("Point cloud octree loaded from the conversion cache.")
+        return PointCloudOctree.load(*cached_paths)
+    points, colors = read_point_cloud_array(file_path)
+    octree = build_octree(points, colors, node_capacity=node_capacity, max_depth=max_depth)
+    paths = [cache.temporary_path(extension) for extension in extensions]
+    octree.save(*paths)
+    # the cached copy is used from now on, so the arrays in memory can be freed and the points are read from disk as needed
+    return PointCloudOctree.load(*cache.put(key, dict(zip(extensions, paths))))
+
+
+def camera_view(display):
+    # (eye, center, direction, height of the view at the center, orthographic) of the camera of the viewer, rounded so small changes
+    # from redrawing do not count as a move of the camera
+    camera = display.View.Camera()
+    eye, center, direction = camera.Eye(), camera.Center(), camera.Direction()
+    dimensions = camera.ViewDimensions()
+    return (tuple(round(v, 6) for v in (eye.X(), eye.Y(), eye.Z())), tuple(round(v, 6) for v in (center.X(), center.Y(), center.Z())),
+            tuple(round(v, 6) for v in (direction.X(), direction.Y(), direction.Z())),
+            round(dimensions.X(), 6), round(dimensions.Y(), 6), bool(camera.IsOrthographic()))
+
+
+def select_nodes(clouds, view, point_budget=DEFAULT_POINT_BUDGET, min_screen_size=MIN_SCREEN_SIZE):
+    # Set of (cloud index, node) to show. clouds is a list of (octree, scale). Starting from the roots, the node that looks biggest on
+    # screen is taken next, as long as it is in view and fits in the budget, and then its children are considered. The roots are always
+    # taken, so every cloud is at least shown coarsely
+    eye, center, direction, width, height, orthographic = view
+    eye, center, direction = np.array(eye), np.array(center), np.array(direction)
+    center_distance = max(float(np.dot(center - eye, direction)), 1e-9)
+    view_radius = 0.5 * math.hypot(width, height)
+
+    def screen_size(octree, scale, node):
+        # radius of the node relative to the height of the view at its depth, or None when it is out of view
+        node_center = octree.centers[node] * scale
+        radius = float(octree.half_sizes[node]) * scale * math.sqrt(3.0)
+        along = float(np.dot(node_center - eye, direction))
+        lateral = float(np.linalg.norm(node_center - eye - along * direction))
+        depth_factor = 1.0 if orthographic else max(along, 1e-9) / center_distance
+        if not orthographic and along + radius < 0:
+            return None
+        if lateral - radius > view_radius * depth_factor:
+            return None
+        return radius / max(height * depth_factor, 1e-9)
+
+    selected = set()
+    used = 0
+    heap = []
+    for cloud_index, (octree, scale) in enumerate(clouds):
+        if len(octree):
+            selected.add((cloud_index, 0))
+            used += int(octree.counts[0])
+            heap.append((-float('inf'), cloud_index, 0))
+    heapq.heapify(heap)
+    while heap:
+        _, cloud_index, node = heapq.heappop(heap)
+        octree, scale = clouds[cloud_index]
+        if (cloud_index, node) not in selected:
+            if used + int(octree.counts[node]) > point_budget:
+                continue
+            selected.add((cloud_index, node))
+            used += int(octree.counts[node])
+        for child in octree.children[node]:
+            if child < 0:
+                continue
+            size = screen_size(octree, scale, child)
+            if size is not None and size >= min_screen_size:
+                heapq.heappush(heap, (-size, cloud_index, int(child)))
+    return selected
+
+
+class LodViewer:
+    # Keeps the shown nodes of all clouds in the viewer in line with the camera, refresh() is called by a timer of the interface and
+    # only does something when the camera moved
+    def __init__(self, display, point_budget=DEFAULT_POINT_BUDGET, min_screen_size=MIN_SCREEN_SIZE):
+        self.display = display
+        self.point_budget = point_budget
+        self.min_screen_size = min_screen_size
+        self.clouds = []
+        self.shown = {}
+        self.last_view = None
+
+    def add(self, octree, scale=1.0, refresh=True):
+        # with refresh=False nothing is shown yet, for a caller that moves the camera first (e.g. to fit bounding_box()) and then refreshes
+        self.clouds.append((octree, scale))
+        return self.refresh(force=True) if refresh else False
+
+    def bounding_box(self):
+        # Bnd_Box of the root cubes of all clouds, as they are shown, also when none of their nodes is shown yet
+        from OCC.Core.Bnd import Bnd_Box
+        box = Bnd_Box()
+        for octree, scale in self.clouds:
+            if len(octree.centers):
+                low = (octree.centers[0] - octree.half_sizes[0]) * scale
+                high = (octree.centers[0] + octree.half_sizes[0]) * scale
+                box.Update(*low.tolist(), *high.tolist())
+        return box
+
+    def clear(self):
+        context = self.display.GetContext()
+        for ais_point_cloud in self.shown.values():
+            context.Remove(ais_point_cloud, False)
+        self.clouds = []
+        self.shown = {}
+        self.last_view = None
+
+    def refresh(self, force=False):
+        from pointCloudDisplay import make_point_cloud
+        if not self.clouds:
+            return False
+        view = camera_view(self.display)
+        if not force and view == self.last_view:
+            return False
+        self.last_view = view
+        start = time.perf_counter()
+        selected = select_nodes(self.clouds, view, self.point_budget, self.min_screen_size)
+        context = self.display.GetContext()
+        removed = [key for key in self.shown if key not in selected]
+        for key in removed:
+            context.Remove(self.shown.pop(key), False)
+        added = [key for key in selected if key not in self.shown]
+        for key in added:
+            octree, scale = self.clouds[key[0]]
+            points, colors = octree.node_points(key[1])
+            self.shown[key] = make_point_cloud(points, colors=colors, scale=scale, log=False)
+            context.Display(self.shown[key], False)
+        context.UpdateCurrentViewer()
+        if added or removed:
+            shown_points = sum(int(self.clouds[c][0].counts[n]) for c, n in self.shown)
+            print(f"Point cloud detail: {len(added)} nodes added, {len(removed)} removed, {shown_points} points shown "
+                  f"in {time.perf_counter() - start:.2f} s")
+        return True
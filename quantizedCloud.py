@@ -0,0 +1,230 @@
+# This code is part of the Master Thesis of Jean van der Meer presented to the Eindhoven University of Technology
+# Compact point cloud files for the archive of scans. As text, every point takes about 40 bytes (x y z r g b with decimals), and read
+# into float64 it takes 24 bytes of coordinates, while the scans are only accurate to about a millimetre. A .qpc file keeps the
+# coordinates as int32 steps of scale (a millimetre by default) from an origin stored as float64, so georeferenced coordinates keep their
+# precision. The points are sorted along a Morton (Z-order) curve, so points that are close in space are close in the file, and stored in
+# chunks of chunk_points points that are compressed on their own with zlib. The index at the end of the file keeps the bounding box of
+# every chunk, so a reader that only needs part of the scan, e.g. one tile of Room Mode (see tiledRoomMode.py), only reads and
+# decompresses the chunks that reach into it. Colours, when the scan has them, are kept as 3 bytes per point.
+#
+#   python -m quantizedCloud scan.xyz scans/walls/*.txt --scale 0.001
+#
+# writes scan.qpc and a .qpc next to every segmented file. .qpc files can be given anywhere a point cloud is read: the segmented walls,
+# columns and ceilings (in folders as well, see segmented_files in batchUpdater.py), the scan of Room Mode and the 'Point Cloud' menu.
+#
+# File layout: b'QPC1', the compressed chunks one after the other, the index as JSON, and at the end the offset of the index as an
+# unsigned 64 bit integer followed by b'QPC1' again. A chunk holds the coordinates minus the lowest corner of its bounding box as
+# uint32, x, y and z one after the other, with the bytes of each value split into planes (all first bytes, then all second bytes etc)
+# so the mostly zero high bytes compress well, followed by the colours the same way as uint8.
+
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+import zlib
+
+import numpy as np
+
+QPC_EXTENSION = '.qpc'
+QPC_MAGIC = b'QPC1'
+QPC_VERSION = 1
+# a millimetre, in the units of the scans
+DEFAULT_SCALE = 0.001
+DEFAULT_CHUNK_POINTS = 65536
+FOOTER = struct.Struct('<Q4s')
+
+
+def is_quantized(path):
+    return str(path).lower().endswith(QPC_EXTENSION)
+
+
+def morton_order(quantized):
+    # order of the points along a Morton curve of their quantized coordinates, 21 bits per axis
+    bits = int(quantized.max()).bit_length() if len(quantized) else 0
+    cells = (quantized >> max(0, bits - 21)).astype(np.uint64)
+    code = np.zeros(len(quantized), dtype=np.uint64)
+    for axis in range(3):
+        v = cells[:, axis] & np.uint64(0x1fffff)
+        v = (v | v << np.uint64(32)) & np.uint64(0x1f00000000ffff)
+        v = (v | v << np.uint64(16)) & np.uint64(0x1f0000ff0000ff)
+        v = (v | v << np.uint64(8)) & np.uint64(0x100f00f00f00f00f)
+        v = (v | v << np.uint64(4)) & np.uint64(0x10c30c30c30c30c3)
+        v = (v | v << np.uint64(2)) & np.uint64(0x1249249249249249)
+        code |= v << np.uint64(axis)
+    return np.argsort(code, kind='stable')
+
+
+def byte_planes(values):
+    # bytes of the values of every column, split into planes of their first, second etc byte
+    columns = np.ascontiguousarray(values.T)
+    return columns.view(np.uint8).reshape(columns.shape[0], -1, values.itemsize).transpose(0, 2, 1).tobytes()
+
+
+def from_byte_planes(data, count, dtype):
+    itemsize = np.dtype(dtype).itemsize
+    planes = np.frombuffer(data, dtype=np.uint8).reshape(-1, itemsize, count).transpose(0, 2, 1)
+    return np.ascontiguousarray(planes).view(dtype).reshape(-1, count).T
+
+
+def write_quantized_cloud(file_path, points, colors=None, scale=DEFAULT_SCALE, chunk_points=DEFAULT_CHUNK_POINTS):
+    # Write points (n, 3) and optional colors (n, 3) from 0 to 255 as a .qpc file, returns the size of the file in bytes
+    points = np.asarray(points, dtype=np.float64)
+    if points.ndim != 2 or points.shape[1] != 3 or not len(points):
+        raise ValueError('A point cloud to quantize is an (n, 3) array with at least one point')
+    origin = points.min(axis=0)
+    steps = np.round((points - origin) / scale)
+    if steps.max() >= 2 ** 31:
+        raise ValueError(f'The point cloud is too large to store in steps of {scale}, use a larger scale')
+    quantized = steps.astype(np.int32)
+    order = morton_order(quantized)
+    quantized = quantized[order]
+    if colors is not None:
+        colors = np.clip(np.round(np.asarray(colors)[order]), 0, 255).astype(np.uint8)
+
+    chunks = []
+    with open(file_path, 'wb') as f:
+        f.write(QPC_MAGIC)
+        for start in range(0, len(quantized), chunk_points):
+            chunk = quantized[start:start + chunk_points]
+            low, high = chunk.min(axis=0), chunk.max(axis=0)
+            payload = byte_planes((chunk - low).astype(np.uint32))
+            if colors is not None:
+                payload += byte_planes(colors[start:start + chunk_points])
+            data = zlib.compress(payload, 6)
+            chunks.append({'offset': f.tell(), 'size': len(data), 'count': len(chunk), 'min': low.tolist(), 'max': high.tolist()})
+            f.write(data)
+        index = {'version': QPC_VERSION, 'origin': origin.tolist(), 'scale': scale, 'count': len(quantized), 'colors': colors is not None,
+                 'chunks': chunks}
+        index_offset = f.tell()
+        f.write(json.dumps(index).encode('utf-8'))
+        f.write(FOOTER.pack(index_offset, QPC_MAGIC))
+        return f.tell()
+
+
+class QuantizedCloud:
+    # A .qpc file, given as a path (on disk or into an archive, see archiveReader.py) or as a binary file object that can seek. Only the
+    # index is read when it is opened, the chunks are read when points are asked for
+    def __init__(self, source):
+        self.source = source
+        with self.open() as f:
+            f.seek(-FOOTER.size, os.SEEK_END)
+            end = f.tell()
+            index_offset, magic = FOOTER.unpack(f.read(FOOTER.size))
+            if magic != QPC_MAGIC:
+                raise ValueError(f'{self.name()} is not a .qpc point cloud')
+            f.seek(index_offset)
+            index = json.loads(f.read(end - index_offset).decode('utf-8'))
+        if index['version'] != QPC_VERSION:
+            raise ValueError(f"{self.name()} is a .qpc point cloud of version {index['version']}, only version {QPC_VERSION} can be read")
+        self.origin = np.array(index['origin'], dtype=np.float64)
+        self.scale = index['scale']
+        self.count = index['count']
+        self.has_colors = index['colors']
+        self.chunks = index['chunks']
+        # bounding boxes of the chunks in world coordinates, (x min, y min, z min, x max, y max, z max)
+        corners = np.array([chunk['min'] + chunk['max'] for chunk in self.chunks], dtype=np.float64).reshape(-1, 6)
+        self.boxes = np.tile(self.origin, 2) + corners * self.scale
+
+    def name(self):
+        return self.source if isinstance(self.source, str) else getattr(self.source, 'name', 'The file')
+
+    def open(self):
+        from contextlib import nullcontext
+        if isinstance(self.source, str):
+            from archiveReader import open_binary
+            return open_binary(self.source)
+        return nullcontext(self.source)
+
+    def bounds(self):
+        # (lowest corner, highest corner) of all points
+        return self.boxes[:, :3].min(axis=0), self.boxes[:, 3:].max(axis=0)
+
+    def chunks_in(self, box=None):
+        # indices of the chunks whose bounding box reaches into box, (x min, y min, x max, y max) or (x min, y min, z min, x max, y max,
+        # z max), all chunks when box is None
+        if box is None:
+            return list(range(len(self.chunks)))
+        dimensions = len(box) // 2
+        low, high = np.asarray(box[:dimensions]), np.asarray(box[dimensions:])
+        inside = (self.boxes[:, 3:3 + dimensions] >= low).all(axis=1) & (self.boxes[:, :dimensions] <= high).all(axis=1)
+        return np.flatnonzero(inside).tolist()
+
+    def read_chunk(self, f, number):
+        chunk = self.chunks[number]
+        f.seek(chunk['offset'])
+        payload = zlib.decompress(f.read(chunk['size']))
+        count = chunk['count']
+        coordinates_size = count * 3 * 4
+        steps = from_byte_planes(payload[:coordinates_size], count, np.uint32).astype(np.int64) + np.array(chunk['min'], dtype=np.int64)
+        colors = from_byte_planes(payload[coordinates_size:], count, np.uint8) if self.has_colors else None
+        return steps, colors
+
+    def read(self, box=None, colors=False):
+        # (n, 3) float64 world coordinates of the points within box (as for chunks_in, borders included), in the order of the file,
+        # with colors=True (points, colors) where colors is (n, 3) uint8 from 0 to 255, or None when the file has none
+        numbers = self.chunks_in(box)
+        steps, chunk_colors = [np.empty((0, 3), dtype=np.int64)], [np.empty((0, 3), dtype=np.uint8)]
+        with self.open() as f:
+            for number in numbers:
+                chunk_steps, chunk_color = self.read_chunk(f, number)
+                steps.append(chunk_steps)
+                if chunk_color is not None:
+                    chunk_colors.append(chunk_color)
+        points = self.origin + np.concatenate(steps) * self.scale
+        point_colors = np.concatenate(chunk_colors) if self.has_colors else None
+        if box is not None:
+            dimensions = len(box) // 2
+            inside = ((points[:, :dimensions] >= box[:dimensions]) & (points[:, :dimensions] <= box[dimensions:])).all(axis=1)
+            points = points[inside]
+            point_colors = point_colors[inside] if point_colors is not None else None
+        return (points, point_colors) if colors else points
+
+    def blocks(self):
+        # the world coordinates of all points, a float64 block per chunk
+        with self.open() as f:
+            for number in range(len(self.chunks)):
+                yield self.origin + self.read_chunk(f, number)[0] * self.scale
+
+    def read_local(self):
+        # all points as LocalPoints (see localPoints.py), float32 in memory, converted from the file a chunk at a time
+        from localPoints import LocalPoints
+        return LocalPoints.from_blocks(self.blocks())
+
+    def table(self):
+        # all points as the DataFrame of the segmented readers (see read_table in archiveReader.py)
+        import pandas as pd
+        return pd.DataFrame(self.read(), columns=['X', 'Y', 'Z'])
+
+
+def convert_point_cloud(source_path, target_path=None, scale=DEFAULT_SCALE, chunk_points=DEFAULT_CHUNK_POINTS):
+    # .qpc file of a text point cloud (see read_point_cloud_array in pointCloudDisplay.py), by default next to it, returns its path
+    from pointCloudDisplay import read_point_cloud_array
+    target_path = target_path or os.path.splitext(source_path)[0] + QPC_EXTENSION
+    points, colors = read_point_cloud_array(source_path)
+    # read_point_cloud_array gives colours from 0 to 1
+    size = write_quantized_cloud(target_path, points, None if colors is None else colors * 255.0, scale=scale, chunk_points=chunk_points)
+    print(f"{target_path}: {len(points)} points, {size / 1e6:.1f} MB")
+    return target_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='quantizedCloud', description='Convert text point clouds into compact .qpc files.')
+    parser.add_argument('files', nargs='+', help='text point clouds (.txt or .xyz), each is written as a .qpc file next to it')
+    parser.add_argument('--scale', type=float, default=DEFAULT_SCALE, help='step of the stored coordinates (default: %(default)s)')
+    parser.add_argument('--chunk-points', type=int, default=DEFAULT_CHUNK_POINTS, help='points per chunk (default: %(default)s)')
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    try:
+        for file_path in args.files:
+            convert_point_cloud(file_path, scale=args.scale, chunk_points=args.chunk_points)
+    except (OSError, ValueError) as e:
+        print(f'quantizedCloud: {e}', file=sys.stderr)
+        return 1
+    print(f"{len(args.files)} point clouds converted in {time.perf_counter() - start:.1f} s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
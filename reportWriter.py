@@ -0,0 +1,216 @@
+# This code is part of the Master Thesis of Jean van der Meer presented to the Eindhoven University of Technology
+# Report sinks used by the checking and updating modules. The Excel report used to be built as a normal in-memory openpyxl workbook, and
+# then every row was visited a second time to set its number format. Here rows are streamed to the sink as soon as they are produced:
+# the Excel sink uses the write-only mode of openpyxl, which keeps memory flat no matter how many walls a building has, and the
+# CSV, JSON (one record per line) and Parquet sinks can be used by downstream tooling that does not need a spreadsheet.
+# The sink is chosen by the extension of the file name, so resultsExcel(..., report_files=['walls.xlsx', 'walls.csv']) writes both.
+
+import csv
+import json
+import os
+
+# colours used in the reports, green for matched elements and red for elements that have to be deleted or created
+GREEN = "00FF00"
+RED = "FF0000"
+
+
+class ReportSink:
+    # Base sink. A report is a sequence of sections, each section starts with a header row, followed by data rows. Blank rows only
+    # matter for the spreadsheet-like sinks, structured sinks (JSON, Parquet) turn every data row into a record keyed by the header
+    # of the section it belongs to
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.header = None
+        self.rows_written = 0
+
+    def write_header(self, values):
+        self.header = list(values)
+        self._write_header(self.header)
+
+    def write_row(self, values, fills=None, number_formats=None):
+        # fills and number_formats are optional dictionaries of {column index: value}, with the column index starting at 0
+        self._write_row(list(values), fills or {}, number_formats or {})
+        self.rows_written += 1
+
+    def write_blank(self, count=1):
+        for _ in range(count):
+            self._write_blank()
+
+    def record(self, values):
+        # pair the values of a data row with the header of the current section
+        header = self.header or [f'column{i + 1}' for i in range(len(values))]
+        return {header[i] if i < len(header) else f'column{i + 1}': value for i, value in enumerate(values)}
+
+    def _write_header(self, values):
+        pass
+
+    def _write_row(self, values, fills, number_formats):
+        pass
+
+    def _write_blank(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class ExcelReportSink(ReportSink):
+    # openpyxl write-only workbook, rows are serialized into the worksheet as they are appended instead of being kept as cell objects
+    def __init__(self, file_path, column_widths=None):
+        super().__init__(file_path)
+        import openpyxl
+        self.wb = openpyxl.Workbook(write_only=True)
+        self.ws = self.wb.create_sheet()
+        # column widths have to be set before the first row is written in write-only mode
+        for letter, width in (column_widths or {}).items():
+            self.ws.column_dimensions[letter].width = width
+
+    def _cells(self, values, fills, number_formats):
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import PatternFill
+        cells = []
+        for i, value in enumerate(values):
+            if i not in fills and i not in number_formats:
+                cells.append(value)
+                continue
+            cell = WriteOnlyCell(self.ws, value=value)
+            if i in fills:
+                cell.fill = PatternFill(start_color=fills[i], end_color=fills[i], fill_type="solid")
+            if i in number_formats:
+                cell.number_format = number_formats[i]
+            cells.append(cell)
+        return cells
+
+    def _write_header(self, values):
+        self.ws.append(values)
+
+    def _write_row(self, values, fills, number_formats):
+        self.ws.append(self._cells(values, fills, number_formats))
+
+    def _write_blank(self):
+        self.ws.append([])
+
+    def close(self):
+        if self.wb is not None:
+            self.wb.save(self.file_path)
+            self.wb = None
+
+
+class CsvReportSink(ReportSink):
+    # same layout as the spreadsheet, every row is flushed so a partially written report is still readable
+    def __init__(self, file_path):
+        super().__init__(file_path)
+        self.f = open(file_path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.f)
+
+    def _write_header(self, values):
+        self.writer.writerow(values)
+        self.f.flush()
+
+    def _write_row(self, values, fills, number_formats):
+        self.writer.writerow(values)
+        self.f.flush()
+
+    def _write_blank(self):
+        self.writer.writerow([])
+
+    def close(self):
+        if not self.f.closed:
+            self.f.close()
+
+
+class JsonReportSink(ReportSink):
+    # JSON Lines, one record per data row, keyed by the header of the section the row belongs to
+    def __init__(self, file_path):
+        super().__init__(file_path)
+        self.f = open(file_path, 'w', encoding='utf-8')
+
+    def _write_row(self, values, fills, number_formats):
+        self.f.write(json.dumps(self.record(values), default=str) + '\n')
+        self.f.flush()
+
+    def close(self):
+        if not self.f.closed:
+            self.f.close()
+
+
+class ParquetReportSink(ReportSink):
+    # Parquet is a columnar format and cannot be appended to row by row, so the records are collected and written once when the sink
+    # is closed. The section (first header cell) is stored as a column so the different tables of a report can be told apart
+    def __init__(self, file_path):
+        super().__init__(file_path)
+        self.records = []
+
+    def _write_row(self, values, fills, number_formats):
+        record = {'section': self.header[0] if self.header else ''}
+        record.update({key: (value if value is None or isinstance(value, (int, float, bool)) else str(value))
+                       for key, value in self.record(values).items()})
+        self.records.append(record)
+
+    def close(self):
+        if self.records is not None:
+            import pandas as pd
+            pd.DataFrame.from_records(self.records).to_parquet(self.file_path, index=False)
+            self.records = None
+
+
+class MultiReportSink(ReportSink):
+    # fans every row out to several sinks, e.g. an Excel report for the user and a JSON report for the tooling around it
+    def __init__(self, sinks):
+        super().__init__(None)
+        self.sinks = list(sinks)
+
+    def write_header(self, values):
+        for sink in self.sinks:
+            sink.write_header(values)
+
+    def write_row(self, values, fills=None, number_formats=None):
+        for sink in self.sinks:
+            sink.write_row(values, fills, number_formats)
+        self.rows_written += 1
+
+    def write_blank(self, count=1):
+        for sink in self.sinks:
+            sink.write_blank(count)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+def open_report_sink(file_path, column_widths=None):
+    # pick the sink based on the extension of the report file
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in ('.xlsx', '.xlsm'):
+        return ExcelReportSink(file_path, column_widths=column_widths)
+    if extension == '.csv':
+        return CsvReportSink(file_path)
+    if extension in ('.json', '.jsonl', '.ndjson'):
+        return JsonReportSink(file_path)
+    if extension in ('.parquet', '.pq'):
+        return ParquetReportSink(file_path)
+    raise ValueError(f'Unsupported report format: {file_path}')
+
+
+def open_report_sinks(file_paths, column_widths=None):
+    # one or several report files, returned as a single sink
+    if isinstance(file_paths, str):
+        file_paths = [file_paths]
+    sinks = [open_report_sink(file_path, column_widths=column_widths) for file_path in file_paths]
+    return sinks[0] if len(sinks) == 1 else MultiReportSink(sinks)
+
+
+def first_index_lookup(keys, values):
+    # Dictionary equivalent of values[keys.index(key)]: list.index returns the first occurrence, so later duplicates are not allowed to
+    # overwrite an earlier entry. Building this once makes the lookups of the report O(1) instead of a scan of the list per row
+    lookup = {}
+    for key, value in zip(keys, values):
+        lookup.setdefault(key, value)
+    return lookup
@@ -0,0 +1,62 @@
+# This code is part of the Master Thesis of Jean van der Meer presented to the Eindhoven University of Technology
+# Benchmark of the time it takes to import the modules of the tool. Every module is imported in a fresh Python interpreter a few times, and
+# the median time is printed together with the heavy libraries the import pulled in. The plotting, hull and viewer libraries (matplotlib,
+# alphashape, scipy, pythonOCC, PyQt5) and pandas are imported in the functions that use them, so e.g. a command line run of the
+# matching (see batchUpdater.py) should not show them here.
+#
+#   python startupBenchmark.py                      all modules, 5 runs each
+#   python startupBenchmark.py wallCheckerRM -n 10  only the given modules
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+MODULES = ['wallChecker', 'wallCheckerRM', 'wallRemover', 'wallRemoverRM', 'wallUpdaTor', 'columnUpdaTor', 'ceilingUpdaTor',
+           'matchReport', 'reportWriter', 'batchUpdater', 'userInterface']
+HEAVY_LIBRARIES = ['pandas', 'matplotlib', 'mpl_toolkits', 'alphashape', 'scipy', 'shapely', 'OCC', 'PyQt5', 'openpyxl', 'ifcopenshell']
+
+# run in the fresh interpreter, prints the import time and the heavy libraries that ended up in sys.modules as JSON
+_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [name for name in {heavy!r} if name in sys.modules]}}))
+'''
+
+
+def time_import(module, runs=5):
+    # (median seconds, heavy libraries loaded), or (None, error message) when the module cannot be imported here
+    times = []
+    loaded = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', _PROBE.format(module=module, heavy=HEAVY_LIBRARIES)], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        if result.returncode != 0:
+            return None, (result.stderr.strip().splitlines() or ['failed'])[-1]
+        probe = json.loads(result.stdout.strip().splitlines()[-1])
+        times.append(probe['seconds'])
+        loaded = probe['loaded']
+    return statistics.median(times), loaded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time the import of the modules of the tool in fresh interpreters.')
+    parser.add_argument('modules', nargs='*', default=MODULES, help='modules to time (default: all)')
+    parser.add_argument('-n', '--runs', type=int, default=5, help='imports per module, the median is shown (default: %(default)s)')
+    args = parser.parse_args(argv)
+    print(f"{'module':<16} {'import (s)':>10}  heavy libraries loaded")
+    for module in args.modules:
+        seconds, loaded = time_import(module, args.runs)
+        if seconds is None:
+            print(f"{module:<16} {'-':>10}  not importable here: {loaded}")
+        else:
+            print(f"{module:<16} {seconds:>10.3f}  {', '.join(loaded) or '-'}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+# This code is part of the Master Thesis of Jean van der Meer presented to the Eindhoven University of Technology
+# Matching floor by floor. wallMatcher compares every point cloud wall with every IFC wall of the building, and check_and_update_columns
+# compares every column with every wall and every point cloud column, although elements on different floors (IfcBuildingStorey) can
+# never belong together. Here the IFC walls and columns are split by the storey they are contained in, and the point cloud elements by
+# the storey whose elevation is the highest one below their base (with STOREY_TOLERANCE for floors scanned slightly lower than their
+# elevation). Every storey is then matched on its own, in worker processes next to each other, on plain tuples and dictionaries taken
+# from the model once (see match_walls in wallChecker.py and plan_columns in columnUpdaTor.py), so the time of the matching follows the
+# largest storey instead of the whole building. The results of all storeys are merged and the changes are made to the model on the main
+# thread, as an IfcOpenShell model cannot be shared between processes. The creation of new walls and the refinement of their geometry
+# (wallCreaTor) still work on the whole model, one wall after the other.
+#
+# Unlike the building wide matching, walls are only matched to walls of their own storey, and columns are checked against the walls of
+# their own storey at their global height, so a column on an upper floor is no longer taken as embedded in a wall of the ground floor.
+
+import os
+import time
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+
+# how far below the elevation of a storey the base of a point cloud element can be and still belong to that storey
+STOREY_TOLERANCE = 0.3
+
+
+def model_storeys(model):
+    # (GlobalId, elevation) of every storey of the model, from the lowest to the highest
+    return sorted(((storey.GlobalId, storey.Elevation or 0.0) for storey in model.by_type('IfcBuildingStorey')), key=lambda storey: storey[1])
+
+
+def storey_of(element):
+    # GlobalId of the storey an IFC element is contained in, None when it is not contained in a storey
+    if element.ContainedInStructure:
+        return element.ContainedInStructure[0].RelatingStructure.GlobalId
+    return None
+
+
+def storey_at(storeys, z):
+    # GlobalId of the storey a point cloud element with its base at height z belongs to, the lowest storey for anything below it
+    elevations = [elevation for _, elevation in storeys]
+    index = bisect_right(elevations, z + STOREY_TOLERANCE) - 1
+    return storeys[max(index, 0)][0] if storeys else None
+
+
+def partition_cloud(elements, storeys, base_height):
+    # {storey GlobalId: {name: element}} of a dictionary of point cloud elements, base_height gives the height of the base of an element
+    partitions = {}
+    for name, element in elements.items():
+        partitions.setdefault(storey_at(storeys, base_height(element)), {})[name] = element
+    return partitions
+
+
+def run_partitions(function, partitions, workers=None):
+    # function(*arguments) for the arguments of every partition, in worker processes when there is more than one partition and workers
+    # is not 1. The results are returned in the order of the partitions
+    if workers == 1 or len(partitions) < 2:
+        return [function(*arguments) for arguments in partitions]
+    with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(partitions))) as executor:
+        return list(executor.map(function, *zip(*partitions)))
+
+
+def wallMatcherByStorey(model, wall_dict, report=None, workers=None):
+    # wallMatcher (see wallChecker.py) storey by storey: a point cloud wall is only matched to the IFC walls of its own storey, so walls
+    # stacked on different floors can match differently than with wallMatcher, which compares every wall of the building. The results
+    # are returned and recorded as by wallMatcher
+    from wallChecker import extrPoints, match_walls, record_wall_matches
+    start = time.perf_counter()
+    storeys = model_storeys(model)
+    ifc_walls = {}
+    ifc_wall_guids = []
+    for ifc_wall in model.by_type("IfcWallStandardCase"):
+        ifc_walls.setdefault(storey_of(ifc_wall), []).append((ifc_wall.GlobalId, extrPoints(ifc_wall)))
+        ifc_wall_guids.append(ifc_wall.GlobalId)
+    # walls that are not along x or y have no base point, they are given to the lowest storey
+    cloud_walls = partition_cloud(wall_dict, storeys, lambda wall: wall['base point'][2] if wall['base point'] else float('-inf'))
+    partitions = [(cloud_walls.get(storey, {}), ifc_walls.get(storey, []))
+                  for storey in [guid for guid, _ in storeys] + [None] if cloud_walls.get(storey) and ifc_walls.get(storey)]
+    matches = [match for storey_matches in run_partitions(match_walls, partitions, workers) for match in storey_matches]
+    print(f"Walls of {len(partitions)} storeys matched in {time.perf_counter() - start:.2f} s")
+    return record_wall_matches(wall_dict, ifc_wall_guids, matches, report=report)
+
+
+def check_and_update_columns_by_storey(model, pc_columns, report=None, workers=None):
+    # the same update as check_and_update_columns with write_file=False (see columnUpdaTor.py), with the columns of every storey checked
+    # against the walls and point cloud columns of that storey only
+    from columnUpdaTor import apply_column_plan, column_records, column_results, plan_columns, wall_records
+    start = time.perf_counter()
+    storeys = model_storeys(model)
+    columns, walls = {}, {}
+    for column in model.by_type('IfcColumn'):
+        columns.setdefault(storey_of(column), []).append(column)
+    for wall in model.by_type('IfcWallStandardCase'):
+        walls.setdefault(storey_of(wall), []).append(wall)
+    cloud_columns = partition_cloud(pc_columns, storeys, lambda column: column['cg'][2])
+    partitions = [(column_records(columns.get(storey, [])), wall_records(walls.get(storey, [])), cloud_columns.get(storey, {}), True)
+                  for storey in [guid for guid, _ in storeys] + [None] if columns.get(storey) or cloud_columns.get(storey)]
+    plans = run_partitions(plan_columns, partitions, workers)
+    print(f"Columns of {len(partitions)} storeys matched in {time.perf_counter() - start:.2f} s")
+    for plan in plans:
+        apply_column_plan(model, plan['actions'], report=report)
+    return column_results(plans)
@@ -0,0 +1,35 @@
+# This code is part of the Master Thesis of Jean van der Meer presented to the Eindhoven University of Technology
+# Checks of read_point_cloud_array in pointCloudDisplay.py on files whose lines do not all have the same number of values, as the line by
+# line reader it replaced kept every line with at least 3 values.
+#
+#   python -m pytest test_pointCloudDisplay.py
+
+import numpy as np
+
+from pointCloudDisplay import DEFAULT_COLOR, read_point_cloud_array
+
+
+def write_lines(tmp_path, lines):
+    file_path = tmp_path / 'cloud.txt'
+    file_path.write_text('\n'.join(lines) + '\n')
+    return str(file_path)
+
+
+def test_lines_with_more_values_than_the_first_are_kept(tmp_path):
+    xyz, rgb = read_point_cloud_array(write_lines(tmp_path, ['1 2 3', '4 5 6 7 8 9', '7 8 9']))
+    assert xyz.tolist() == [[1, 2, 3], [4, 5, 6], [7, 8, 9]]
+    assert rgb.shape == (3, 3)
+    assert np.allclose(rgb[1], np.array([7, 8, 9]) / 255.0)
+    assert np.allclose(rgb[[0, 2]], DEFAULT_COLOR)
+
+
+def test_lines_with_less_than_3_values_are_skipped(tmp_path):
+    xyz, rgb = read_point_cloud_array(write_lines(tmp_path, ['1 2 3 255 0 0', '4 5', '7 8 9 0 255 0 1']))
+    assert xyz.tolist() == [[1, 2, 3], [7, 8, 9]]
+    assert np.allclose(rgb, [[1, 0, 0], [0, 1, 0]])
+
+
+def test_clouds_without_colours_have_none(tmp_path):
+    xyz, rgb = read_point_cloud_array(write_lines(tmp_path, ['1 2 3', '4 5 6']))
+    assert xyz.shape == (2, 3)
+    assert rgb is None
@@ -0,0 +1,144 @@
+# This code is part of the Master Thesis of Jean van der Meer presented to the Eindhoven University of Technology
+# Room Mode in tiles, for scanned areas the size of a campus. One alpha hull over all points of the scan and one pass that compares every
+# point cloud wall with every IFC wall do not scale to such areas. Here the XY plane is divided into square tiles of tile_size that are
+# handled in worker processes next to each other (see run_partitions in storeyPartition.py), with the same results as one tile:
+#
+# - the alpha hull is made for every tile from the points of the tile and of an overlap around it, and only the part within the tile
+#   itself is kept. The hull is the union of the triangles of the Delaunay triangulation whose circumcircle has a radius below 1 / alpha,
+#   and such a triangle only depends on the points within its circumcircle, so with an overlap of at least 2 / alpha the triangles that
+#   reach into a tile are the same as for the whole scan. The parts of all tiles are joined into the hull of the whole scanned area
+# - every point cloud wall belongs to the tile its base point is in, and is matched there to the IFC walls with a start or end point
+#   within the dynamic threshold of that tile, which are all the IFC walls it can match. The IFC walls are taken from the model once,
+#   and a wall that crosses the border of tiles is matched in every tile it reaches; the matches of all tiles are joined by GlobalId,
+#   so an IFC wall matched in one tile is not deleted because another tile did not match it
+#
+# The voxel grid of the points is the one of the whole scan, and the scanned area is decided once for all IFC walls, so the matches,
+# the walls to create and the walls to delete are those of wallMatcherRM (see wallCheckerRM.py). Unlike a single hull, a scan of
+# separate buildings gives one part for each building instead of an error.
+#
+# A scan stored as a .qpc file (see quantizedCloud.py) is not read as a whole: every worker reads only the chunks of the file that reach
+# into its tile and the overlap around it, and downsamples them on the voxel grid of the whole scan, so the points of the voxels within
+# the tile and its overlap are the same as those of the whole scan downsampled at once.
+
+import time
+
+import numpy as np
+
+from storeyPartition import run_partitions
+
+# side of the square tiles, in the units of the model
+DEFAULT_TILE_SIZE = 50.0
+
+
+def tile_index(x, y, origin, tile_size):
+    return int(np.floor((x - origin[0]) / tile_size)), int(np.floor((y - origin[1]) / tile_size))
+
+
+def tile_box(index, origin, tile_size):
+    # (x min, y min, x max, y max) of a tile
+    return (origin[0] + index[0] * tile_size, origin[1] + index[1] * tile_size,
+            origin[0] + (index[0] + 1) * tile_size, origin[1] + (index[1] + 1) * tile_size)
+
+
+def tile_hull(points_2d, alpha, box):
+    # part of the alpha hull of the points within box, None when the points of the tile do not make a hull there
+    import alphashape
+    from shapely.geometry import box as make_box
+    hull = alphashape.alphashape(points_2d, alpha)
+    if hull is None or hull.is_empty or hull.geom_type not in ('Polygon', 'MultiPolygon'):
+        return None
+    part = hull.intersection(make_box(*box))
+    return None if part.is_empty else part
+
+
+def compute_2d_concave_hull_tiled(points, alpha=1.0, buffer_size=0.4, tile_size=DEFAULT_TILE_SIZE, workers=None):
+    # the same hull as compute_2d_concave_hull_and_extrude(points, alpha, buffer_size, plot=False) in wallCheckerRM.py, made tile by tile
+    from wallCheckerRM import voxel_grid_downsample
+    start = time.perf_counter()
+    voxel_size = 0.5
+    points_2d = voxel_grid_downsample(points, voxel_size)[:, :2]
+    origin = points_2d.min(axis=0)
+    overlap = 2.0 / alpha + voxel_size
+    indices = np.floor((points_2d - origin) / tile_size).astype(int)
+    partitions = []
+    for index in np.unique(indices, axis=0):
+        box = tile_box(tuple(index), origin, tile_size)
+        near = ((points_2d[:, 0] >= box[0] - overlap) & (points_2d[:, 0] <= box[2] + overlap) &
+                (points_2d[:, 1] >= box[1] - overlap) & (points_2d[:, 1] <= box[3] + overlap))
+        partitions.append((points_2d[near], alpha, box))
+    hull_polygon = join_tile_hulls(run_partitions(tile_hull, partitions, workers))
+    print(f"Alpha hull of {len(points_2d)} points made in {len(partitions)} tiles in {time.perf_counter() - start:.1f} s")
+    return hull_polygon.buffer(buffer_size)
+
+
+def join_tile_hulls(parts):
+    # the outline of the hulls of the tiles joined, as for a single hull the holes inside the scanned area are filled
+    from shapely.geometry import MultiPolygon, Polygon
+    from shapely.ops import unary_union
+    hull = unary_union([part for part in parts if part is not None])
+    if hull.geom_type == 'Polygon':
+        return Polygon(hull.exterior.coords)
+    return MultiPolygon([Polygon(polygon.exterior.coords) for polygon in hull.geoms])
+
+
+def quantized_tile_hull(scan_file, alpha, box, overlap, voxel_origin, voxel_size):
+    # tile_hull of a tile of a .qpc scan, reading only the chunks that reach into the tile and its overlap
+    from quantizedCloud import QuantizedCloud
+    from wallCheckerRM import voxel_grid_downsample
+    points = QuantizedCloud(scan_file).read((box[0] - overlap, box[1] - overlap, box[2] + overlap, box[3] + overlap))
+    if len(points) < 3:
+        return None
+    return tile_hull(voxel_grid_downsample(points, voxel_size, origin=voxel_origin)[:, :2], alpha, box)
+
+
+def compute_2d_concave_hull_quantized(scan_file, alpha=1.0, buffer_size=0.4, tile_size=DEFAULT_TILE_SIZE, workers=None):
+    # compute_2d_concave_hull_tiled of the scan in a .qpc file, without reading the whole scan into memory
+    from quantizedCloud import QuantizedCloud
+    start = time.perf_counter()
+    voxel_size = 0.5
+    cloud = QuantizedCloud(scan_file)
+    origin = cloud.bounds()[0]
+    overlap = 2.0 / alpha + voxel_size
+    # the tiles reached by the bounding box of a chunk
+    tiles = set()
+    for box in cloud.boxes:
+        low, high = tile_index(box[0], box[1], origin, tile_size), tile_index(box[3], box[4], origin, tile_size)
+        tiles.update((i, j) for i in range(low[0], high[0] + 1) for j in range(low[1], high[1] + 1))
+    partitions = [(scan_file, alpha, tile_box(index, origin, tile_size), overlap, origin, voxel_size) for index in sorted(tiles)]
+    hull_polygon = join_tile_hulls(run_partitions(quantized_tile_hull, partitions, workers))
+    print(f"Alpha hull of {cloud.count} points made in {len(partitions)} tiles in {time.perf_counter() - start:.1f} s")
+    return hull_polygon.buffer(buffer_size)
+
+
+def wallMatcherRMTiled(model, wall_dict, alpha_hull, buffer_size=0.55, report=None, tile_size=DEFAULT_TILE_SIZE, workers=None):
+    # the same result as wallMatcherRM (see wallCheckerRM.py), with the point cloud walls matched tile by tile
+    from wallCheckerRM import match_walls_rm, record_wall_matches_rm, scanned_ifc_walls
+    start = time.perf_counter()
+    in_scope, matchable = scanned_ifc_walls(model, alpha_hull, buffer_size)
+    located = [wall for wall in wall_dict if wall_dict[wall]['base point']]
+    if not located:
+        return record_wall_matches_rm(wall_dict, in_scope, match_walls_rm(wall_dict, matchable), report=report)
+    origin = (min(wall_dict[wall]['base point'][0] for wall in located), min(wall_dict[wall]['base point'][1] for wall in located))
+
+    # every point cloud wall belongs to one tile, walls that are not along x or y have no base point and go to the first tile
+    tiles = {}
+    for wall in wall_dict:
+        base_point = wall_dict[wall]['base point']
+        index = tile_index(base_point[0], base_point[1], origin, tile_size) if base_point else tile_index(*origin, origin, tile_size)
+        tiles.setdefault(index, {})[wall] = wall_dict[wall]
+    # an IFC wall is given to every tile that has a start or end point within its threshold
+    ifc_walls_of_tile = {index: [] for index in tiles}
+    for ifc_wall in matchable:
+        _, start_point, end_point, dth = ifc_wall
+        reached = set()
+        for point in (start_point, end_point):
+            low = tile_index(point[0] - dth, point[1] - dth, origin, tile_size)
+            high = tile_index(point[0] + dth, point[1] + dth, origin, tile_size)
+            reached.update((i, j) for i in range(low[0], high[0] + 1) for j in range(low[1], high[1] + 1))
+        for index in reached & tiles.keys():
+            ifc_walls_of_tile[index].append(ifc_wall)
+
+    partitions = [(tiles[index], ifc_walls_of_tile[index]) for index in sorted(tiles) if ifc_walls_of_tile[index]]
+    matches = [match for tile_matches in run_partitions(match_walls_rm, partitions, workers) for match in tile_matches]
+    print(f"Walls matched in {len(partitions)} of {len(tiles)} tiles in {time.perf_counter() - start:.2f} s")
+    return record_wall_matches_rm(wall_dict, in_scope, matches, report=report)
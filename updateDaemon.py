@@ -0,0 +1,282 @@
+# This code is part of the Master Thesis of Jean van der Meer presented to the Eindhoven University of Technology
+# Local update server that keeps the IFC models parsed between jobs. Every run of batchUpdater.py starts with ifcopenshell.open, which
+# for a model of 200 MB or more takes longer than a short job such as updating the ceilings of one floor. Here the models are opened once
+# and kept in memory, the least recently used one is dropped when more than max_models are open, and a model is opened again when its
+# file changed on disk. Jobs are sent as JSON to a small HTTP server that only listens on this computer (127.0.0.1) and run the same
+# update as batchUpdater.py (walls, walls in Room Mode when the point cloud of the scanned area is given, columns and ceilings). A job
+# runs in a transaction that is rolled back once the files are written (see modelTransaction.py), so the model in memory stays the model
+# of the file for the next job. The reply holds the files written, the match report files and the summary of the report. Jobs run one at
+# a time, the updaters are not written to share a model or to run side by side, but the status can be asked while a job is running.
+#
+#   python -m updateDaemon serve --port 8765 --max-models 3
+#   python -m updateDaemon submit job.json
+#
+# with job.json for example
+#   {"ifc": "model.ifc", "output": "updated.ifc", "walls": ["scans/walls"], "scan": "scans/room.xyz", "ceilings": ["scans/ceilings"]}
+#
+# The other keys of a job are columns, alpha, buffer_size, report_formats, compression ('gzip' or 'zip'), changeset, by_storey,
+# tile_size, workers and incremental (the path of the manifest of an incremental run), with the same meaning as the options of
+# batchUpdater.py. The output cannot be the ifc file of the job, the model kept in memory stays the model of that file.
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LOCALHOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_MAX_MODELS = 3
+
+# keys a job can have, with their default value. by_storey matches the walls by storey only outside Room Mode (no scan) and incremental
+# runs, the columns always
+JOB_DEFAULTS = {'ifc': None, 'output': None, 'walls': None, 'columns': None, 'ceilings': None, 'scan': None, 'alpha': None,
+                'buffer_size': None, 'report_formats': ['.jsonl'], 'compression': None, 'changeset': None, 'by_storey': False, 'workers': None,
+                'tile_size': None, 'incremental': None}
+
+
+class JobError(ValueError):
+    # a job that cannot be run as it was sent, replied with status 400
+    pass
+
+
+class ModelCache:
+    # The models opened by the server, by the absolute path of their file. A model is kept with the size and modification time its file
+    # had when it was opened, and opened again when the file changed
+    def __init__(self, max_models=DEFAULT_MAX_MODELS):
+        self.max_models = max_models
+        self.models = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, ifc_file_path):
+        # (model, key, was_open): the model of the file, the key (files_key) of the file it was opened from, to be given to put with the
+        # model, and whether the model was already open and still the model of the file
+        import ifcopenshell
+        from updateSession import files_key
+        file_path = os.path.abspath(ifc_file_path)
+        key = files_key([file_path])
+        with self.lock:
+            if file_path in self.models and self.models[file_path][0] == key:
+                self.models.move_to_end(file_path)
+                self.hits += 1
+                return self.models[file_path][1], key, True
+            self.models.pop(file_path, None)
+        start = time.perf_counter()
+        model = ifcopenshell.open(file_path)
+        print(f"Opened {file_path} in {time.perf_counter() - start:.1f} s")
+        self.put(file_path, model, key)
+        with self.lock:
+            self.misses += 1
+        return model, key, False
+
+    def put(self, ifc_file_path, model, key):
+        # key is the one get gave for the model, a key taken now could be of a file that changed since the model was opened
+        file_path = os.path.abspath(ifc_file_path)
+        with self.lock:
+            self.models[file_path] = (key, model)
+            self.models.move_to_end(file_path)
+            while len(self.models) > self.max_models:
+                dropped, _ = self.models.popitem(last=False)
+                print(f"Dropped {dropped} from memory")
+
+    def drop(self, ifc_file_path):
+        with self.lock:
+            self.models.pop(os.path.abspath(ifc_file_path), None)
+
+    def status(self):
+        with self.lock:
+            return {'models': list(self.models), 'max_models': self.max_models, 'hits': self.hits, 'misses': self.misses}
+
+
+def parse_job(job):
+    # the job with every key of JOB_DEFAULTS, and the segmented files of the folders given
+    from batchUpdater import segmented_files
+    from ifcWriter import compressed_path
+    if not isinstance(job, dict):
+        raise JobError('A job is a JSON object')
+    unknown = set(job) - set(JOB_DEFAULTS)
+    if unknown:
+        raise JobError(f'Unknown job keys: {sorted(unknown)}')
+    job = {**JOB_DEFAULTS, **job}
+    if not job['ifc']:
+        raise JobError('The job has no ifc file')
+    if not os.path.isfile(job['ifc']):
+        raise FileNotFoundError(f"No IFC file found at {job['ifc']}")
+    if not (job['walls'] or job['columns'] or job['ceilings']):
+        raise JobError('Give at least one of walls, columns or ceilings')
+    if job['compression'] not in (None, 'gzip', 'zip'):
+        raise JobError(f"Unknown compression {job['compression']!r}")
+    for kind in ('walls', 'columns', 'ceilings'):
+        if isinstance(job[kind], str):
+            job[kind] = [job[kind]]
+        job[kind] = segmented_files(job[kind])
+    job['output'] = job['output'] or f"{os.path.splitext(job['ifc'])[0]}_updated.ifc"
+    # the model in memory is the model of the ifc file, so a job cannot write over it
+    if os.path.abspath(compressed_path(job['output'], job['compression'])) == os.path.abspath(job['ifc']):
+        raise JobError('The output of a job cannot be its ifc file')
+    return job
+
+
+def run_parsed_job(job, model=None, keep_changes=True):
+    # Run a job from parse_job with batchUpdater.run_update and return (state of the run, result of the job). The result lists the files
+    # written and the summary of the match report, and can be sent as JSON
+    from batchUpdater import report_paths, run_update
+    from updatePipeline import DEFAULT_ALPHA, DEFAULT_BUFFER_SIZE
+    report_files, wall_report_file = report_paths(job['output'], job['report_formats'])
+    state = run_update(job['ifc'], job['output'], wall_files=job['walls'], column_files=job['columns'], ceiling_files=job['ceilings'],
+                       scan_file=job['scan'], alpha=DEFAULT_ALPHA if job['alpha'] is None else job['alpha'],
+                       buffer_size=DEFAULT_BUFFER_SIZE if job['buffer_size'] is None else job['buffer_size'],
+                       report_files=report_files, wall_report_files=wall_report_file if job['walls'] else None,
+                       compression=job['compression'], changeset_path=job['changeset'], model=model, keep_changes=keep_changes,
+                       by_storey=job['by_storey'], workers=job['workers'], tile_size=job['tile_size'], manifest_path=job['incremental'])
+    result = {'ifc': job['ifc'], 'written': [written.file_path for written in state.get('written', [])], 'report_files': report_files,
+              'summary': state['summary']}
+    if job['walls']:
+        result['wall_report_file'] = wall_report_file
+    if 'changeset' in state:
+        result['changeset'] = {'file_path': job['changeset'], **state['changeset'].summary()}
+    return state, result
+
+
+class UpdateServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=DEFAULT_PORT, max_models=DEFAULT_MAX_MODELS):
+        super().__init__((LOCALHOST, port), UpdateRequestHandler)
+        self.models = ModelCache(max_models)
+        self.job_lock = threading.Lock()
+        self.jobs = 0
+        self.running = None
+
+    def run_job(self, job):
+        job = parse_job(job)
+        with self.job_lock:
+            self.running = job['ifc']
+            start = time.perf_counter()
+            try:
+                model, key, cached = self.models.get(job['ifc'])
+                state, result = run_parsed_job(job, model=model, keep_changes=False)
+            except BaseException:
+                # the pipeline rolls the model back when an update fails, but it is opened again to be sure of it
+                self.models.drop(job['ifc'])
+                raise
+            finally:
+                self.running = None
+            self.models.put(job['ifc'], state['model'], key)
+            self.jobs += 1
+        return {**result, 'model_was_open': cached, 'seconds': round(time.perf_counter() - start, 3)}
+
+    def status(self):
+        return {**self.models.status(), 'jobs': self.jobs, 'running': self.running}
+
+
+class UpdateRequestHandler(BaseHTTPRequestHandler):
+    # GET /status, POST /jobs with a job as JSON and POST /shutdown
+    def reply(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/status':
+            self.reply(200, self.server.status())
+        else:
+            self.reply(404, {'error': f'Unknown path {self.path}'})
+
+    def do_POST(self):
+        if self.path == '/shutdown':
+            self.reply(200, {'stopping': True})
+            threading.Thread(target=self.server.shutdown).start()
+            return
+        if self.path != '/jobs':
+            self.reply(404, {'error': f'Unknown path {self.path}'})
+            return
+        try:
+            job = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'null')
+            self.reply(200, self.server.run_job(job))
+        except (json.JSONDecodeError, JobError) as e:
+            self.reply(400, {'error': str(e)})
+        except FileNotFoundError as e:
+            self.reply(404, {'error': str(e)})
+        except Exception as e:
+            print(f"Job failed: {e!r}")
+            self.reply(500, {'error': f'{type(e).__name__}: {e}'})
+
+    def log_message(self, format, *args):
+        print(f"{self.address_string()} {format % args}")
+
+
+def serve(port=DEFAULT_PORT, max_models=DEFAULT_MAX_MODELS, preload=()):
+    server = UpdateServer(port, max_models)
+    for ifc_file_path in preload:
+        server.models.get(ifc_file_path)
+    print(f"Update server listening on http://{LOCALHOST}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return server
+
+
+def request(path, body=None, port=DEFAULT_PORT, timeout=None):
+    # reply of the server to GET path, or POST path when a body is given. Errors of the server are raised as RuntimeError
+    import urllib.error
+    import urllib.request
+    data = None if body is None else json.dumps(body).encode('utf-8')
+    http_request = urllib.request.Request(f'http://{LOCALHOST}:{port}{path}', data=data, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(http_request, timeout=timeout) as response:
+            return json.loads(response.read().decode('utf-8'))
+    except urllib.error.HTTPError as e:
+        raise RuntimeError(f'{e.code}: {json.loads(e.read().decode("utf-8"))["error"]}') from None
+
+
+def submit_job(job, port=DEFAULT_PORT, timeout=None):
+    return request('/jobs', job, port=port, timeout=timeout)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='updateDaemon', description='Local server that keeps IFC models open between update jobs.')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='port on 127.0.0.1 (default: %(default)s)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve_command = commands.add_parser('serve', help='start the server')
+    serve_command.add_argument('--max-models', type=int, default=DEFAULT_MAX_MODELS, help='models kept open (default: %(default)s)')
+    serve_command.add_argument('--preload', nargs='+', default=[], metavar='IFC', help='IFC files to open before the first job')
+    submit_command = commands.add_parser('submit', help='send a job and wait for its result')
+    submit_command.add_argument('job', help='JSON file of the job, - to read it from the standard input')
+    commands.add_parser('status', help='models open and jobs run')
+    commands.add_parser('stop', help='stop the server')
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        serve(args.port, args.max_models, args.preload)
+        return 0
+    try:
+        if args.command == 'submit':
+            if args.job == '-':
+                job = json.load(sys.stdin)
+            else:
+                with open(args.job) as f:
+                    job = json.load(f)
+            result = submit_job(job, port=args.port)
+        else:
+            result = request('/status' if args.command == 'status' else '/shutdown', None if args.command == 'status' else {}, port=args.port)
+    except (RuntimeError, OSError) as e:
+        print(f'updateDaemon: {e}', file=sys.stderr)
+        return 1
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,237 @@
+# This code is part of the Master Thesis of Jean van der Meer presented to the Eindhoven University of Technology
+# Update of several element types on one model in memory, written once at the end. wallCreaTor, check_and_update_columns and
+# check_and_update_ceilings each write the whole model to a new modified_ifc_file_<date>.ifc when they finish, so updating walls, columns
+# and ceilings of a building serialized it three times. Here the updaters are called with write_file=False, one after the other on the
+# same model, and the model is written once when all of them are done. The element types always run in the same order, walls first,
+# because the columns are checked against the walls around them (columns embedded in walls are not updated), and that check has to see
+# the walls as they are after their update. Optionally the model is also written after each element type, as a checkpoint to go back to
+# or to compare with.
+
+import os
+
+WALLS = 'walls'
+COLUMNS = 'columns'
+CEILINGS = 'ceilings'
+# order in which the element types are updated
+UPDATE_ORDER = (WALLS, COLUMNS, CEILINGS)
+
+# alpha of the concave hull of the scanned area and buffer around it used by Room Mode, the same values the interface uses
+DEFAULT_ALPHA = 0.5
+DEFAULT_BUFFER_SIZE = 0.70
+
+
+def read_segmented(manifest, kind, files, process):
+    # the records of the segmented files, e.g. process_seg_walls(files), through the manifest of an incremental run when there is one
+    # (see incrementalRun.py), which only reads the files that changed
+    return process(files) if manifest is None else manifest.records(kind, files, process)
+
+
+def wall_stages(model, wall_files, scan_file, report, wall_report_files=None, alpha=DEFAULT_ALPHA, buffer_size=DEFAULT_BUFFER_SIZE,
+                by_storey=False, workers=None, tile_size=None, manifest=None):
+    # stages of the update of walls, the same steps as update_ifc_walls and update_RM_ifc_walls in userInterface.py. The Excel report of
+    # the walls is written after the matching, before the model is changed, when wall_report_files is given. With by_storey the walls
+    # outside Room Mode are matched storey by storey in worker processes (see storeyPartition.py), and with tile_size the hull and the
+    # matching of Room Mode are done in tiles of that size in worker processes (see tiledRoomMode.py). With the RunManifest of an
+    # incremental run (see incrementalRun.py) only the walls that changed are read and matched again, and the hull is kept when the scan
+    # did not change, the walls are then matched as one pool, not by storey or tile
+    from wallUpdaTor import wallCreaTor
+    if by_storey and (scan_file or manifest is not None):
+        print("The walls are matched as one pool, matching by storey is not done in Room Mode or in incremental runs")
+    if scan_file:
+        from wallCheckerRM import (read_point_cloud2, compute_2d_concave_hull_and_extrude, process_seg_wallsRM, wallMatcherRM,
+                                   resultsExcel)
+        from wallRemoverRM import wallDeleterRM
+
+        def compute_hull():
+            from archiveReader import scan_files
+            from quantizedCloud import is_quantized
+            # a scan given as a glob of several files (see scan_files in archiveReader.py) is read as one point cloud
+            scans = scan_files(scan_file)
+            if tile_size and len(scans) == 1 and is_quantized(scans[0]):
+                from tiledRoomMode import compute_2d_concave_hull_quantized
+                return compute_2d_concave_hull_quantized(scans[0], alpha, tile_size=tile_size, workers=workers)
+            if tile_size:
+                from tiledRoomMode import compute_2d_concave_hull_tiled
+                return compute_2d_concave_hull_tiled(read_point_cloud2(scan_file), alpha, tile_size=tile_size, workers=workers)
+            return compute_2d_concave_hull_and_extrude(read_point_cloud2(scan_file), alpha, plot=False)
+
+        def alpha_hull(state):
+            # the tiled hull is the same as the single one, so the tile size is not part of the parameters
+            state['alpha_hull'] = compute_hull() if manifest is None else manifest.hull(scan_file, (alpha,), compute_hull)
+
+        def read_walls(state):
+            state['wall_dict'] = read_segmented(manifest, 'walls_rm', wall_files, process_seg_wallsRM)
+
+        def match_walls(state):
+            if manifest is not None:
+                from incrementalRun import incremental_wallMatcherRM
+                state['ifc_walls_matched'], state['point_cloud_walls_matched'], state['ifc_walls_to_delete'] = incremental_wallMatcherRM(
+                    model, state['wall_dict'], state['alpha_hull'], manifest, buffer_size=buffer_size, report=report)
+            elif tile_size:
+                from tiledRoomMode import wallMatcherRMTiled
+                state['ifc_walls_matched'], state['point_cloud_walls_matched'], state['ifc_walls_to_delete'] = wallMatcherRMTiled(
+                    model, state['wall_dict'], state['alpha_hull'], buffer_size=buffer_size, report=report, tile_size=tile_size, workers=workers)
+            else:
+                state['ifc_walls_matched'], state['point_cloud_walls_matched'], state['ifc_walls_to_delete'] = wallMatcherRM(
+                    model, state['wall_dict'], state['alpha_hull'], buffer_size=buffer_size, report=report)
+            if wall_report_files:
+                resultsExcel(model, state['wall_dict'], state['ifc_walls_matched'], state['point_cloud_walls_matched'], state['alpha_hull'],
+                             buffer_size=buffer_size, report_files=wall_report_files)
+
+        def delete_walls(state):
+            wallDeleterRM(model=model, ifc_walls_to_delete=state['ifc_walls_to_delete'], report=report)
+
+        stages = [("Generating the alpha hull of the scanned area", alpha_hull)]
+    else:
+        from wallChecker import process_seg_walls, wallMatcher, resultsExcel
+        from wallRemover import wallDeleter
+
+        def read_walls(state):
+            state['wall_dict'] = read_segmented(manifest, 'walls', wall_files, process_seg_walls)
+
+        def match_walls(state):
+            if manifest is not None:
+                from incrementalRun import incremental_wallMatcher
+                state['ifc_walls_matched'], state['point_cloud_walls_matched'] = incremental_wallMatcher(model, state['wall_dict'], manifest, report=report)
+            elif by_storey:
+                from storeyPartition import wallMatcherByStorey
+                state['ifc_walls_matched'], state['point_cloud_walls_matched'] = wallMatcherByStorey(model, state['wall_dict'], report=report, workers=workers)
+            else:
+                state['ifc_walls_matched'], state['point_cloud_walls_matched'] = wallMatcher(model=model, wall_dict=state['wall_dict'], report=report)
+            if wall_report_files:
+                resultsExcel(model, state['wall_dict'], state['ifc_walls_matched'], state['point_cloud_walls_matched'], report_files=wall_report_files)
+
+        def delete_walls(state):
+            wallDeleter(model=model, ifc_walls_matched=state['ifc_walls_matched'], report=report)
+
+        stages = []
+
+    def create_walls(state):
+        wallCreaTor(model=model, wall_dict=state['wall_dict'], ifc_walls_matched=state['ifc_walls_matched'],
+                    point_cloud_walls_matched=state['point_cloud_walls_matched'], report=report, write_file=False)
+
+    return stages + [("Reading the segmented walls", read_walls), ("Matching walls", match_walls), ("Deleting unmatched walls", delete_walls),
+                     ("Creating new walls", create_walls)]
+
+
+def column_stages(model, column_files, report, by_storey=False, workers=None, manifest=None):
+    from columnUpdaTor import check_and_update_columns, process_seg_columns
+
+    def update_columns(state):
+        pc_columns = read_segmented(manifest, 'columns', column_files, process_seg_columns)
+        if by_storey:
+            from storeyPartition import check_and_update_columns_by_storey
+            results = check_and_update_columns_by_storey(model, pc_columns, report=report, workers=workers)
+        else:
+            results = check_and_update_columns(model=model, pc_columns=pc_columns, report=report, write_file=False)
+        state['columns'] = results
+        print(f"IFC columns embedded in walls that were not matched to point cloud data: {results['num_ifc_emb_columns_no_match']}")
+        print(results['message'])
+        print(f"IFC columns (not embedded in walls) that were not matched to point cloud data: {results['num_unmatched_free_ifc_columns']}")
+
+    return [("Updating columns", update_columns)]
+
+
+def ceiling_stages(model, ceiling_files, report, manifest=None):
+    from ceilingUpdaTor import check_and_update_ceilings, process_seg_ceilings
+
+    def update_ceilings(state):
+        pc_ceilings = read_segmented(manifest, 'ceilings', ceiling_files, process_seg_ceilings)
+        check_and_update_ceilings(model=model, pc_ceilings=pc_ceilings, report=report, write_file=False)
+
+    return [("Updating ceilings", update_ceilings)]
+
+
+class UpdatePipeline:
+    # Collects the updates of one model, in any order, and runs them in UPDATE_ORDER. report is an optional MatchReport
+    # (see matchReport.py) shared by all updaters. With by_storey the walls and columns are matched storey by storey in up to workers
+    # processes (see storeyPartition.py), with tile_size Room Mode is done in tiles (see tiledRoomMode.py). With manifest_path the run
+    # is incremental (see incrementalRun.py): only what changed since the run that saved the manifest is read and matched again
+    def __init__(self, model, report=None, by_storey=False, workers=None, tile_size=None, manifest_path=None):
+        self.model = model
+        self.report = report
+        self.by_storey = by_storey
+        self.workers = workers
+        self.tile_size = tile_size
+        self.manifest = None
+        if manifest_path:
+            from incrementalRun import RunManifest
+            self.manifest = RunManifest(manifest_path)
+        self.updates = {}
+
+    def add_walls(self, wall_files, scan_file=None, wall_report_files=None, alpha=DEFAULT_ALPHA, buffer_size=DEFAULT_BUFFER_SIZE):
+        # Room Mode when the point cloud of the scanned area (scan_file) is given
+        self.updates[WALLS] = wall_stages(self.model, wall_files, scan_file, self.report, wall_report_files, alpha=alpha, buffer_size=buffer_size,
+                                          by_storey=self.by_storey, workers=self.workers, tile_size=self.tile_size, manifest=self.manifest)
+
+    def add_columns(self, column_files):
+        self.updates[COLUMNS] = column_stages(self.model, column_files, self.report, by_storey=self.by_storey, workers=self.workers,
+                                              manifest=self.manifest)
+
+    def add_ceilings(self, ceiling_files):
+        self.updates[CEILINGS] = ceiling_stages(self.model, ceiling_files, self.report, manifest=self.manifest)
+
+    def stages(self, output_path=None, checkpoint_dir=None, compression=None, changeset_path=None):
+        # Stages of all updates in order, for a BackgroundJob (see backgroundJobs.py). With checkpoint_dir the model is also written there
+        # after each element type, as <number>_<element type>.ifc, in the background while the next updates run. With output_path it is
+        # written there at the end, once the checkpoints are written. compression is None, 'gzip' or 'zip' (see ifcWriter.py), and changes
+        # the extension of the files. The WriteResult of every file written is listed in state['written']. With changeset_path the
+        # changes of all updates together are also saved as a changeset (see ifcChangeset.py), which is in state['changeset']
+        from ifcWriter import compressed_path, write_ifc, write_in_background
+
+        def write_checkpoint(file_path):
+            def write(state):
+                state.setdefault('checkpoints', []).append(write_in_background(self.model, file_path, compression))
+            return write
+
+        def write_output(state):
+            written = state.setdefault('written', [])
+            written.extend(pending_write.wait() for pending_write in state.pop('checkpoints', []))
+            if output_path:
+                written.append(write_ifc(self.model, compressed_path(output_path, compression), compression))
+
+        def record_model(state):
+            from ifcChangeset import ChangeRecorder
+            state['change_recorder'] = ChangeRecorder(self.model)
+
+        def save_changeset(state):
+            state['changeset'] = state.pop('change_recorder').changeset(self.model)
+            size = state['changeset'].save(changeset_path)
+            print(f"Changeset written: {changeset_path} ({size / 1e3:.1f} kB) {state['changeset'].summary()}")
+
+        stages = [("Recording the model before the update", record_model)] if changeset_path else []
+        for number, kind in enumerate((kind for kind in UPDATE_ORDER if kind in self.updates), start=1):
+            stages += self.updates[kind]
+            if checkpoint_dir:
+                stages.append((f"Writing the checkpoint after the {kind}", write_checkpoint(os.path.join(checkpoint_dir, f'{number}_{kind}.ifc'))))
+        if changeset_path:
+            stages.append(("Writing the changeset", save_changeset))
+        stages.append(("Writing the updated IFC file", write_output))
+        if self.manifest is not None:
+            # saved last, so a run that fails leaves the manifest of the last run that did not
+            stages.append(("Saving the manifest of the run", lambda state: self.manifest.save()))
+        return stages
+
+    def run(self, output_path=None, checkpoint_dir=None, compression=None, changeset_path=None, keep_changes=True):
+        # Run every stage on this thread and return the state of the run. The updates run in a transaction (see modelTransaction.py):
+        # if a stage fails the model is rolled back to how it was before the run, and with keep_changes=False it is rolled back after the
+        # run as well, for a what-if run whose files, reports and changeset show the result without keeping it. state['model'] is the
+        # model after the run, which is a new object if the rollback had to parse a snapshot
+        from backgroundJobs import BackgroundJob
+        from modelTransaction import ModelTransaction
+        if checkpoint_dir:
+            os.makedirs(checkpoint_dir, exist_ok=True)
+        job = BackgroundJob("Update", self.stages(output_path, checkpoint_dir, compression, changeset_path))
+        transaction = ModelTransaction(self.model).begin()
+        try:
+            state = job.run()
+        except BaseException:
+            self.model = transaction.rollback()
+            raise
+        if keep_changes:
+            transaction.commit()
+        else:
+            self.model = transaction.rollback()
+            print("What-if run: the changes to the model were rolled back.")
+        state['model'] = self.model
+        return state
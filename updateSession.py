@@ -0,0 +1,58 @@
+# This code is part of the Master Thesis of Jean van der Meer presented to the Eindhoven University of Technology
+# Results kept between the actions of the interface. Checking the walls and then updating them read the segmented walls and matched
+# them against the model twice (process_seg_walls and wallMatcher, or wallMatcherRM in Room Mode), although nothing changed in between.
+# Here the parsed point clouds, the alpha hull of the scanned area and the results of the matching are kept under a key made of their
+# inputs: the path, size and modification time of the files read, the parameters, and the revision of the model. The revision of a
+# model goes up every time an updater is about to change it, so results of a model that was changed since are not used again, and an
+# update that follows a check reuses the check as long as the files and the model stayed the same.
+
+import os
+import threading
+
+
+def files_key(file_paths):
+    # key of a list of files, it changes when a file is added, removed, replaced or written to
+    key = []
+    for file_path in file_paths:
+        stat = os.stat(file_path)
+        key.append((os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns))
+    return tuple(key)
+
+
+class UpdateSession:
+    def __init__(self):
+        self.results = {}
+        self.model_revisions = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def model_key(self, model):
+        return (id(model), self.model_revisions.get(id(model), 0))
+
+    def model_changed(self, model):
+        # called before an updater changes the model, the results that depend on the model as it was are dropped
+        with self.lock:
+            old_key = self.model_key(model)
+            self.model_revisions[id(model)] = old_key[1] + 1
+            for key in [key for key in self.results if old_key in key]:
+                del self.results[key]
+
+    def cached(self, key, compute):
+        # the result stored under key, or compute() stored under key. key is a tuple, any part of it that is a model key (see
+        # model_key) ties the result to that revision of the model
+        with self.lock:
+            if key in self.results:
+                self.hits += 1
+                print(f"Reusing the result of {key[0]} from earlier in this session.")
+                return self.results[key]
+        result = compute()
+        with self.lock:
+            self.misses += 1
+            self.results[key] = result
+        return result
+
+    def clear(self):
+        with self.lock:
+            self.results = {}
+            self.model_revisions = {}
@@ -1,93 +1,427 @@
 # This code is part of the Master Thesis of Jean van der Meer presented to the Eindhoven University of Technology
 import os
 from PyQt5.QtWidgets import QFileDialog
-from OCC.Display.SimpleGui import init_display
-from OCC.Extend.DataExchange import read_step_file_with_names_colors
-from OCC.Extend.DataExchange import read_step_file_with_names_colors
-from OCC.Core.Graphic3d import Graphic3d_ArrayOfPoints
-from OCC.Core.AIS import AIS_PointCloud
-from OCC.Core.Quantity import Quantity_Color, Quantity_TOC_RGB
 import ifcopenshell
 import subprocess
-# Initialize the display
-display, start_display, add_menu, add_function_to_menu = init_display()
+# The display is initialized when the interface starts (see the end of this file), after the instructions are shown, and OCC is only
+# imported then and in the functions that need it, so importing this module does not build a viewer
+display = start_display = add_menu = add_function_to_menu = None
 
 # Define global variables
 stp_filename = ""
 shapes_labels_colors = None
+# The model is tessellated in memory for the viewer (see ifcTessellator.py). Set use_ifcconvert to True to go back to converting
+# every IFC file to STEP with IfcConvert, e.g. when IfcOpenShell was built without OpenCascade support
+use_ifcconvert = False
+# The STEP files made by IfcConvert are scaled up by around 1E6 compared to the IFC units, the shapes tessellated in memory are not.
+# Point clouds loaded only for visualization are scaled by this factor to overlap with whatever geometry is being shown
+point_cloud_scale = 1.0
+# Tessellated elements of the model by GlobalId (see geometryCache.py) and the shapes shown in the viewer for each of them, so after an
+# update only the elements that changed are tessellated again and swapped in the viewer
+geometry_cache = None
+displayed_shapes = {}
+# Conversions of IFC files kept across sessions, by the hash of the file contents and the converter settings (see conversionCache.py),
+# so opening a file that did not change since the last time is served from disk instead of being tessellated again
+conversion_cache = None
+# Set write_glb_after_update to True to also write every updated model as a binary glTF mesh (see meshExporter.py) next to the IFC file,
+# a compact file that loads much faster than STEP, also in web viewers
+write_glb_after_update = False
+# Heavy operations run in the background, one at a time (see start_job and backgroundJobs.py)
+job_runner = None
+progress_dialog = None
+# Model and alpha hull of the scanned area for Room Mode, set once the background jobs that make them are done
+model = None
+alpha_hull = None
+# Report of every check and update done in this session for walls, columns and ceilings, see matchReport.py. It is opened
+# at the first check or update and every record is written to disk as soon as it is added
+match_report = None
+# Parsed point clouds, alpha hulls and wall matches kept between the actions of the menus, by their inputs (see updateSession.py), so e.g.
+# updating the walls right after checking them does not read and match them again
+session = None
+# Updates that were committed, the last one can be undone from the menu (see modelTransaction.py). An update that fails or is cancelled is
+# rolled back right away
+update_history = []
+UNDO_LEVELS = 10
+# Point clouds of the 'Point Cloud' menu are shown with levels of detail (see pointCloudLod.py), a timer lets the viewer add detail
+# where the user zooms in, within a budget of points for all clouds together
+lod_viewer = None
+lod_timer = None
+
+
+def get_match_report():
+    global match_report
+    if match_report is None:
+        from matchReport import new_match_report
+        match_report = new_match_report()
+        print("Match report:", match_report.report_files)
+    return match_report
+
+
+# Function to get the viewer of point clouds with levels of detail, the first time it is needed the timer that follows the camera is started
+def get_lod_viewer():
+    global lod_viewer, lod_timer
+    if lod_viewer is None:
+        from pointCloudLod import LodViewer
+        from PyQt5.QtCore import QTimer
+        lod_viewer = LodViewer(display)
+        lod_timer = QTimer()
+        lod_timer.timeout.connect(lod_viewer.refresh)
+        lod_timer.start(300)
+    return lod_viewer
+
+
+# Function to get the session that keeps results between the actions of the menus, created the first time it is needed
+def get_session():
+    global session
+    if session is None:
+        from updateSession import UpdateSession
+        session = UpdateSession()
+    return session
+
+# Function giving the result of compute() from the session when it was computed before for the same inputs: the point cloud files, the
+# revision of the model the result depends on (if any) and any other parameters
+def session_result(name, compute, files=(), model_to_match=None, parameters=()):
+    from updateSession import files_key
+    model_key = get_session().model_key(model_to_match) if model_to_match is not None else None
+    return get_session().cached((name, files_key(files), model_key, tuple(parameters)), compute)
 
 
 # Function to load and process the STEP file
-def load_step_file(file_path):
+# step_shapes can be given when the file was already read in the background
+def load_step_file(file_path, step_shapes=None):
     global stp_filename, shapes_labels_colors
     stp_filename = file_path
-    shapes_labels_colors = read_step_file_with_names_colors(stp_filename)
+    if step_shapes is None:
+        from OCC.Extend.DataExchange import read_step_file_with_names_colors
+        step_shapes = read_step_file_with_names_colors(stp_filename)
+    shapes_labels_colors = step_shapes
     print("STEP file loaded successfully:", stp_filename)
     # Always when a new STEP file is loaded the display is cleared and updated
     update_display()
 
 # Function to update the display with the loaded geometry
 def update_display():
-    global shapes_labels_colors
+    global shapes_labels_colors, displayed_shapes
     display.EraseAll()
+    displayed_shapes = {}
+    if lod_viewer is not None:
+        lod_viewer.clear()
     for shape, (_, color) in shapes_labels_colors.items():
         display.DisplayColoredShape(shape, color)
 
-# Function to convert IFC to STEP and load it for visualization of the project
-def convert_ifc_to_step_and_load():
+# Function to show the tessellated element with a given GlobalId, keeping track of its shapes in the viewer
+def display_element(guid):
+    from OCC.Core.Quantity import Quantity_Color, Quantity_TOC_RGB
+    shape, color = geometry_cache.shape(guid)
+    if shape is not None:
+        displayed_shapes[guid] = display.DisplayColoredShape(shape, Quantity_Color(*color, Quantity_TOC_RGB), update=False)
+
+# Function to remove the shapes of an element from the viewer
+def erase_element(guid):
+    for ais_shape in displayed_shapes.pop(guid, None) or []:
+        display.Context.Remove(ais_shape, False)
+
+# Function to tessellate the model in memory, instead of writing it to STEP and reading it back. The first time a model is shown
+# everything is tessellated, after an update only the elements whose placement or representation changed are tessellated again.
+# Nothing is drawn here, so this can run in the background, and apply_model_geometry then swaps the shapes in the viewer
+def prepare_model_geometry(model_to_show, ifc_file_path=None):
+    global geometry_cache
+    from geometryCache import GeometryCache
+    if geometry_cache is None:
+        geometry_cache = GeometryCache()
+    # a different model was opened, or the viewer was cleared by loading a STEP file, so everything has to be drawn again
+    full_redraw = geometry_cache.model is not model_to_show or not displayed_shapes
+    # when a file was just opened its tessellation can come from the conversion cache, and is stored there if it was not yet
+    cache_key = None
+    if ifc_file_path and geometry_cache.model is not model_to_show:
+        from conversionCache import cache_key as conversion_key
+        from ifcTessellator import settings_key
+        cache_key = conversion_key(ifc_file_path, settings_key())
+        cached_paths = get_conversion_cache().get(cache_key, ['.brep', '.json'])
+        if cached_paths:
+            geometry_cache.load(model_to_show, *cached_paths)
+            print("Tessellation loaded from the conversion cache.")
+            cache_key = None
+    added, changed, removed = geometry_cache.refresh(model_to_show)
+    if cache_key is not None:
+        brep_path = get_conversion_cache().temporary_path('.brep')
+        json_path = get_conversion_cache().temporary_path('.json')
+        geometry_cache.save(brep_path, json_path)
+        get_conversion_cache().put(cache_key, {'.brep': brep_path, '.json': json_path})
+    return {'full_redraw': full_redraw, 'added': added, 'changed': changed, 'removed': removed,
+            'shapes_labels_colors': geometry_cache.shapes_labels_colors()}
+
+# Function to show the result of prepare_model_geometry in the viewer, on the thread of the interface. After an update only the elements
+# that changed are swapped, the rest of the building stays as it is
+def apply_model_geometry(geometry_update):
+    global shapes_labels_colors, point_cloud_scale, displayed_shapes
+    shapes_labels_colors = geometry_update['shapes_labels_colors']
+    point_cloud_scale = 1.0
+    if geometry_update['full_redraw']:
+        display.EraseAll()
+        displayed_shapes = {}
+        if lod_viewer is not None:
+            lod_viewer.clear()
+        for guid in geometry_cache.entries:
+            display_element(guid)
+        print("IFC model tessellated:", len(shapes_labels_colors), "shapes.")
+    else:
+        for guid in geometry_update['changed'] + geometry_update['removed']:
+            erase_element(guid)
+        for guid in geometry_update['added'] + geometry_update['changed']:
+            display_element(guid)
+        print(f"Viewer refreshed: {len(geometry_update['added'])} elements added, {len(geometry_update['changed'])} changed, {len(geometry_update['removed'])} removed.")
+    display.Context.UpdateCurrentViewer()
+
+# Function to get the conversion cache, created the first time it is needed
+def get_conversion_cache():
+    global conversion_cache
+    if conversion_cache is None:
+        from conversionCache import ConversionCache
+        conversion_cache = ConversionCache()
+    return conversion_cache
+
+# Function giving the IfcConvert executable and a description of it for the keys of the conversion cache: its path, modification time and
+# the version it prints, so STEP files made by an earlier IfcConvert are not served after it was upgraded
+ifcconvert_versions = {}
+def ifcconvert_settings():
+    import shutil
+    executable = shutil.which('IfcConvert')
+    if executable is None:
+        raise RuntimeError("IfcConvert was not found, install it and add it to the PATH, or turn off use_ifcconvert")
+    mtime_ns = os.stat(executable).st_mtime_ns
+    if (executable, mtime_ns) not in ifcconvert_versions:
+        completed = subprocess.run([executable, '--version'], capture_output=True, text=True)
+        ifcconvert_versions[(executable, mtime_ns)] = (completed.stdout or completed.stderr).strip()
+    return executable, {'converter': 'IfcConvert', 'executable': executable, 'mtime_ns': mtime_ns,
+                        'version': ifcconvert_versions[(executable, mtime_ns)]}
+
+# Function to convert an IFC file to STEP with IfcConvert and read it, the older way of visualizing the model. The STEP file is kept in
+# the conversion cache, so IfcConvert only runs for IFC files it did not convert before. It can run in the background, the shapes are
+# shown afterwards by load_step_file
+def prepare_step_file(ifc_file_path):
+    from conversionCache import cache_key
+    from ifcWriter import wait_for_file
+    # an updated model may still be being written in the background
+    ifc_file_path = wait_for_file(ifc_file_path)
+    executable, settings = ifcconvert_settings()
+    key = cache_key(ifc_file_path, settings)
+    cached_paths = get_conversion_cache().get(key, ['.stp'])
+    if cached_paths:
+        step_file_path = cached_paths[0]
+    else:
+        # IfcConvert writes into a temporary file in the cache folder, which is then moved into place
+        temporary_step_file_path = get_conversion_cache().temporary_path('.stp')
+        os.remove(temporary_step_file_path)
+        # normally IfcConvert would be run on the command shell, but this can be automated using subprocess. Its progress is printed on the
+        # console as before, its errors are kept for the message of the job
+        try:
+            subprocess.run([executable, ifc_file_path, temporary_step_file_path], check=True, stderr=subprocess.PIPE, text=True)
+        except subprocess.CalledProcessError as e:
+            output = (e.stderr or '').strip()
+            raise RuntimeError(f"IfcConvert could not convert {ifc_file_path} (exit code {e.returncode}): {output[-2000:]}") from None
+        if not os.path.exists(temporary_step_file_path):
+            raise RuntimeError(f"IfcConvert did not write a STEP file for {ifc_file_path}")
+        step_file_path = get_conversion_cache().put(key, {'.stp': temporary_step_file_path})[0]
+    from OCC.Extend.DataExchange import read_step_file_with_names_colors
+    return step_file_path, read_step_file_with_names_colors(step_file_path)
+
+# Function to prepare the geometry of the model after it was opened or updated, without touching the viewer. ifc_file_path is the IFC
+# file the model was read from or written to. opened is True when the file was just opened, then the tessellation of the whole model
+# can be served from the conversion cache
+def prepare_view(model_to_show, ifc_file_path, opened=False):
+    if use_ifcconvert:
+        return {'step': prepare_step_file(ifc_file_path)}
+    return {'geometry': prepare_model_geometry(model_to_show, ifc_file_path if opened else None)}
+
+# Function to show the result of prepare_view in the viewer
+def apply_view(view):
+    global point_cloud_scale
+    if 'step' in view:
+        step_file_path, step_shapes = view['step']
+        point_cloud_scale = 1e6
+        load_step_file(step_file_path, step_shapes)
+    else:
+        apply_model_geometry(view['geometry'])
+    # FitAll adjusts the zoom of the loaded geometry to fit the screen nicely
+    display.FitAll()
+
+# Function to run the stages of an operation in the background (see backgroundJobs.py), so the viewer stays responsive while e.g. an IFC
+# file is opened or walls are matched. A progress dialog shows which stage is running and allows to cancel the operation before the next
+# stage starts. on_done receives the state the stages filled in, on the thread of the interface, and is where the viewer gets changed
+def start_job(name, stages, on_done=None):
+    global job_runner, progress_dialog
+    from backgroundJobs import BackgroundJob, JobRunner, JobCancelled
+    from PyQt5.QtWidgets import QProgressDialog, QMessageBox
+    if job_runner is None:
+        job_runner = JobRunner()
+    if job_runner.busy():
+        print(f"{job_runner.job.name} is still running, wait for it to finish or cancel it first.")
+        return None
+    job = BackgroundJob(name, stages)
+    progress_dialog = QProgressDialog(name, "Cancel", 0, len(stages))
+    progress_dialog.setWindowTitle(name)
+    progress_dialog.setMinimumDuration(0)
+    progress_dialog.canceled.connect(job.cancel)
+
+    def on_progress(index, total, description):
+        print(f"{name}: {description}")
+        progress_dialog.setLabelText(description)
+        progress_dialog.setValue(index)
+
+    def on_finished(state):
+        progress_dialog.reset()
+        if on_done is not None:
+            on_done(state)
+
+    def on_error(error, details):
+        progress_dialog.reset()
+        # an update that failed or was cancelled halfway is rolled back, so the model is as it was before the update started
+        transaction = job.state.get('transaction')
+        if transaction is not None and transaction.active:
+            restore_model(transaction.rollback())
+            print(f"{name}: the changes to the model were rolled back.")
+        if isinstance(error, JobCancelled):
+            print(error)
+            return
+        print(details)
+        msg = QMessageBox()
+        msg.setIcon(QMessageBox.Warning)
+        msg.setWindowTitle(name)
+        msg.setText(f"{name} failed: {error}")
+        msg.exec_()
+
+    progress_dialog.show()
+    job_runner.start(job, on_done=on_finished, on_error=on_error, on_progress=on_progress)
+    return job
+
+# Function wrapping the stages of an update in a transaction, which start_job rolls back if a stage fails or the job is cancelled
+def update_stages(current_model, stages):
+    def begin(state):
+        from modelTransaction import ModelTransaction
+        state['transaction'] = ModelTransaction(current_model).begin()
+
+    def commit(state):
+        state['transaction'].commit()
+        update_history.append(state['transaction'])
+        del update_history[:-UNDO_LEVELS]
+
+    return [("Starting the update", begin)] + stages + [("Keeping the changes", commit)]
+
+# Function to make the given model the current one, after a rollback or an undo that had to read the model again from a snapshot
+def restore_model(restored_model):
     global model
-    model = None
+    model = restored_model
+    get_session().model_changed(restored_model)
+
+# Function to undo the last update, the model goes back to how it was before it, and the viewer is updated
+def undo_last_update():
+    if not update_history:
+        print("No update to undo.")
+        return
+    transaction = update_history.pop()
+
+    def undo(state):
+        state['model'] = transaction.undo()
+
+    def prepare_geometry(state):
+        ifc_file_path = None
+        if use_ifcconvert:
+            # IfcConvert needs a file, the model as it was is written like an updated model would be
+            from datetime import datetime
+            from ifcWriter import write_in_background
+            ifc_file_path = write_in_background(state['model'], f"modified_ifc_file_{datetime.now().strftime('%d%m%y_%H%M')}.ifc")
+        state['view'] = prepare_view(state['model'], ifc_file_path)
+
+    def done(state):
+        restore_model(state['model'])
+        apply_view(state['view'])
+        print("Last update undone.")
+
+    start_job("Undo", [("Undoing the last update", undo), ("Preparing the geometry for the viewer", prepare_geometry)], done)
+
+# Function giving the stage that waits until the IFC file of an update is written in the background (see ifcWriter.py), so a write that
+# failed, e.g. on a full disk, is shown as the error of the job instead of the update being reported as written. It comes after the
+# geometry for the viewer is prepared, which does not need the file. ifc_file_path finds the PendingWrite in the state of the job
+def written_file_stages(ifc_file_path):
+    def wait(state):
+        from ifcWriter import wait_for_file
+        wait_for_file(ifc_file_path(state))
+
+    return [("Finishing the IFC file", wait)]
+
+# Function giving the stage that writes a .glb next to the IFC file written by an update, if write_glb_after_update is set.
+# ifc_file_path is a function that finds the path of the written IFC file in the state of the job
+def glb_stages(current_model, ifc_file_path):
+    if not write_glb_after_update:
+        return []
+
+    def export(state):
+        from meshExporter import export_glb
+        export_glb(current_model, os.path.splitext(ifc_file_path(state))[0] + '.glb')
+
+    return [("Exporting the glTF mesh", export)]
+
+# Function to export the current model as a binary glTF mesh, with one node per element named by its GlobalId
+def export_model_as_glb():
+    if model is None:
+        print("Open an IFC file first.")
+        return
+    file_path, _ = QFileDialog.getSaveFileName(None, "Export glTF", "", "glTF binary (*.glb)")
+    if not file_path:
+        return
+    current_model = model
+
+    def export(state):
+        from meshExporter import export_glb
+        export_glb(current_model, file_path)
+
+    start_job("Export glTF", [("Exporting the glTF mesh", export)], lambda state: print("glTF exported:", file_path))
+
+# Function to open an IFC file and tessellate it (or convert it to STEP) for visualization of the project
+def convert_ifc_to_step_and_load():
     # Use PyQt5 to allow us to find a file with the .ifc extension anywhere in our computer
     ifc_file_path, _ = QFileDialog.getOpenFileName(None, "Open IFC File", "", "IFC files (*.ifc)")
-    if ifc_file_path:
+    if not ifc_file_path:
+        return
+
+    def open_model(state):
         # Open the IFC file selected with IfcOpenShell to use and edit information in it based on the IFC schema
-        ifc_file = ifcopenshell.open(ifc_file_path)
-        # Convert the IFC file to a STEP file for later visualization
-        step_file_path = ifc_file_path.replace('.ifc', '.stp')
-        # To avoid a crash that could be caused if there was already a STEP file with the same name in the folder 
-        # (e.g. you are going several tests), replace it automatically
-        if os.path.exists(step_file_path):
-            os.remove(step_file_path)
-        command = f'IfcConvert "{ifc_file_path}" "{step_file_path}"'
-        # normally IfcConvert would be run on the command shell, but this can be automated using subprocess
-        subprocess.run(command, shell=True)
-        model = ifc_file
-        # Load and visualize the converted STEP file
-        load_step_file(step_file_path)
-        # FitAll adjusts the zoom of the loaded geometry to fit the screen nicely
-        display.FitAll()
-    return model
+        state['model'] = ifcopenshell.open(ifc_file_path)
+
+    def prepare_geometry(state):
+        # Tessellate the model for visualization (or convert it to a STEP file, if use_ifcconvert is set), or take it from the
+        # conversion cache if this file was opened before
+        state['view'] = prepare_view(state['model'], ifc_file_path, opened=True)
+
+    def done(state):
+        global model
+        model = state['model']
+        # results of the previous model are of no use anymore
+        if session is not None:
+            session.clear()
+        update_history.clear()
+        apply_view(state['view'])
+
+    start_job("Open IFC", [("Opening the IFC file", open_model), ("Preparing the geometry for the viewer", prepare_geometry)], done)
 
 
 def read_point_cloud(file_path):
     # These factors here are just used for the function that visualizes point clouds in the interface, and not in the semantic processing of point cloud
     # for building update. Because the conversion from IFC to STEP (the latter also just used for visualization) often changes the units from the IFC file,
-    # making the distances much bigger in the step file, usually a order of 1E6 (1 million), here the point cloud is also scaled up by 1E6 to overlap with the 
-    # BIM geometry data
-    scale_factor = 1e6
-    points = []
-    with open(file_path, 'r') as f:
-        for line in f:
-            parts = line.split()
-            if len(parts) >= 3:  # Ensure there are at least 3 components
-                x, y, z = map(float, parts[:3])
-                points.append((x * scale_factor, y * scale_factor, z * scale_factor))
-    return points
+    # making the distances much bigger in the step file, usually a order of 1E6 (1 million), the point cloud is also scaled up by 1E6 to overlap with the 
+    # BIM geometry data when STEP files are shown. The model tessellated in memory keeps the units of the IFC file, and then no scaling is needed.
+    # The points are read in bulk into NumPy arrays (coordinates and, if the file has them, RGB colours), the scale is not multiplied into the
+    # coordinates but given to display_point_cloud, which sets it as the transformation of the point cloud in the viewer
+    from pointCloudDisplay import read_point_cloud_array
+    return read_point_cloud_array(file_path)
 
 # Function to display the point cloud
-def display_point_cloud(points):
-    # This is the function that allows the visualization of point clouds in the OpenCascade viewer
-    n_points = len(points)
-    points_3d = Graphic3d_ArrayOfPoints(n_points)
-    for point in points:
-        x, y, z = point
-        points_3d.AddVertex(x, y, z)
-    point_cloud = AIS_PointCloud()
-    point_cloud.SetPoints(points_3d)
-    #standard color for points is set to blue, other values can be obtained changing the 0.0, 0.0, 1.0 values below ( that stand for RGB values, respectively)
-    blue_color = Quantity_Color(0.0, 0.0, 1.0, Quantity_TOC_RGB)
-    point_cloud.SetColor(blue_color)
-    point_cloud.SetWidth(5.0) # point size
+def display_point_cloud(points, colors=None, scale=1.0):
+    # This is the function that allows the visualization of point clouds in the OpenCascade viewer. Points without colours are blue, see
+    # pointCloudDisplay.make_point_cloud for the colour and the size of the points
+    from pointCloudDisplay import make_point_cloud
+    point_cloud = make_point_cloud(points, colors=colors, scale=scale)
     ais_context = display.GetContext()
     ais_context.Display(point_cloud, True)
     display.View_Iso()
@@ -96,15 +430,30 @@ def display_point_cloud(points):
 
 def load_point_cloud_file():
     # Initial function accessed from the menu that loads point clouds exclusivelly for visualization. First PyQt5 allows the user to find the
-    # file in their computer, then the points are scaled up to overlap with the STEP geometry, and then the point cloud is visualized using the OCC
-    # function above ( display_point_cloud(points) )
+    # file in their computer, then the octree of the point cloud is built (or taken from the conversion cache), and then the point cloud is
+    # visualized with levels of detail, scaled up to overlap with the STEP geometry (see pointCloudLod.py and display_point_cloud above)
 
-    file_path, _ = QFileDialog.getOpenFileName(None, "Open Point Cloud File", "", "Point Cloud Files (*.xyz *.txt)")
+    file_path, _ = QFileDialog.getOpenFileName(None, "Open Point Cloud File", "", "Point Cloud Files (*.xyz *.txt *.qpc)")
     if not file_path:
         return
 
-    points = read_point_cloud(file_path)
-    display_point_cloud(points)
+    def read(state):
+        from pointCloudLod import load_octree
+        state['octree'] = load_octree(file_path, cache=get_conversion_cache())
+
+    def done(state):
+        # the scale is taken when the points are shown, so it follows the geometry that is in the viewer at that moment
+        # the nodes are only chosen once the camera fits the model and the new cloud, whose bounds are known before any node is shown
+        lod = get_lod_viewer()
+        lod.add(state['octree'], scale=point_cloud_scale, refresh=False)
+        display.View_Iso()
+        box = lod.bounding_box()
+        box.Add(display.View.View().MinMaxValues())
+        display.View.FitAll(box, 0.01, False)
+        lod.refresh(force=True)
+        print("Point cloud loaded with", int(state['octree'].counts.sum()), "points.")
+
+    start_job("Point Cloud", [("Reading the point cloud", read)], done)
 
 # Function to load segmented walls
 renamed_files = []
@@ -135,13 +484,22 @@ def load_segmented_walls():
 def check_walls_and_report():
     # Compares point cloud data from segmented walls with the walls of the as-designed IFC file, and outputs the matched and unmatched walls, 
     # producing an Excel report. A simpler version of Room Mode, where the entire IFC file is checked and liable to updates and deletions
-    global model
-    from wallChecker import process_seg_walls
-    potet1 = process_seg_walls(renamed_files)
-    from wallChecker import wallMatcher
-    potet2, potet3 = wallMatcher(model = model, wall_dict = potet1)
-    from wallChecker import resultsExcel
-    resultsExcel(model = model, wall_dict = potet1, ifc_walls_matched = potet2, point_cloud_walls_matched = potet3)
+    from wallChecker import process_seg_walls, wallMatcher, resultsExcel
+    current_model, wall_files = model, list(renamed_files)
+
+    def read_walls(state):
+        state['potet1'] = session_result('process_seg_walls', lambda: process_seg_walls(wall_files), files=wall_files)
+
+    def match_walls(state):
+        # kept in the session, so update_ifc_walls can reuse the match if neither the walls nor the model changed in between
+        state['potet2'], state['potet3'] = session_result('wallMatcher', lambda: wallMatcher(model = current_model, wall_dict = state['potet1'], report = get_match_report()),
+                                                          files=wall_files, model_to_match=current_model)
+
+    def write_report(state):
+        resultsExcel(model = current_model, wall_dict = state['potet1'], ifc_walls_matched = state['potet2'], point_cloud_walls_matched = state['potet3'])
+
+    start_job("Check walls", [("Reading the segmented walls", read_walls), ("Matching walls", match_walls), ("Writing the report", write_report)],
+              lambda state: print("Wall check finished."))
 
 # Function to update IFC walls 
 def update_ifc_walls():
@@ -150,95 +508,133 @@ def update_ifc_walls():
     # wallMatcher.py and wallCreaTor.py and wallDeleter.py. This produces a simpler update compared to Room Mode, Room Mode updates the geometry
     # with more adjustments and optimizations, this could be considered a sort of legacy version of Room Mode. Both here and in Room Mode the walls
     # handled are IfcWallStandardCase entities following a manhattan world assumption. Diagonal walls might make the script crash.
-    global model
-    from wallChecker import process_seg_walls
-    potet1 = process_seg_walls(renamed_files)
-    # match walls to know which ones are matched and therefore which ones should be deleted (IFC walls) or created (point cloud into ifc)
-    from wallChecker import wallMatcher
-    potet2, potet3 = wallMatcher(model=model, wall_dict=potet1)
-    
+    from wallChecker import process_seg_walls, wallMatcher
     from wallRemover import wallDeleter
-    # first delete all unmatched walls, so that new walls only get connected to validated pre existing walls
-    wallDeleter(model=model, ifc_walls_matched=potet2)
-    
-    # Now we can create new walls based on the point cloud geometry, for walls that did not exist yet in the IFC model
-    # or walls that need a corrected position
     from wallUpdaTor import wallCreaTor
-    potet4 = wallCreaTor(model=model, wall_dict=potet1, ifc_walls_matched=potet2, point_cloud_walls_matched=potet3)
-    
-    # Update step file and give it a name with the date and time at the time of update
-    from datetime import datetime
-    current_datetime = datetime.now()
-    formatted_datetime = current_datetime.strftime("%d%m%y_%H%M")
-    step_new_filename = f"updated_model_{formatted_datetime}.stp"
-    
-    command = f'IfcConvert "{potet4}" "{step_new_filename}"'
-    subprocess.run(command, shell=True)
-    load_step_file(step_new_filename)
-    display.FitAll()
+    current_model, wall_files = model, list(renamed_files)
+
+    def read_walls(state):
+        state['potet1'] = session_result('process_seg_walls', lambda: process_seg_walls(wall_files), files=wall_files)
+
+    def match_walls(state):
+        # match walls to know which ones are matched and therefore which ones should be deleted (IFC walls) or created (point cloud into ifc),
+        # or reuse the match of check_walls_and_report if it was made with the same walls and model
+        state['potet2'], state['potet3'] = session_result('wallMatcher', lambda: wallMatcher(model=current_model, wall_dict=state['potet1'], report=get_match_report()),
+                                                          files=wall_files, model_to_match=current_model)
+
+    def delete_walls(state):
+        # first delete all unmatched walls, so that new walls only get connected to validated pre existing walls
+        get_session().model_changed(current_model)
+        wallDeleter(model=current_model, ifc_walls_matched=state['potet2'], report=get_match_report())
+
+    def create_walls(state):
+        # Now we can create new walls based on the point cloud geometry, for walls that did not exist yet in the IFC model
+        # or walls that need a corrected position
+        state['potet4'] = wallCreaTor(model=current_model, wall_dict=state['potet1'], ifc_walls_matched=state['potet2'], point_cloud_walls_matched=state['potet3'], report=get_match_report())
+
+    def prepare_geometry(state):
+        # The updated model is tessellated straight from memory instead of being converted from the IFC file just written
+        state['view'] = prepare_view(current_model, state['potet4'])
+
+    start_job("Update walls", update_stages(current_model, [("Reading the segmented walls", read_walls), ("Matching walls", match_walls), ("Deleting unmatched walls", delete_walls),
+                                                            ("Creating new walls and writing the IFC file", create_walls)])
+              + [("Preparing the geometry for the viewer", prepare_geometry)]
+              + glb_stages(current_model, lambda state: state['potet4'])
+              + written_file_stages(lambda state: state['potet4']),
+              lambda state: apply_view(state['view']))
 
 # Function to load point cloud file and generate alpha hull (the concave hull that envolves only the scanned area in Room Mode)
 def load_total_scanned_area():
-    global alpha_hull
     # find the point cloud of the scanned area in any folder
-    file_path, _ = QFileDialog.getOpenFileName(None, "Open Point Cloud File", "", "Point Cloud Files (*.xyz *.txt)")
+    file_path, _ = QFileDialog.getOpenFileName(None, "Open Point Cloud File", "", "Point Cloud Files (*.xyz *.txt *.qpc)")
     if not file_path:
         return
     # here in the read_point_cloud2 a scale of 10E6 (1 million up) is NOT used, unlike for visualization, because the point cloud is at the same
     # scale as the IFC file, unlike the STEP file that is being visualized
-    from wallCheckerRM import read_point_cloud2
-    from wallCheckerRM import compute_2d_concave_hull_and_extrude
-    points = read_point_cloud2(file_path)
-    display_point_cloud(points)
-    # Generate the alpha hull
-    alpha = 0.5 # Adjust alpha as needed it is a factor that can look for more or less concavities in the data, 0.5 works in the vast majority of cases
-    alpha_hull = compute_2d_concave_hull_and_extrude(points, alpha)
-    print("Alpha hull generated.")
+    from wallCheckerRM import read_point_cloud2, compute_2d_concave_hull_and_extrude, hull_z_range, plot_extruded_hull
+
+    def read(state):
+        state['points'] = read_point_cloud2(file_path)
+
+    def generate_hull(state):
+        # Generate the alpha hull, the plot of it is made afterwards on the thread of the interface
+        alpha = 0.5 # Adjust alpha as needed it is a factor that can look for more or less concavities in the data, 0.5 works in the vast majority of cases
+        # the same scanned area opened again gives the same hull, which is then taken from the session
+        state['alpha_hull'] = session_result('alpha hull', lambda: compute_2d_concave_hull_and_extrude(state['points'], alpha, plot=False),
+                                             files=[file_path], parameters=(alpha,))
+        state['z_range'] = hull_z_range(state['points'])
+
+    def done(state):
+        global alpha_hull
+        display_point_cloud(state['points'])
+        alpha_hull = state['alpha_hull']
+        print("Alpha hull generated.")
+        plot_extruded_hull(alpha_hull, *state['z_range'])
+
+    start_job("Scanned area", [("Reading the point cloud", read), ("Generating the alpha hull", generate_hull)], done)
 
 # Function to check walls against alpha hull for Room Mode
 # Here ifc walls are checked to see if they match point cloud data only within the volume/region scanned
 def check_RM_walls_and_report():
-    global model, alpha_hull
     if not alpha_hull:
         print("Alpha hull not generated.")
         return
-    
-    from wallCheckerRM import process_seg_wallsRM, wallMatcherRM, extrPoints, is_within_alpha_hull
-    point_cloud_walls = process_seg_wallsRM(renamed_files)
-    # This time, the alpha hull is also used as a an argument for the function, as the check of walls is only done in the region comprised by the alpha hull
-    # furthermore, a buffer size is added, that creates a tolerance around the scanned region to accept a possible wall start or end that was just outside the scanned area
-    ifc_walls_matched, point_cloud_walls_matched, ifc_walls_to_delete = wallMatcherRM(model, point_cloud_walls, alpha_hull, buffer_size=0.70)
-    
-    from wallCheckerRM import resultsExcel
-    # Here an excel report is made of the walls that had to be deleted, had to be created, and the walls that were kept/matched
-    resultsExcel(model = model, wall_dict = point_cloud_walls, ifc_walls_matched = ifc_walls_matched, point_cloud_walls_matched = point_cloud_walls_matched, alpha_hull = alpha_hull)
-    print("IFC walls to delete:", ifc_walls_to_delete)
+    from wallCheckerRM import process_seg_wallsRM, wallMatcherRM, resultsExcel
+    current_model, current_alpha_hull, wall_files = model, alpha_hull, list(renamed_files)
+
+    def read_walls(state):
+        state['point_cloud_walls'] = session_result('process_seg_wallsRM', lambda: process_seg_wallsRM(wall_files), files=wall_files)
+
+    def match_walls(state):
+        # This time, the alpha hull is also used as a an argument for the function, as the check of walls is only done in the region comprised by the alpha hull
+        # furthermore, a buffer size is added, that creates a tolerance around the scanned region to accept a possible wall start or end that was just outside the scanned area
+        state['ifc_walls_matched'], state['point_cloud_walls_matched'], state['ifc_walls_to_delete'] = session_result(
+            'wallMatcherRM', lambda: wallMatcherRM(current_model, state['point_cloud_walls'], current_alpha_hull, buffer_size=0.70, report=get_match_report()),
+            files=wall_files, model_to_match=current_model, parameters=(id(current_alpha_hull), 0.70))
+
+    def write_report(state):
+        # Here an excel report is made of the walls that had to be deleted, had to be created, and the walls that were kept/matched
+        resultsExcel(model = current_model, wall_dict = state['point_cloud_walls'], ifc_walls_matched = state['ifc_walls_matched'], point_cloud_walls_matched = state['point_cloud_walls_matched'], alpha_hull = current_alpha_hull)
+
+    start_job("Check Room Mode walls", [("Reading the segmented walls", read_walls), ("Matching walls in the scanned area", match_walls), ("Writing the report", write_report)],
+              lambda state: print("IFC walls to delete:", state['ifc_walls_to_delete']))
 
 # Function to update IFC walls based on alpha hull for Room Mode
 # Based on the check to see which IFC walls are inside the alpha hull, those walls are checked against point cloud data and liable to being matched or deleted
 # If necessary, new IFC walls are created based on point cloud data, and they are enrichted with semantics from the model based on several heuristic principles
 # This check and update of geometry at this Room Mode version is much more complex than the other one and handles many more exceptions and optimizations
 def update_RM_ifc_walls():
-    global model, alpha_hull
-    from wallCheckerRM import process_seg_wallsRM
-    point_cloud_walls = process_seg_wallsRM(renamed_files)
-    from wallCheckerRM import wallMatcherRM
-    ifc_walls_matched, point_cloud_walls_matched, ifc_walls_to_delete = wallMatcherRM(model, point_cloud_walls, alpha_hull, buffer_size=0.70)
-    # The wallMatcherRM function is a bit different from the older wallMatcher function, and here it also produces an "ifc_walls_to_delete" list, 
-    # which makes that the wallDeleter function also works a bit differently and does not parse walls from the entire project but just the preselected ones
+    from wallCheckerRM import process_seg_wallsRM, wallMatcherRM
     from wallRemoverRM import wallDeleterRM
-    wallDeleterRM(model=model, ifc_walls_to_delete = ifc_walls_to_delete)
     from wallUpdaTor import wallCreaTor
-    potet4 = wallCreaTor(model=model, wall_dict=point_cloud_walls, ifc_walls_matched=ifc_walls_matched, point_cloud_walls_matched=point_cloud_walls_matched)
-    from datetime import datetime
-    current_datetime = datetime.now()
-    formatted_datetime = current_datetime.strftime("%d%m%y_%H%M")
-    step_new_filename = f"updated_model_{formatted_datetime}.stp"
-    command = f'IfcConvert "{potet4}" "{step_new_filename}"'
-    subprocess.run(command, shell=True)
-    load_step_file(step_new_filename)
-    display.FitAll()    
+    current_model, current_alpha_hull, wall_files = model, alpha_hull, list(renamed_files)
 
+    def read_walls(state):
+        state['point_cloud_walls'] = session_result('process_seg_wallsRM', lambda: process_seg_wallsRM(wall_files), files=wall_files)
+
+    def match_walls(state):
+        state['ifc_walls_matched'], state['point_cloud_walls_matched'], state['ifc_walls_to_delete'] = session_result(
+            'wallMatcherRM', lambda: wallMatcherRM(current_model, state['point_cloud_walls'], current_alpha_hull, buffer_size=0.70, report=get_match_report()),
+            files=wall_files, model_to_match=current_model, parameters=(id(current_alpha_hull), 0.70))
+
+    def delete_walls(state):
+        # The wallMatcherRM function is a bit different from the older wallMatcher function, and here it also produces an "ifc_walls_to_delete" list, 
+        # which makes that the wallDeleter function also works a bit differently and does not parse walls from the entire project but just the preselected ones
+        get_session().model_changed(current_model)
+        wallDeleterRM(model=current_model, ifc_walls_to_delete = state['ifc_walls_to_delete'], report=get_match_report())
+
+    def create_walls(state):
+        state['potet4'] = wallCreaTor(model=current_model, wall_dict=state['point_cloud_walls'], ifc_walls_matched=state['ifc_walls_matched'], point_cloud_walls_matched=state['point_cloud_walls_matched'], report=get_match_report())
+
+    def prepare_geometry(state):
+        state['view'] = prepare_view(current_model, state['potet4'])
+
+    start_job("Update Room Mode walls", update_stages(current_model, [("Reading the segmented walls", read_walls), ("Matching walls in the scanned area", match_walls), ("Deleting unmatched walls", delete_walls),
+                                                                      ("Creating new walls and writing the IFC file", create_walls)])
+              + [("Preparing the geometry for the viewer", prepare_geometry)]
+              + glb_stages(current_model, lambda state: state['potet4'])
+              + written_file_stages(lambda state: state['potet4']),
+              lambda state: apply_view(state['view']))
 
 # Here the ceiling block starts, and similarly as with walls several segmented ceiling files, in the form of point clouds, can be loaded at once,
 # and each file of a ceiling is renamed as ceiling1, ceiling2, ceiling3, etc.
@@ -260,22 +656,27 @@ def load_segmented_ceilings():
 
 
 def check_ceilings_and_update():
-    global model
     from ceilingUpdaTor import check_and_update_ceilings, process_seg_ceilings
-    # first the segmented ceilings are parsed to extract relevant geometrical information about them and make a dictionary with each ceiling as an item and 
-    # relevant data attached to that ceiling also in the dictionary
-    pc_ceilings = process_seg_ceilings(renamed_ceilings)
-    # then the matching and update of ceiling heights is done based on the geometry extracted from the point clouds, for more information check ceilingUpdaTor.py
-    new_model2 = check_and_update_ceilings(model=model, pc_ceilings=pc_ceilings)
-    from datetime import datetime
-    current_datetime = datetime.now()
-    formatted_datetime = current_datetime.strftime("%d%m%y_%H%M")
-    step_new_filename2 = f'updated_model_{formatted_datetime}.stp'
-    command = f'IfcConvert "{new_model2}" "{step_new_filename2}"'
-    subprocess.run(command, shell=True)
-    load_step_file(step_new_filename2)
-    display.FitAll()
+    current_model = model
 
+    def read_ceilings(state):
+        # first the segmented ceilings are parsed to extract relevant geometrical information about them and make a dictionary with each ceiling as an item and 
+        # relevant data attached to that ceiling also in the dictionary
+        state['pc_ceilings'] = process_seg_ceilings(renamed_ceilings)
+
+    def update_ceilings(state):
+        # then the matching and update of ceiling heights is done based on the geometry extracted from the point clouds, for more information check ceilingUpdaTor.py
+        get_session().model_changed(current_model)
+        state['new_model2'] = check_and_update_ceilings(model=current_model, pc_ceilings=state['pc_ceilings'], report=get_match_report())
+
+    def prepare_geometry(state):
+        state['view'] = prepare_view(current_model, state['new_model2'])
+
+    start_job("Update ceilings", update_stages(current_model, [("Reading the segmented ceilings", read_ceilings), ("Updating ceilings and writing the IFC file", update_ceilings)])
+              + [("Preparing the geometry for the viewer", prepare_geometry)]
+              + glb_stages(current_model, lambda state: state['new_model2'])
+              + written_file_stages(lambda state: state['new_model2']),
+              lambda state: apply_view(state['view']))
 
 # Here the column block starts, and similarly as with walls, several segmented column files, in the form of point clouds, can be loaded at once,
 # and each file of a column is renamed as column1, column2, column3, etc
@@ -307,54 +708,60 @@ def load_segmented_columns():
 # comparing it to the as-designed project. Depending on the case, the user is advised to look at the superimposion of point cloud and IFC geometry and
 # possibly do a manual intervention, apart from the automated update
 def check_columns_and_update():
-    from PyQt5.QtWidgets import QMessageBox, QFileDialog
-    global model
     from columnUpdaTor import check_and_update_columns, process_seg_columns
-    
-    # Process the segmented columns
-    pc_columns = process_seg_columns(renamed_columns)
-    
-    # Perform the column check, update and get the results and warnings
-    update_results = check_and_update_columns(model=model, pc_columns=pc_columns)
-    
-    # Extract results from the dictionary returned by check_and_update_columns
-    new_filename = update_results['new_filename']
-    num_ifc_emb_columns_no_match = update_results['num_ifc_emb_columns_no_match']
-    message2 = update_results['message']
-    num_unmatched_free_columns = update_results['num_unmatched_free_ifc_columns']
-    
-    # Convert the updated IFC file to STEP format
-    from datetime import datetime
-    current_datetime = datetime.now()
-    formatted_datetime = current_datetime.strftime("%d%m%y_%H%M")
-    step_new_filename3 = f'updated_model_{formatted_datetime}.stp'
-    command = f'IfcConvert "{new_filename}" "{step_new_filename3}"'
-    subprocess.run(command, shell=True)
-    
-    # Load the new STEP file into the viewer
-    load_step_file(step_new_filename3)
-    display.FitAll()
-
-    # Display a message box with the results
-    msg = QMessageBox()
-    msg.setIcon(QMessageBox.Information)
-    msg.setWindowTitle("Column Update Results")
-    msg.setText("The column update process has been completed.")
-    msg.setInformativeText(
-        f"Updated IFC File: {new_filename}\n"
-        f"IFC Columns embedded in walls that were not matched to point cloud data: {num_ifc_emb_columns_no_match}\n"
-        f"{message2}\n"
-        f"IFC Columns (Not Embedded in Walls) that were not matched to point cloud data: {num_unmatched_free_columns}"
-    )
-    msg.setStandardButtons(QMessageBox.Ok)
-    msg.exec_()
-
+    current_model = model
+
+    def read_columns(state):
+        # Process the segmented columns
+        state['pc_columns'] = process_seg_columns(renamed_columns)
+
+    def update_columns(state):
+        # Perform the column check, update and get the results and warnings
+        get_session().model_changed(current_model)
+        state['update_results'] = check_and_update_columns(model=current_model, pc_columns=state['pc_columns'], report=get_match_report())
+
+    def prepare_geometry(state):
+        state['view'] = prepare_view(current_model, state['update_results']['new_filename'])
+
+    def done(state):
+        from PyQt5.QtWidgets import QMessageBox
+        # Extract results from the dictionary returned by check_and_update_columns
+        update_results = state['update_results']
+        new_filename = update_results['new_filename']
+        num_ifc_emb_columns_no_match = update_results['num_ifc_emb_columns_no_match']
+        message2 = update_results['message']
+        num_unmatched_free_columns = update_results['num_unmatched_free_ifc_columns']
+
+        # Show the updated model in the viewer
+        apply_view(state['view'])
+
+        # Display a message box with the results
+        msg = QMessageBox()
+        msg.setIcon(QMessageBox.Information)
+        msg.setWindowTitle("Column Update Results")
+        msg.setText("The column update process has been completed.")
+        msg.setInformativeText(
+            f"Updated IFC File: {new_filename}\n"
+            f"IFC Columns embedded in walls that were not matched to point cloud data: {num_ifc_emb_columns_no_match}\n"
+            f"{message2}\n"
+            f"IFC Columns (Not Embedded in Walls) that were not matched to point cloud data: {num_unmatched_free_columns}"
+        )
+        msg.setStandardButtons(QMessageBox.Ok)
+        msg.exec_()
+
+    start_job("Update columns", update_stages(current_model, [("Reading the segmented columns", read_columns), ("Updating columns and writing the IFC file", update_columns)])
+              + [("Preparing the geometry for the viewer", prepare_geometry)]
+              + glb_stages(current_model, lambda state: state['update_results']['new_filename'])
+              + written_file_stages(lambda state: state['update_results']['new_filename']), done)
 
 
 
 if __name__ == "__main__":
-    # Show initial instructions pop-up message before starting the display, otherwise it only shows when you close the display window
-    from PyQt5.QtWidgets import QMessageBox, QFileDialog
+    # Show initial instructions pop-up message before starting the display, otherwise it only shows when you close the display window.
+    # Only the QApplication is needed for it, init_display reuses it afterwards, so the instructions show up before OCC is even imported
+    import sys
+    from PyQt5.QtWidgets import QApplication, QMessageBox, QFileDialog
+    app = QApplication.instance() or QApplication(sys.argv)
     msg = QMessageBox()
     msg.setIcon(QMessageBox.Information)
     msg.setWindowTitle("Instructions")
@@ -367,9 +774,15 @@ if __name__ == "__main__":
     msg.setStandardButtons(QMessageBox.Ok)
     msg.exec_()
 
+    # Initialize the display
+    from OCC.Display.SimpleGui import init_display
+    display, start_display, add_menu, add_function_to_menu = init_display()
+
     # Add menus and functions as submenus
     add_menu('Open IFC and make STEP')
     add_function_to_menu('Open IFC and make STEP', convert_ifc_to_step_and_load)
+    add_function_to_menu('Open IFC and make STEP', export_model_as_glb)
+    add_function_to_menu('Open IFC and make STEP', undo_last_update)
     add_menu('Point Cloud')
     add_function_to_menu('Point Cloud', load_point_cloud_file)
     add_menu('Walls')
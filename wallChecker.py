@@ -1,11 +1,10 @@
 # This code is part of the Master Thesis of Jean van der Meer presented to the Eindhoven University of Technology
 import ifcopenshell
-import ifcopenshell.geom
 import numpy as np
 import math
 import os
-import pandas as pd
 import glob
+from matchReport import WALL, MATCHED, TO_CREATE, TO_DELETE
 
 
 # here the IFC file of the as-designed project is opened, to be compared with the point clouds,
@@ -37,17 +36,16 @@ import glob
 # a folder 
 
 import glob
-import pandas as pd
 import numpy as np
 import os
 
 def process_seg_walls(files2):
-    data_dict = {}
+    # pandas is only imported where the point clouds are read (see archiveReader.py), so the matching and the report do not pay for importing it
+    from archiveReader import read_segmented_tables
     wall_dict = {}
 
-    for file in files2:
-        # Read the point clouds and store them in data_dict
-        data_dict[file] = pd.read_csv(file, sep=' ', header=None, names=['X', 'Y', 'Z', 'R', 'G', 'B'])
+    # Read the point clouds, from files or from members of zip and tar archives, and store them in data_dict
+    data_dict = read_segmented_tables(files2)
 
     for file, data in data_dict.items():
         x = data['X'].values
@@ -155,52 +153,71 @@ def extrPoints(wall):
 # bottom to top as the point cloud files do.                                                 #            
 ##############################################################################################
 # in Room Mode this 0.22 threshold is higher and is also a dynamic threshold, depending on the thickness of the walls being compared and a minimum value
-def wallMatcher(model, wall_dict):
-    # from inter5 import model
+WALL_MATCH_THRESHOLD = 0.22
+
+
+def walls_match(pc_wall, ifc_points, threshold=WALL_MATCH_THRESHOLD):
+    # whether the base and end point of a point cloud wall are both within the threshold of the start and end point of an IFC wall, or
+    # of its end and start point
+    ifc_start, ifc_end = ifc_points
+
+    def close(point, ifc_point):
+        return (ifc_point[0] - threshold < point[0] < ifc_point[0] + threshold) and (ifc_point[1] - threshold < point[1] < ifc_point[1] + threshold)
+
+    base_point, end_point = pc_wall['base point'], pc_wall['end point']
+    return (close(base_point, ifc_start) and close(end_point, ifc_end)) or (close(base_point, ifc_end) and close(end_point, ifc_start))
+
+
+def match_walls(wall_dict, ifc_walls):
+    # ifc_walls is a list of (GlobalId, (start point, end point)) of the IFC walls, only plain tuples, so the matching can also run in a
+    # worker process (see storeyPartition.py). Returns (point cloud wall, GlobalId) of every match, a point cloud wall can match more than
+    # one IFC wall
+    return [(wall, guid) for wall in wall_dict for guid, points in ifc_walls if walls_match(wall_dict[wall], points)]
+
+
+def record_wall_matches(wall_dict, ifc_wall_guids, matches, report=None):
+    # print and report the outcome of the matching, in the order of the point cloud walls and then of the IFC walls, and return the
+    # lists of matched IFC walls and point cloud walls that wallMatcher returns
     point_cloud_walls_matched = []
     ifc_walls_matched = []
+    matches_of_wall = {}
+    for wall, guid in matches:
+        matches_of_wall.setdefault(wall, []).append(guid)
+    guid_order = {guid: index for index, guid in enumerate(ifc_wall_guids)}
 
     for wall in wall_dict:
-        wall_matched = False
-        for ifc_wall in model.by_type("IfcWallStandardCase"):
-            if (
-                (
-                    (wall_dict[wall]['base point'][0] < (extrPoints(ifc_wall)[0][0] + 0.22) and wall_dict[wall]['base point'][0] > (extrPoints(ifc_wall)[0][0] - 0.22)) and 
-                    (wall_dict[wall]['base point'][1] < (extrPoints(ifc_wall)[0][1] + 0.22) and wall_dict[wall]['base point'][1] > (extrPoints(ifc_wall)[0][1] - 0.22)) and 
-                    (
-                        (wall_dict[wall]['end point'][0] < (extrPoints(ifc_wall)[1][0] + 0.22) and wall_dict[wall]['end point'][0] > (extrPoints(ifc_wall)[1][0] - 0.22)) and 
-                        (wall_dict[wall]['end point'][1] < (extrPoints(ifc_wall)[1][1] + 0.22) and wall_dict[wall]['end point'][1] > (extrPoints(ifc_wall)[1][1] - 0.22))
-                    )
-                ) or 
-                (
-                    (
-                        (wall_dict[wall]['base point'][0] < (extrPoints(ifc_wall)[1][0] + 0.22) and wall_dict[wall]['base point'][0] > (extrPoints(ifc_wall)[1][0] - 0.22)) and 
-                        (wall_dict[wall]['base point'][1] < (extrPoints(ifc_wall)[1][1] + 0.22) and wall_dict[wall]['base point'][1] > (extrPoints(ifc_wall)[1][1] - 0.22)) and 
-                        (
-                            (wall_dict[wall]['end point'][0] < (extrPoints(ifc_wall)[0][0] + 0.22) and wall_dict[wall]['end point'][0] > (extrPoints(ifc_wall)[0][0] - 0.22)) and 
-                            (wall_dict[wall]['end point'][1] < (extrPoints(ifc_wall)[0][1] + 0.22) and wall_dict[wall]['end point'][1] > (extrPoints(ifc_wall)[0][1] - 0.22))
-                        )
-                    )
-                )
-            ):
-                print(f'Wall {wall} at the point cloud has matched wall {ifc_wall.GlobalId} at the IFC file')
-                wall_matched = True
-                point_cloud_walls_matched.append(wall)
-                ifc_walls_matched.append(ifc_wall.GlobalId)
-        
-        if not wall_matched:
+        for guid in sorted(matches_of_wall.get(wall, []), key=guid_order.get):
+            print(f'Wall {wall} at the point cloud has matched wall {guid} at the IFC file')
+            point_cloud_walls_matched.append(wall)
+            ifc_walls_matched.append(guid)
+            if report is not None:
+                report.add(WALL, guid, wall, MATCHED)
+
+        if wall not in matches_of_wall:
             # The walls present in the point cloud (as-is / as-built) that were not matched with the IFC model are
-            # new walls or walls with a new configuration, that needs to be modelled. A report is made, and later in 
+            # new walls or walls with a new configuration, that needs to be modelled. A report is made, and later in
             # the code, they are updated into the IFC file for some of the use cases
             print(f'Wall {wall} at the point cloud did not find a match in the IFC file. It needs to be modeled in the IFC file.')
+            if report is not None:
+                report.add(WALL, None, wall, TO_CREATE)
 
-    for ifc_wall in model.by_type("IfcWallStandardCase"):
-        if ifc_wall.GlobalId not in ifc_walls_matched:
+    matched = set(ifc_walls_matched)
+    for guid in ifc_wall_guids:
+        if guid not in matched:
             # Walls present in the as-designed model, but that are not found in the current building, should be deleted from the IFC project
-            print(f'Wall {ifc_wall.GlobalId} in the IFC file did not find a match in the point cloud. It needs to be deleted from the IFC file.')
+            print(f'Wall {guid} in the IFC file did not find a match in the point cloud. It needs to be deleted from the IFC file.')
+            if report is not None:
+                report.add(WALL, guid, None, TO_DELETE)
     return ifc_walls_matched, point_cloud_walls_matched
 
 
+def wallMatcher(model, wall_dict, report=None):
+    # report is an optional MatchReport (see matchReport.py) where the outcome of the check is recorded for every wall. The start and end
+    # points of every IFC wall are found once, instead of for every pair of walls compared
+    ifc_walls = [(ifc_wall.GlobalId, extrPoints(ifc_wall)) for ifc_wall in model.by_type("IfcWallStandardCase")]
+    return record_wall_matches(wall_dict, [guid for guid, _ in ifc_walls], match_walls(wall_dict, ifc_walls), report=report)
+
+
 ###########################
 # Export results to Excel #
 # Here, an excel file is generated that has as-designed IFC walls, their global ids and names to say which ones 
@@ -209,74 +226,42 @@ def wallMatcher(model, wall_dict):
 # were not present in the IFC file have their global location outputted so a new wall can be drawn automatically,
 # or by a modeller, if necessary, and checked.
 
-def resultsExcel(model, wall_dict, ifc_walls_matched, point_cloud_walls_matched):
-    
-    import openpyxl
-    from openpyxl.styles import PatternFill
-    from openpyxl.utils import get_column_letter
-
-    # Create a new workbook
-    wb = openpyxl.Workbook()
-    ws = wb.active
-
-    # Set column headers
-    ws['A1'] = 'IFC Wall Name'
-    ws['B1'] = 'IFC Wall GUID'
-    ws['C1'] = 'Status'
-
-    # Set column widths
-    ws.column_dimensions['A'].width = 20
-    ws.column_dimensions['B'].width = 40
-    ws.column_dimensions['C'].width = 40
-
-    # Set initial row index
-    row_index = 2
-
-    # Iterate over IFC walls
-    for ifc_wall in model.by_type("IfcWallStandardCase"):
-        if ifc_wall.GlobalId in ifc_walls_matched:
-            # Match found, set status and fill cell with green color for IFC walls that found a match
-            ws.cell(row=row_index, column=1, value=ifc_wall.Name)
-            ws.cell(row=row_index, column=2, value=ifc_wall.GlobalId)
-            ws.cell(row=row_index, column=3, value=f'Matched with {point_cloud_walls_matched[ifc_walls_matched.index(ifc_wall.GlobalId)]}')
-            ws.cell(row=row_index, column=3).fill = PatternFill(start_color="00FF00", end_color="00FF00", fill_type="solid")
-        else:
-            # No match found, set status and fill cell with red color
-            ws.cell(row=row_index, column=1, value=ifc_wall.Name)
-            ws.cell(row=row_index, column=2, value=ifc_wall.GlobalId)
-            ws.cell(row=row_index, column=3, value='No match found, delete wall')
-            ws.cell(row=row_index, column=3).fill = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")
-        
-        row_index += 1
-
-    # Add table of point cloud walls that are matched or not
-    row_index += 2
-    ws.cell(row=row_index, column=1, value='Point Cloud Wall Name')
-    ws.cell(row=row_index, column=2, value='Matched IFC Wall')
-    ws.cell(row=row_index, column=3, value='Coordinates to build new wall, if needed')
-
-    row_index += 1
+def resultsExcel(model, wall_dict, ifc_walls_matched, point_cloud_walls_matched, report_files='wall_matching_results.xlsx'):
+    # report_files can be a single file name or a list of them, the extension of each file picks the format of that report
+    # (.xlsx, .csv, .jsonl or .parquet), see reportWriter.py
+    from reportWriter import open_report_sinks, first_index_lookup, GREEN, RED
 
-    for wall in wall_dict:
-        ws.cell(row=row_index, column=1, value=wall)
-        if wall in point_cloud_walls_matched:
-            ws.cell(row=row_index, column=2, value=ifc_walls_matched[point_cloud_walls_matched.index(wall)])
-        else:
-            ws.cell(row=row_index, column=2, value='No match found')
-            ws.cell(row=row_index, column=2).fill = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")
-        # round start and end point coordinates to limit cell size
-        start_point = [round(coord, 6) for coord in wall_dict[wall]["base point"]]
-        end_point = [round(coord, 6) for coord in wall_dict[wall]["end point"]]
-        ws.cell(row=row_index, column=3, value=f'Start: {start_point}, End: {end_point}')
-        
-        row_index += 1
-
-    # Set number format for coordinate columns
-    for col in ['C']:
-        for row in range(2, row_index):
-            cell = ws[f'{col}{row}']
-            cell.number_format = '0.000000'
-
-    # Save the workbook
-    wb.save('wall_matching_results.xlsx')
+    # lookups of matched walls in both directions are built once, instead of calling list.index() for every row of the report
+    ifc_to_pc = first_index_lookup(ifc_walls_matched, point_cloud_walls_matched)
+    pc_to_ifc = first_index_lookup(point_cloud_walls_matched, ifc_walls_matched)
 
+    # rows are streamed into the report as they are produced, the column widths need to be known before the first row
+    with open_report_sinks(report_files, column_widths={'A': 20, 'B': 40, 'C': 40}) as report:
+        # Set column headers
+        report.write_header(['IFC Wall Name', 'IFC Wall GUID', 'Status'])
+
+        # Iterate over IFC walls
+        for ifc_wall in model.by_type("IfcWallStandardCase"):
+            if ifc_wall.GlobalId in ifc_to_pc:
+                # Match found, set status and fill cell with green color for IFC walls that found a match
+                report.write_row([ifc_wall.Name, ifc_wall.GlobalId, f'Matched with {ifc_to_pc[ifc_wall.GlobalId]}'],
+                                 fills={2: GREEN}, number_formats={2: '0.000000'})
+            else:
+                # No match found, set status and fill cell with red color
+                report.write_row([ifc_wall.Name, ifc_wall.GlobalId, 'No match found, delete wall'],
+                                 fills={2: RED}, number_formats={2: '0.000000'})
+
+        # Add table of point cloud walls that are matched or not
+        report.write_blank(2)
+        report.write_header(['Point Cloud Wall Name', 'Matched IFC Wall', 'Coordinates to build new wall, if needed'])
+
+        for wall in wall_dict:
+            # round start and end point coordinates to limit cell size
+            start_point = [round(coord, 6) for coord in wall_dict[wall]["base point"]]
+            end_point = [round(coord, 6) for coord in wall_dict[wall]["end point"]]
+            if wall in pc_to_ifc:
+                report.write_row([wall, pc_to_ifc[wall], f'Start: {start_point}, End: {end_point}'],
+                                 number_formats={2: '0.000000'})
+            else:
+                report.write_row([wall, 'No match found', f'Start: {start_point}, End: {end_point}'],
+                                 fills={1: RED}, number_formats={2: '0.000000'})
@@ -3,41 +3,61 @@
 # The Room Mode functionality is defined here, to check whether the ifc walls that ought to be checked belong 
 # to the scanned area (that can be checked) or not.
 
+# alphashape, shapely, pandas and matplotlib are imported in the functions that use them, so importing this module (e.g. for the matching
+# in batchUpdater.py, or for extrPoints in wallUpdaTor.py) does not pay for the plotting and hull libraries
 import numpy as np
-import alphashape
-from shapely.geometry import Polygon, Point
-import pandas as pd
 import os
-from scipy.spatial import Delaunay
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d.art3d import Poly3DCollection
 
 # Function to read point cloud from a file and use it to later find the volume that bounds the point cloud
+# The points are returned as LocalPoints (see localPoints.py), float32 around a float64 origin, which take half the memory of a float64 array
 def read_point_cloud2(file_path):
-    points = []
-    with open(file_path, 'r') as f:
-        for line in f:
-            parts = line.split()
-            if len(parts) >= 3:  # Ensure there are at least 3 components
-                # for every split line divide the first 3 values as x, y and z and later assign the tuple of them as a point into a list of points
-                x, y, z = map(float, parts[:3])
-                points.append((x, y, z))
-    return np.array(points)
+    # the file can also be a member of a zip or tar archive, e.g. Data.zip/haus30/room.xyz, it is then read without unpacking the archive,
+    # or a glob of members or files, e.g. Data.zip/haus30/*.xyz, whose points are read as one scan (see scan_files in archiveReader.py)
+    # a .qpc file is read as a quantized point cloud (see quantizedCloud.py)
+    from archiveReader import scan_files
+    from localPoints import LocalPoints
+    return LocalPoints.from_blocks(block for scan_file in scan_files(file_path) for block in point_cloud_blocks(scan_file))
+
+# Function giving the points of one point cloud file as float64 blocks of world coordinates
+def point_cloud_blocks(file_path):
+    import pandas as pd
+    from archiveReader import open_binary
+    from quantizedCloud import QuantizedCloud, is_quantized
+    if is_quantized(file_path):
+        yield from QuantizedCloud(file_path).blocks()
+        return
+    with open_binary(file_path) as f:
+        # the lines are read a million at a time, and for every line the first 3 values are taken as x, y and z. Lines with less than 3
+        # components give NaN and are skipped
+        chunks = pd.read_csv(f, sep=r'\s+', header=None, names=['X', 'Y', 'Z'], usecols=[0, 1, 2], dtype=np.float64, engine='c',
+                             chunksize=1 << 20)
+        for chunk in chunks:
+            yield chunk.dropna().to_numpy()
 
 # Function to downsample the point cloud using voxel grid filtering
 # Some point clouds have a very high point density, which makes computation of the bounding volume of the point cloud slow. The same computation can be 
 # achieved at a lesser density of points, so that is done here.
-def voxel_grid_downsample(points, voxel_size):
-    coords_min = np.min(points, axis=0)
+# origin is the corner of the grid, the lowest point by default; a part of a point cloud downsampled on the grid of the whole cloud keeps the
+# same points as the whole cloud in the voxels it holds completely (see tiledRoomMode.py)
+# points can also be LocalPoints (see localPoints.py), the points kept are returned in world coordinates
+def voxel_grid_downsample(points, voxel_size, origin=None):
+    from localPoints import world_blocks
+    coords_min = np.min(points, axis=0) if origin is None else origin
     coords_max = np.max(points, axis=0)
-    dims = np.ceil((coords_max - coords_min) / voxel_size).astype(int)
-    
-    # Calculate voxel indices
-    indices = np.floor((points - coords_min) / voxel_size).astype(int)
-    
+    dims = np.floor((coords_max - coords_min) / voxel_size).astype(np.int64) + 1
+
+    # Calculate voxel indices, a block of points at a time so LocalPoints are never converted to float64 all at once. The three indices of
+    # a voxel are combined into one number that sorts the voxels in the same order, np.unique is much faster on it than on rows of three
+    # (voxels too small for the size of the cloud to be numbered this way are compared as rows)
+    rows = np.prod(dims.astype(float)) >= 2 ** 62
+    keys = []
+    for block in world_blocks(points):
+        indices = np.floor((block - coords_min) / voxel_size).astype(np.int64)
+        keys.append(indices if rows else (indices[:, 0] * dims[1] + indices[:, 1]) * dims[2] + indices[:, 2])
+
     # Use np.unique to find unique voxel indices and corresponding points
-    _, unique_indices = np.unique(indices, axis=0, return_index=True)
-    
+    _, unique_indices = np.unique(np.concatenate(keys), axis=0 if rows else None, return_index=True)
+
     return points[unique_indices]
 
 # Function to compute the 2D concave hull, buffer it, and extrude it
@@ -53,7 +73,11 @@ def voxel_grid_downsample(points, voxel_size):
 # A buffer is made around the calculated volume, to find wall starting and end points that might have fallen just outside the scanned area due
 # to imprecisions of the scanning process of discrepancies from as-designed and as-built measurements. Alpha is a factor that determines how 
 # small are the concavities that the algorithm should look for when creating a volume that bounds the points
-def compute_2d_concave_hull_and_extrude(points, alpha=1.0, buffer_size=0.4):
+# plot=False skips the plot of the hull, e.g. when the hull is computed in the background and plot_extruded_hull is called afterwards
+# from the thread of the interface, as matplotlib windows can only be opened there
+def compute_2d_concave_hull_and_extrude(points, alpha=1.0, buffer_size=0.4, plot=True):
+    import alphashape
+    from shapely.geometry import Polygon
     # Project points onto the XY plane (flatten the Z coordinate)
     voxel_size = 0.5
     points = voxel_grid_downsample(points, voxel_size)
@@ -66,11 +90,24 @@ def compute_2d_concave_hull_and_extrude(points, alpha=1.0, buffer_size=0.4):
     
     # Apply buffer to the hull 
     expanded_hull_polygon = hull_polygon.buffer(buffer_size)
-    expanded_hull_points = np.array(expanded_hull_polygon.exterior.coords)
     
-    # Get the Z range for extrusion
+    if plot:
+        z_min, z_max = hull_z_range(points)
+        plot_extruded_hull(expanded_hull_polygon, z_min, z_max)
+
+    return expanded_hull_polygon
+
+# Function to get the Z range for extrusion of the hull
+def hull_z_range(points):
     z_min = np.min(points[:, 2]) - 0.3 # make sure that the base points of walls are checked even if the scan is a bit higher than the ifc floor
     z_max = np.max(points[:, 2]) - 0.3 # make sure that the walls of the next floor are not considered as belonging to the scanned floor
+    return z_min, z_max
+
+# Function to plot the 3D extruded concave hull
+def plot_extruded_hull(expanded_hull_polygon, z_min, z_max):
+    import matplotlib.pyplot as plt
+    from mpl_toolkits.mplot3d.art3d import Poly3DCollection
+    expanded_hull_points = np.array(expanded_hull_polygon.exterior.coords)
 
     # Plot the 3D extruded concave hull
     fig = plt.figure()
@@ -100,10 +137,9 @@ def compute_2d_concave_hull_and_extrude(points, alpha=1.0, buffer_size=0.4):
     # visualize bounding hull
     plt.show()
 
-    return expanded_hull_polygon
-
 # Function to check if a point is within the alpha hull
 def is_within_alpha_hull(point, alpha_hull_polygon, buffer_size=0.55):
+    from shapely.geometry import Point
     point_3d = Point(point[:3])
     buffered_polygon = alpha_hull_polygon.buffer(buffer_size)
     return buffered_polygon.contains(point_3d)
@@ -147,12 +183,11 @@ def extrPoints(wall):
 
 # Function to process walls in Room Mode
 def process_seg_wallsRM(files2):
-    data_dict = {}
+    from archiveReader import read_segmented_tables
     wall_dict = {}
 
-    for file in files2:
-        # Read the point clouds and store them in data_dict
-        data_dict[file] = pd.read_csv(file, sep=' ', header=None, names=['X', 'Y', 'Z', 'R', 'G', 'B'])
+    # Read the point clouds, from files or from members of zip and tar archives, and store them in data_dict
+    data_dict = read_segmented_tables(files2)
 
     for file, data in data_dict.items():
         x = data['X'].values
@@ -197,63 +232,78 @@ def process_seg_wallsRM(files2):
 
     return wall_dict
 
-# Function to match walls in Room Mode
-def wallMatcherRM(model, wall_dict, alpha_hull, buffer_size=0.55):
-    point_cloud_walls_matched = []
-    ifc_walls_matched = []
-    ifc_walls_to_delete = []
-
-    for wall in wall_dict:
-        wall_matched = False
-        for ifc_wall in model.by_type("IfcWallStandardCase"):
-            if ifc_wall.Representation.Representations[1].Items[0].SweptArea.is_a('IfcRectangleProfileDef'):
-                start_point, end_point = extrPoints(ifc_wall)
-                # Here a dynamic threshold is created and used to match IFC and point cloud walls. Because the distance between the start point of a wall
-                # in an IFC file and the start point of the same wall in a point cloud can be quite considerable, taken deviations of measeurement, as-designed
-                # vs as-built differences, and differences in how wall connections and starting points are defined (discussed in the report), this distance
-                # can be of around a metre or even a bit more for walls that are 70 cm thick, for instance. It would not be realistic to use a thresholf of
-                # more than 70 cm for 10cm thick walls however, so a minimum threshold is defined, that is used for most thin walls, and a threshold
-                # proportional to wall thickness is used for walls that are very thick. To save space the threshold is named dth (Dynamic ThresHold).
-                
-                ifc_wall_dim_y = ifc_wall.Representation.Representations[1].Items[0].SweptArea.YDim
-                dth = max(0.65, 2.5*ifc_wall_dim_y)
-                # The big OR conditional below defines whether walls are matched start to start and end to end OR start to end and end to start, because
-                # IFC can structure the global coordinates of their wall starts and ends in a counterintuitive direction, which is converted in IFC
-                # by a Reference Direction. Because point clouds always work in the same coordinate system we need to check for both possibilities though
-                # to make sure a match is fully checked
-                if is_within_alpha_hull(start_point, alpha_hull, buffer_size) and is_within_alpha_hull(end_point, alpha_hull, buffer_size):
-                    if (
-                        (
-                            (wall_dict[wall]['base point'][0] < (start_point[0] + dth) and wall_dict[wall]['base point'][0] > (start_point[0] - dth)) and 
-                            (wall_dict[wall]['base point'][1] < (start_point[1] + dth) and wall_dict[wall]['base point'][1] > (start_point[1] - dth)) and 
-                            (wall_dict[wall]['end point'][0] < (end_point[0] + dth) and wall_dict[wall]['end point'][0] > (end_point[0] - dth)) and 
-                            (wall_dict[wall]['end point'][1] < (end_point[1] + dth) and wall_dict[wall]['end point'][1] > (end_point[1] - dth))
-                        ) or 
-                        (
-                            (wall_dict[wall]['base point'][0] < (end_point[0] + dth) and wall_dict[wall]['base point'][0] > (end_point[0] - dth)) and 
-                            (wall_dict[wall]['base point'][1] < (end_point[1] + dth) and wall_dict[wall]['base point'][1] > (end_point[1] - dth)) and 
-                            (wall_dict[wall]['end point'][0] < (start_point[0] + dth) and wall_dict[wall]['end point'][0] > (start_point[0] - dth)) and 
-                            (wall_dict[wall]['end point'][1] < (start_point[1] + dth) and wall_dict[wall]['end point'][1] > (start_point[1] - dth))
-                        )
-                    ):
-                        print(f'Wall {wall} at the point cloud has matched wall {ifc_wall.GlobalId} at the IFC file')
-                        wall_matched = True
-                        point_cloud_walls_matched.append(wall)
-                        ifc_walls_matched.append(ifc_wall.GlobalId)
-        if not wall_matched:
-            print(f'Wall {wall} at the point cloud did not find a match in the IFC file. It needs to be modeled in the IFC file.')
-                    
-
+# Function to find the IFC walls of the scanned area, the ones whose start and end points are both within the alpha hull buffered by
+# buffer_size. Returns the GlobalIds of those walls, in the order of the model, and (GlobalId, start point, end point, dynamic threshold)
+# of the ones among them that can be matched, those with a rectangular profile. The hull is buffered and prepared once, instead of for
+# every point that is tested
+def scanned_ifc_walls(model, alpha_hull, buffer_size=0.55):
+    from shapely.geometry import Point
+    from shapely.prepared import prep
+    scanned_area = prep(alpha_hull.buffer(buffer_size))
+    in_scope = []
+    matchable = []
     for ifc_wall in model.by_type("IfcWallStandardCase"):
         start_point, end_point = extrPoints(ifc_wall)
-        if is_within_alpha_hull(start_point, alpha_hull, buffer_size) and is_within_alpha_hull(end_point, alpha_hull, buffer_size):
-            if ifc_wall.GlobalId not in ifc_walls_matched:
-                print(f'Wall {ifc_wall.GlobalId} in the IFC file did not find a match in the point cloud. It needs to be deleted from the IFC file.')
-                ifc_walls_to_delete.append(ifc_wall.GlobalId)
+        if not (scanned_area.contains(Point(start_point[:2])) and scanned_area.contains(Point(end_point[:2]))):
+            continue
+        in_scope.append(ifc_wall.GlobalId)
+        if ifc_wall.Representation.Representations[1].Items[0].SweptArea.is_a('IfcRectangleProfileDef'):
+            # Here a dynamic threshold is created and used to match IFC and point cloud walls. Because the distance between the start point of a wall
+            # in an IFC file and the start point of the same wall in a point cloud can be quite considerable, taken deviations of measeurement, as-designed
+            # vs as-built differences, and differences in how wall connections and starting points are defined (discussed in the report), this distance
+            # can be of around a metre or even a bit more for walls that are 70 cm thick, for instance. It would not be realistic to use a thresholf of
+            # more than 70 cm for 10cm thick walls however, so a minimum threshold is defined, that is used for most thin walls, and a threshold
+            # proportional to wall thickness is used for walls that are very thick. To save space the threshold is named dth (Dynamic ThresHold).
+            ifc_wall_dim_y = ifc_wall.Representation.Representations[1].Items[0].SweptArea.YDim
+            dth = max(0.65, 2.5*ifc_wall_dim_y)
+            matchable.append((ifc_wall.GlobalId, start_point, end_point, dth))
+    return in_scope, matchable
+
+# Function to match point cloud walls to the IFC walls of scanned_ifc_walls, only on tuples, so it can also run in a worker process (see
+# tiledRoomMode.py). Returns (point cloud wall, GlobalId) of every match
+def match_walls_rm(wall_dict, ifc_walls):
+    matches = []
+    for wall in wall_dict:
+        for guid, start_point, end_point, dth in ifc_walls:
+            # The big OR conditional below defines whether walls are matched start to start and end to end OR start to end and end to start, because
+            # IFC can structure the global coordinates of their wall starts and ends in a counterintuitive direction, which is converted in IFC
+            # by a Reference Direction. Because point clouds always work in the same coordinate system we need to check for both possibilities though
+            # to make sure a match is fully checked
+            if (
+                (
+                    (wall_dict[wall]['base point'][0] < (start_point[0] + dth) and wall_dict[wall]['base point'][0] > (start_point[0] - dth)) and
+                    (wall_dict[wall]['base point'][1] < (start_point[1] + dth) and wall_dict[wall]['base point'][1] > (start_point[1] - dth)) and
+                    (wall_dict[wall]['end point'][0] < (end_point[0] + dth) and wall_dict[wall]['end point'][0] > (end_point[0] - dth)) and
+                    (wall_dict[wall]['end point'][1] < (end_point[1] + dth) and wall_dict[wall]['end point'][1] > (end_point[1] - dth))
+                ) or
+                (
+                    (wall_dict[wall]['base point'][0] < (end_point[0] + dth) and wall_dict[wall]['base point'][0] > (end_point[0] - dth)) and
+                    (wall_dict[wall]['base point'][1] < (end_point[1] + dth) and wall_dict[wall]['base point'][1] > (end_point[1] - dth)) and
+                    (wall_dict[wall]['end point'][0] < (start_point[0] + dth) and wall_dict[wall]['end point'][0] > (start_point[0] - dth)) and
+                    (wall_dict[wall]['end point'][1] < (start_point[1] + dth) and wall_dict[wall]['end point'][1] > (start_point[1] - dth))
+                )
+            ):
+                matches.append((wall, guid))
+    return matches
+
+# Function to print and report the matches of match_walls_rm, and find the IFC walls to delete
+def record_wall_matches_rm(wall_dict, in_scope, matches, report=None):
+    from wallChecker import record_wall_matches
+    # the outcome is printed and reported as outside Room Mode, but only the IFC walls of the scanned area are reported to be deleted
+    ifc_walls_matched, point_cloud_walls_matched = record_wall_matches(wall_dict, in_scope, matches, report=report)
+    matched = set(ifc_walls_matched)
     # here a direct list of walls to be deleted is created, as only walls that are not checked withing the scanned area should be removed,
     # instead of walls of the entire model that don't find a match with point cloud data
+    ifc_walls_to_delete = [guid for guid in in_scope if guid not in matched]
     return ifc_walls_matched, point_cloud_walls_matched, ifc_walls_to_delete
 
+# Function to match walls in Room Mode
+def wallMatcherRM(model, wall_dict, alpha_hull, buffer_size=0.55, report=None):
+    # report is an optional MatchReport (see matchReport.py) where the outcome of the check is recorded for every wall. Only the IFC walls
+    # within the scanned area (the alpha hull) are checked against the point cloud walls
+    in_scope, matchable = scanned_ifc_walls(model, alpha_hull, buffer_size)
+    return record_wall_matches_rm(wall_dict, in_scope, match_walls_rm(wall_dict, matchable), report=report)
+
 
 
 ###########################
@@ -264,78 +314,45 @@ def wallMatcherRM(model, wall_dict, alpha_hull, buffer_size=0.55):
 # were not present in the IFC file have their global location outputted so a new wall can be drawn automatically
 # or by a modeller, if necessary, and checked.
 
-def resultsExcel(model, wall_dict, ifc_walls_matched, point_cloud_walls_matched, alpha_hull, buffer_size=0.55):
-    # from inter5 import model
-    import openpyxl
-    from openpyxl.styles import PatternFill
-    from openpyxl.utils import get_column_letter
-
-    # Create a new workbook
-    wb = openpyxl.Workbook()
-    ws = wb.active
-
-    # Set column headers
-    ws['A1'] = 'IFC Wall Name'
-    ws['B1'] = 'IFC Wall GUID'
-    ws['C1'] = 'Status'
+def resultsExcel(model, wall_dict, ifc_walls_matched, point_cloud_walls_matched, alpha_hull, buffer_size=0.55, report_files='wall_matching_results.xlsx'):
+    # report_files can be a single file name or a list of them, the extension of each file picks the format of that report
+    # (.xlsx, .csv, .jsonl or .parquet), see reportWriter.py
+    from reportWriter import open_report_sinks, first_index_lookup, GREEN, RED
 
-    # Set column widths
-    ws.column_dimensions['A'].width = 20
-    ws.column_dimensions['B'].width = 40
-    ws.column_dimensions['C'].width = 40
+    # lookups of matched walls in both directions are built once, instead of calling list.index() for every row of the report
+    ifc_to_pc = first_index_lookup(ifc_walls_matched, point_cloud_walls_matched)
+    pc_to_ifc = first_index_lookup(point_cloud_walls_matched, ifc_walls_matched)
 
-    # Set initial row index
-    row_index = 2
+    # rows are streamed into the report as they are produced, the column widths need to be known before the first row
+    with open_report_sinks(report_files, column_widths={'A': 20, 'B': 40, 'C': 40}) as report:
+        # Set column headers
+        report.write_header(['IFC Wall Name', 'IFC Wall GUID', 'Status'])
 
-    # Iterate over IFC walls
-    for ifc_wall in model.by_type("IfcWallStandardCase"):
-        if ifc_wall.Representation.Representations[1].Items[0].SweptArea.is_a('IfcRectangleProfileDef'):
+        # Iterate over IFC walls
+        for ifc_wall in model.by_type("IfcWallStandardCase"):
+            if ifc_wall.Representation.Representations[1].Items[0].SweptArea.is_a('IfcRectangleProfileDef'):
                 start_point, end_point = extrPoints(ifc_wall)
                 # only walls within the alpha hull should be marked as not checked, so the test is done again
                 if is_within_alpha_hull(start_point, alpha_hull, buffer_size) and is_within_alpha_hull(end_point, alpha_hull, buffer_size):
-
-                    if ifc_wall.GlobalId in ifc_walls_matched:
+                    if ifc_wall.GlobalId in ifc_to_pc:
                         # Match found, set status and fill cell with green color for IFC walls that found a match
-                        ws.cell(row=row_index, column=1, value=ifc_wall.Name)
-                        ws.cell(row=row_index, column=2, value=ifc_wall.GlobalId)
-                        ws.cell(row=row_index, column=3, value=f'Matched with {point_cloud_walls_matched[ifc_walls_matched.index(ifc_wall.GlobalId)]}')
-                        ws.cell(row=row_index, column=3).fill = PatternFill(start_color="00FF00", end_color="00FF00", fill_type="solid")
+                        report.write_row([ifc_wall.Name, ifc_wall.GlobalId, f'Matched with {ifc_to_pc[ifc_wall.GlobalId]}'],
+                                         fills={2: GREEN}, number_formats={2: '0.000000'})
                     else:
                         # No match found, set status and fill cell with red color
-                        ws.cell(row=row_index, column=1, value=ifc_wall.Name)
-                        ws.cell(row=row_index, column=2, value=ifc_wall.GlobalId)
-                        ws.cell(row=row_index, column=3, value='No match found, delete wall')
-                        ws.cell(row=row_index, column=3).fill = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")
-                    
-                    row_index += 1
-
-    # Add table of point cloud walls that are matched or not
-    row_index += 2
-    ws.cell(row=row_index, column=1, value='Point Cloud Wall Name')
-    ws.cell(row=row_index, column=2, value='Matched IFC Wall')
-    ws.cell(row=row_index, column=3, value='Coordinates to build new wall, if needed')
-
-    row_index += 1
-
-    for wall in wall_dict:
-        ws.cell(row=row_index, column=1, value=wall)
-        if wall in point_cloud_walls_matched:
-            ws.cell(row=row_index, column=2, value=ifc_walls_matched[point_cloud_walls_matched.index(wall)])
-        else:
-            ws.cell(row=row_index, column=2, value='No match found')
-            ws.cell(row=row_index, column=2).fill = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")
-        start_point = [round(coord, 6) for coord in wall_dict[wall]["base point"]]
-        end_point = [round(coord, 6) for coord in wall_dict[wall]["end point"]]
-        ws.cell(row=row_index, column=3, value=f'Start: {start_point}, End: {end_point}')
-        
-        row_index += 1
-
-    # Set number format for coordinate columns
-    for col in ['C']:
-        for row in range(2, row_index):
-            cell = ws[f'{col}{row}']
-            cell.number_format = '0.000000'
-
-    # Save the workbook
-    wb.save('wall_matching_results.xlsx')
-
+                        report.write_row([ifc_wall.Name, ifc_wall.GlobalId, 'No match found, delete wall'],
+                                         fills={2: RED}, number_formats={2: '0.000000'})
+
+        # Add table of point cloud walls that are matched or not
+        report.write_blank(2)
+        report.write_header(['Point Cloud Wall Name', 'Matched IFC Wall', 'Coordinates to build new wall, if needed'])
+
+        for wall in wall_dict:
+            start_point = [round(coord, 6) for coord in wall_dict[wall]["base point"]]
+            end_point = [round(coord, 6) for coord in wall_dict[wall]["end point"]]
+            if wall in pc_to_ifc:
+                report.write_row([wall, pc_to_ifc[wall], f'Start: {start_point}, End: {end_point}'],
+                                 number_formats={2: '0.000000'})
+            else:
+                report.write_row([wall, 'No match found', f'Start: {start_point}, End: {end_point}'],
+                                 fills={1: RED}, number_formats={2: '0.000000'})
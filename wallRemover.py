@@ -1,16 +1,16 @@
 # This code is part of the Master Thesis of Jean van der Meer presented to the Eindhoven University of Technology
 import ifcopenshell
-import pandas as pd
 import numpy as np
 import os as os
 import ifcopenshell.api
+from matchReport import WALL, DELETED
 
 # Here the deletion of non matched IFC walls is handled for the case where the entire building is scanned. If the entire building was scanned
 # then all walls in the model that are not in the list ifc_walls_matched can be deleted, which is done here. In Room Mode, where only a specific
 # section of the building is scanned, a unique list of walls to be deleted is produced at the wall matching step, and this list is used at that
 # version of the wall deleter function.
 
-def wallDeleter(model, ifc_walls_matched):
+def wallDeleter(model, ifc_walls_matched, report=None):
     for wall in model.by_type("IfcWallStandardCase"):
         # we want to delete all IfcWalls that did not find a match with a point cloud wall
         if wall.GlobalId not in ifc_walls_matched:
@@ -26,5 +26,8 @@ def wallDeleter(model, ifc_walls_matched):
     for wall in model.by_type("IfcWallStandardCase"):
         # after deleting the decompositions the walls without a match can be deleted
         if wall.GlobalId not in ifc_walls_matched:
+            wall_guid = wall.GlobalId
             ifcopenshell.api.run("root.remove_product", model, product=wall)
+            if report is not None:
+                report.add(WALL, wall_guid, None, DELETED)
             
\ No newline at end of file
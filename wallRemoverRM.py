@@ -1,12 +1,12 @@
 # This code is part of the Master Thesis of Jean van der Meer presented to the Eindhoven University of Technology
 import ifcopenshell
-import pandas as pd
 import numpy as np
 import os as os
 import ifcopenshell.util.element
 import ifcopenshell.api
+from matchReport import WALL, DELETED
 
-def wallDeleterRM(model, ifc_walls_to_delete):
+def wallDeleterRM(model, ifc_walls_to_delete, report=None):
     #First, remove all decompositions of the walls
     for wall_id in ifc_walls_to_delete:
         wall = model.by_id(wall_id)
@@ -30,6 +30,8 @@ def wallDeleterRM(model, ifc_walls_to_delete):
             try:
                 ifcopenshell.api.run("root.remove_product", model, product=wall)
                 print(f"Removed wall: {wall}")
+                if report is not None:
+                    report.add(WALL, wall_id, None, DELETED)
             except Exception as e:
                 print(f"Error removing wall {wall_id}: {e}")
 
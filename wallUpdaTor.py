@@ -3,11 +3,13 @@ import uuid
 from datetime import datetime
 import numpy as np
 import ifcopenshell.util.element
+from matchReport import WALL, CREATED
 
 
 
 
-def wallCreaTor(model, wall_dict, ifc_walls_matched, point_cloud_walls_matched):
+def wallCreaTor(model, wall_dict, ifc_walls_matched, point_cloud_walls_matched, report=None, write_file=True):
+    # report is an optional MatchReport (see matchReport.py) where every wall created from point cloud data is recorded
     import math
     from wallCheckerRM import extrPoints
     import ifcopenshell
@@ -35,6 +37,8 @@ def wallCreaTor(model, wall_dict, ifc_walls_matched, point_cloud_walls_matched):
     # Create list for the new walls that will be added into the model, to keep track of which walls in the
     # model were pre-existing and which ones are new
     new_walls = []
+    # point cloud wall each new wall was created from, for the report
+    new_wall_sources = {}
 
     # Iterate over point cloud walls
     for wall_name, wall_properties in wall_dict.items():
@@ -435,6 +439,7 @@ def wallCreaTor(model, wall_dict, ifc_walls_matched, point_cloud_walls_matched):
             # it is important to add connections only after all new walls are created because some connections
             # might be with new walls that otherwise did not exist yet at the time of the iteration
             new_walls.append(new_wall)
+            new_wall_sources[new_wall.GlobalId] = wall_name
     
     
 
@@ -1085,6 +1090,19 @@ def wallCreaTor(model, wall_dict, ifc_walls_matched, point_cloud_walls_matched):
         else:
             print("No existing wall found.")
 
+    if report is not None:
+        # the deltas are how much the start of the new wall was moved from the point cloud wall when its connections were refined
+        for new_wall in new_walls:
+            wall_name = new_wall_sources[new_wall.GlobalId]
+            new_wall_start = extrPoints(new_wall)[0]
+            base_point = wall_dict[wall_name]['base point']
+            report.add(WALL, new_wall.GlobalId, wall_name, CREATED, deltas=(new_wall_start[0] - base_point[0], new_wall_start[1] - base_point[1], 0.0))
+
+    # with write_file=False the model is only changed in memory and None is returned, for when more updates follow before the model is
+    # written (see updatePipeline.py)
+    if not write_file:
+        return None
+
     from datetime import datetime
     import ifcopenshell
     current_datetime = datetime.now()
@@ -1096,8 +1114,10 @@ def wallCreaTor(model, wall_dict, ifc_walls_matched, point_cloud_walls_matched):
     # If you want to use a specific name or modify it, you can do so here
     new_filename = f"modified_ifc_file_{formatted_datetime}.ifc"
     
-    # Write the modified IFC file with the new filename
-    model.write(new_filename)
+    # Write the modified IFC file with the new filename, in the background (see ifcWriter.py). The handle returned can be used as the
+    # file name, ifcWriter.wait_for_file waits until the file is complete
+    from ifcWriter import write_in_background
+    new_filename = write_in_background(model, new_filename)
     
     # Return the new filename
     return new_filename       